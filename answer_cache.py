@@ -0,0 +1,141 @@
+# app/answer_cache.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+# A query whose embedding is at least this cosine-similar to a cached one
+# reuses its answer. MiniLM puts rephrasings of one question around 0.9+.
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+# Touched whenever an index is (re)loaded, so caches in other processes
+# (e.g. the app while load_data.py runs) notice and drop stale answers.
+INDEX_STAMP_DIR = os.getenv("INDEX_STAMP_DIR", ".index_stamps")
+
+
+def _stamp_path(backend: str, index_name: str) -> str:
+    return os.path.join(INDEX_STAMP_DIR, f"{backend.lower()}-{index_name}")
+
+
+def read_index_stamp(backend: str, index_name: str) -> int:
+    try:
+        return os.stat(_stamp_path(backend, index_name)).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def mark_index_updated(backend: str, index_name: str):
+    """Record that an index's contents changed; invalidates its answer caches."""
+    os.makedirs(INDEX_STAMP_DIR, exist_ok=True)
+    with open(_stamp_path(backend, index_name), "w", encoding="utf-8") as f:
+        f.write(str(time.time()))
+    with _caches_lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        if cache.backend.lower() == backend.lower() and cache.index_name == index_name:
+            cache.clear()
+
+
+class SemanticAnswerCache:
+    """
+    Answers keyed by normalised query embedding. A lookup hits when a live
+    entry is at least `threshold` cosine-similar to the query; entries expire
+    after `ttl_seconds` and the least recently used one is evicted beyond
+    `max_items`. Each entry remembers how long the answer took to compute,
+    which is credited as saved latency on every hit.
+    """
+
+    def __init__(
+        self,
+        backend: str,
+        index_name: str,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+        max_items: int = ANSWER_CACHE_SIZE,
+    ):
+        self.backend = backend
+        self.index_name = index_name
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_items = max_items
+        # key -> (normalised vector, value, created_at, compute_seconds)
+        self._entries: "OrderedDict[int, Tuple[np.ndarray, Any, float, float]]" = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self._stamp = read_index_stamp(backend, index_name)
+        self._stats = {"lookups": 0, "hits": 0, "saved_seconds": 0.0, "invalidations": 0}
+
+    def _check_stamp(self):
+        stamp = read_index_stamp(self.backend, self.index_name)
+        if stamp != self._stamp:
+            self._stamp = stamp
+            self._entries.clear()
+            self._stats["invalidations"] += 1
+
+    def _expire(self, now: float):
+        for key in [k for k, e in self._entries.items() if now - e[2] > self.ttl_seconds]:
+            del self._entries[key]
+
+    def get(self, vector) -> Optional[Any]:
+        """Cached value for the closest stored query above the threshold, else None."""
+        q = np.asarray(vector, dtype=np.float32).reshape(-1)
+        q = q / max(float(np.linalg.norm(q)), 1e-12)
+        with self._lock:
+            self._stats["lookups"] += 1
+            self._check_stamp()
+            self._expire(time.monotonic())
+            if not self._entries:
+                return None
+            keys = list(self._entries)
+            scores = np.stack([self._entries[k][0] for k in keys]) @ q
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            key = keys[best]
+            self._entries.move_to_end(key)
+            _, value, _, compute_seconds = self._entries[key]
+            self._stats["hits"] += 1
+            self._stats["saved_seconds"] += compute_seconds
+            return value
+
+    def put(self, vector, value: Any, compute_seconds: float = 0.0):
+        q = np.asarray(vector, dtype=np.float32).reshape(-1)
+        q = q / max(float(np.linalg.norm(q)), 1e-12)
+        with self._lock:
+            self._check_stamp()
+            self._entries[self._next_key] = (q, value, time.monotonic(), compute_seconds)
+            self._next_key += 1
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stamp = read_index_stamp(self.backend, self.index_name)
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._stats["lookups"]
+            return {
+                **self._stats,
+                "size": len(self._entries),
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            }
+
+
+_caches: Dict[str, SemanticAnswerCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_answer_cache(bot_key: str, backend: str, index_name: str) -> SemanticAnswerCache:
+    """The process-wide answer cache of one bot, shared by every session."""
+    with _caches_lock:
+        cache = _caches.get(bot_key)
+        if cache is None or (cache.backend, cache.index_name) != (backend, index_name):
+            cache = _caches[bot_key] = SemanticAnswerCache(backend, index_name)
+        return cache
@@ -0,0 +1,114 @@
+# app/api.py
+"""
+HTTP API over the query engine, so answering does not depend on Streamlit
+script reruns and any number of clients can share one model and one set of
+index connections.
+
+    uvicorn api:app --host 0.0.0.0 --port 8000
+    python api.py
+
+Endpoints:
+    GET  /health
+    GET  /bots
+    POST /query          {"bot", "query", "all_bots": false, "refine": true} -> final result
+    POST /query/stream   same body -> application/x-ndjson engine events (see engine.py)
+    GET  /stats/{bot}    answer cache counters and stage latency percentiles
+
+Blocking stages run on a pool of API_WORKERS threads; at most
+API_MAX_CONCURRENT_QUERIES queries are in flight, later ones wait their turn.
+"""
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+import embedding
+from engine import get_query_engine
+from rerank import RERANK_ENABLED, get_reranker
+
+API_WORKERS = int(os.getenv("API_WORKERS", "16"))
+API_MAX_CONCURRENT_QUERIES = int(os.getenv("API_MAX_CONCURRENT_QUERIES", "64"))
+
+
+class QueryRequest(BaseModel):
+    bot: str
+    query: str
+    all_bots: bool = False
+    refine: bool = True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=API_WORKERS, thread_name_prefix="engine")
+    )
+    app.state.slots = asyncio.Semaphore(API_MAX_CONCURRENT_QUERIES)
+    if os.getenv("WARM_UP_MODEL", "1") != "0":
+        threading.Thread(target=embedding.warm_up, name="embedding-warm-up", daemon=True).start()
+        if RERANK_ENABLED:
+            get_reranker(wait=False)
+    yield
+
+
+app = FastAPI(title="Multi-Chatbot Query API", lifespan=lifespan)
+
+
+def _check(request: QueryRequest):
+    if request.bot not in get_query_engine().bots:
+        raise HTTPException(status_code=404, detail=f"Unknown bot: {request.bot}")
+    if not request.query.strip():
+        raise HTTPException(status_code=422, detail="Empty query")
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/bots")
+async def bots():
+    return {
+        key: {"display_name": b["display_name"], "db_type": b["db_type"], "index_name": b["index_name"]}
+        for key, b in get_query_engine().bots.items()
+    }
+
+
+@app.post("/query")
+async def query(request: QueryRequest):
+    _check(request)
+    async with app.state.slots:
+        return await get_query_engine().answer(request.bot, request.query, request.all_bots, request.refine)
+
+
+@app.post("/query/stream")
+async def query_stream(request: QueryRequest):
+    _check(request)
+
+    async def lines():
+        async with app.state.slots:
+            async for event in get_query_engine().events(request.bot, request.query, request.all_bots, request.refine):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/stats/{bot}")
+async def stats(bot: str):
+    if bot not in get_query_engine().bots:
+        raise HTTPException(status_code=404, detail=f"Unknown bot: {bot}")
+    return get_query_engine().stats(bot)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=os.getenv("API_HOST", "127.0.0.1"), port=int(os.getenv("API_PORT", "8000")))
@@ -0,0 +1,47 @@
+# app/api_client.py
+import json
+import os
+import urllib.parse
+import urllib.request
+from typing import Dict, Iterator
+
+# Base URL of a running api.py; when unset the app answers in-process.
+QUERY_API_URL = os.getenv("QUERY_API_URL", "").rstrip("/")
+QUERY_API_TIMEOUT = float(os.getenv("QUERY_API_TIMEOUT", "120"))
+
+
+class QueryAPIClient:
+    """Client for api.py with the query_events/stats interface of engine.QueryEngine."""
+
+    def __init__(self, base_url: str = QUERY_API_URL, timeout: float = QUERY_API_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _open(self, path: str, body: Dict = None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=data,
+            headers={"Content-Type": "application/json"} if data else {},
+        )
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def query_events(self, bot_key: str, query: str, all_bots: bool = False, refine: bool = True) -> Iterator[Dict]:
+        """Stream the engine events of one query from /query/stream."""
+        body = {"bot": bot_key, "query": query, "all_bots": all_bots, "refine": refine}
+        with self._open("/query/stream", body) as response:
+            for line in response:
+                if line.strip():
+                    yield json.loads(line)
+
+    def stats(self, bot_key: str) -> Dict:
+        with self._open(f"/stats/{urllib.parse.quote(bot_key)}") as response:
+            return json.load(response)
+
+
+def get_query_client():
+    """A QueryAPIClient when QUERY_API_URL is set, otherwise the in-process engine."""
+    if QUERY_API_URL:
+        return QueryAPIClient()
+    from engine import get_query_engine
+    return get_query_engine()
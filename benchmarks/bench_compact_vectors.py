@@ -0,0 +1,193 @@
+# app/benchmarks/bench_compact_vectors.py
+"""
+Memory footprint and recall@k of the local index's vector storages
+(connectors/local_index.py): the float32 scan, float16 and product-quantised
+codes, each with and without re-scoring a short list in full precision.
+
+The corpus is the bundled data/*.json, chunked and embedded like the loader
+does, plus --scale synthetic documents drawn from it (0 = bundled only).
+Recall@k is the share of returned hits scoring at least the exact k-th best
+score (ties between duplicate passages count as found). The fake encoder
+gives unrelated random vectors, the hardest case for quantisation;
+--real-model embeds with MiniLM. Memory is measured in a fresh process per
+storage as the RSS added by opening the index and running the queries, split
+into anonymous memory and memory-mapped file pages (the float32 rows read
+for re-scoring), which the kernel can evict.
+
+    python -m benchmarks.bench_compact_vectors --scale 50000 --k 10
+    python -m benchmarks.bench_compact_vectors --scale 0 --real-model
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.common import REPO_ROOT, load_corpora, rss_mb, synthetic_corpus
+
+# Compact codes serve the brute-force scan, so keep the index off HNSW.
+NO_HNSW = 1 << 62
+CONFIGS = [
+    ("float32", 0),
+    ("float16", 0),
+    ("float16", 100),
+    ("pq", 0),
+    ("pq", 50),
+    ("pq", 100),
+    ("pq", 200),
+]
+
+
+def corpus(scale, seed):
+    docs = [doc for docs in load_corpora().values() for doc in docs]
+    return docs + list(synthetic_corpus(scale, seed=seed)) if scale else docs
+
+
+def build_index(path, docs, batch_size=512):
+    from chunking import chunk_document
+    from connectors.local_index import LocalVectorIndex
+    from embedding import embed_array
+    from ingest import document_vectors
+
+    index = LocalVectorIndex(path, storage="float32", hnsw_threshold=NO_HNSW)
+    for start in range(0, len(docs), batch_size):
+        batch = docs[start:start + batch_size]
+        chunks = [chunk_document(d) for d in batch]
+        embeddings = embed_array([c["text"] for doc_chunks in chunks for c in doc_chunks])
+        index.upsert([v for _, vectors in document_vectors(batch, chunks, embeddings) for v in vectors])
+    return len(index)
+
+
+def make_queries(docs, n, seed):
+    from embedding import embed_array
+
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(n):
+        doc = rng.choice(docs)
+        texts.append(doc["title"] if rng.random() < 0.5 else rng.choice(doc["text"].split(". ")))
+    return embed_array(texts)
+
+
+def evaluate(path, queries, k, storage, rescore):
+    """(recall@k against the float32 scan, p50 query ms, bytes scanned) of one configuration."""
+    from connectors.local_index import LocalVectorIndex
+
+    exact_index = LocalVectorIndex(path, storage="float32", hnsw_threshold=NO_HNSW)
+    index = LocalVectorIndex(
+        path, storage=storage, rescore_candidates=rescore, pq_train_min=0, hnsw_threshold=NO_HNSW,
+    )
+    vectors = {doc_id: exact_index._matrix[row] for doc_id, row in exact_index._row_of.items()}
+    recalls, samples = [], []
+    for q in queries:
+        q = q / np.linalg.norm(q)
+        kth_score = exact_index.query(q, top_k=k)[-1][0]
+        t0 = time.perf_counter()
+        found = [doc["id"] for _, doc in index.query(q, top_k=k)]
+        samples.append((time.perf_counter() - t0) * 1000)
+        recalls.append(sum(float(vectors[i] @ q) >= kth_score - 1e-5 for i in found) / k)
+    scan_bytes = index._codes.nbytes if index._codes is not None else index._matrix.nbytes
+    return float(np.mean(recalls)), float(np.percentile(samples, 50)), scan_bytes
+
+
+def run_child(args):
+    """Open the index with one storage in this fresh process and report the RSS it added."""
+    from connectors.local_index import LocalVectorIndex
+
+    queries = np.load(args.child_queries)
+    before = rss_mb()
+    tracemalloc.start()
+    index = LocalVectorIndex(args.child, storage=args.child_storage, pq_train_min=0, hnsw_threshold=NO_HNSW)
+    heap = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    for q in queries:
+        index.query(q, top_k=args.k)
+    after = rss_mb()
+    print(json.dumps({
+        "anon_mb": after["anon"] - before["anon"],
+        "file_mb": after["file"] - before["file"],
+        "heap_mb": heap / 1024 / 1024,
+    }))
+
+
+def metadata_heap_mb(path):
+    """Heap taken by every row's metadata as dicts, which the index used to keep in memory."""
+    tracemalloc.start()
+    with open(os.path.join(path, "docs.jsonl"), "rb") as f:
+        held = [json.loads(line) for line in f]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del held
+    return size / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=20_000, help="synthetic documents added to the bundled ones")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--real-model", action="store_true", help="encode with MiniLM instead of a fake encoder")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--child-storage", help=argparse.SUPPRESS)
+    parser.add_argument("--child-queries", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    os.environ.update({"EMBEDDING_CACHE": "0", "TRACE_LOG": "0"})
+    from benchmarks.fakes import install_fake_encoder
+
+    if not args.real_model:
+        install_fake_encoder()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index")
+        docs = corpus(args.scale, args.seed)
+        t0 = time.perf_counter()
+        rows = build_index(path, docs)
+        queries = make_queries(docs, args.queries, args.seed)
+        queries_path = os.path.join(tmp, "queries.npy")
+        np.save(queries_path, queries)
+        print(f"{len(docs)} documents, {rows} passage vectors, {len(queries)} queries "
+              f"(indexed in {time.perf_counter() - t0:.1f}s)\n")
+
+        from connectors.local_index import RESCORE_CANDIDATES, LocalVectorIndex
+        for storage in ("float16", "pq"):
+            # Encode (and train) up front so the children only open the files.
+            LocalVectorIndex(path, storage=storage, pq_train_min=0, hnsw_threshold=NO_HNSW)
+
+        memory = {}
+        for storage in ("float32", "float16", "pq"):
+            cmd = [sys.executable, "-m", "benchmarks.bench_compact_vectors", "--child", path,
+                   "--child-storage", storage, "--child-queries", queries_path, "--k", str(args.k)]
+            out = subprocess.run(cmd, cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout
+            memory[storage] = json.loads(out.strip().splitlines()[-1])
+
+        print(f"{'storage':<8} {'rescore':>7} {'recall@' + str(args.k):>10} {'p50 ms':>8} {'scan MB':>8}")
+        for storage, rescore in CONFIGS:
+            recall, p50, scan_bytes = evaluate(path, queries, args.k, storage, rescore)
+            print(f"{storage:<8} {rescore or '-':>7} {recall:10.3f} {p50:8.2f} {scan_bytes / 1024 / 1024:8.1f}")
+
+        print(f"\nRSS added by opening the index and running {len(queries)} queries "
+              f"(re-scoring {RESCORE_CANDIDATES} candidates with compact codes):")
+        for storage, m in memory.items():
+            print(f"{storage:<8} anon {m['anon_mb']:6.1f} MB   mapped files {m['file_mb']:6.1f} MB")
+
+        print(f"\nmetadata held in memory: {metadata_heap_mb(path):.1f} MB as dicts (previous layout) vs "
+              f"{memory['float32']['heap_mb']:.1f} MB index heap with the doc store (ids and offsets)")
+        print("on disk: " + ", ".join(
+            f"{name} {os.path.getsize(os.path.join(path, name)) / 1024 / 1024:.1f} MB" for name in sorted(os.listdir(path))
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# app/benchmarks/bench_embed_batching.py
+"""
+Query embedding with N concurrent users: one embed_array call per query
+versus the shared micro-batcher in embedding_batcher.py.
+
+The default fake encoder serialises calls on a simulated CPU with a fixed
+cost per forward pass plus a small cost per text; --real-model uses MiniLM.
+
+    python -m benchmarks.bench_embed_batching --users 1 8 32 --queries 50
+    python -m benchmarks.bench_embed_batching --real-model --max-wait-ms 2 5
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import format_row, load_corpora, percentiles
+
+
+def run(embed_one, users, queries):
+    titles = [d["title"] for docs in load_corpora().values() for d in docs]
+
+    def user(u):
+        samples = []
+        for i in range(queries):
+            t0 = time.perf_counter()
+            embed_one(f"{titles[(u + i) % len(titles)]} (user {u}, query {i})")
+            samples.append((time.perf_counter() - t0) * 1000)
+        return samples
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        samples = [s for user_samples in pool.map(user, range(users)) for s in user_samples]
+    return samples, len(samples) / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--queries", type=int, default=50, help="queries per user")
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, nargs="+", default=[3.0])
+    parser.add_argument("--call-ms", type=float, default=8.0, help="fake encoder cost per forward pass")
+    parser.add_argument("--text-ms", type=float, default=0.3, help="fake encoder cost per text")
+    parser.add_argument("--real-model", action="store_true", help="encode with MiniLM instead of a fake encoder")
+    args = parser.parse_args()
+
+    os.environ["EMBEDDING_CACHE"] = "0"
+    import embedding
+    from benchmarks.fakes import install_fake_encoder
+    from embedding_batcher import EmbeddingBatcher
+
+    if not args.real_model:
+        install_fake_encoder(call_ms=args.call_ms, text_ms=args.text_ms)
+    embedding.warm_up()
+
+    for users in args.users:
+        print(f"\n{users} concurrent users, {args.queries} queries each")
+        samples, qps = run(lambda q: embedding.embed_array([q])[0], users, args.queries)
+        print(f"{format_row('unbatched', percentiles(samples))}   {qps:8.1f} queries/s")
+        for wait_ms in args.max_wait_ms:
+            batcher = EmbeddingBatcher(args.max_batch_size, wait_ms)
+            samples, qps = run(batcher.embed, users, args.queries)
+            stats = batcher.stats()
+            print(f"{format_row(f'batched (wait {wait_ms:g} ms)', percentiles(samples))}   {qps:8.1f} queries/s   "
+                  f"avg batch {stats['avg_batch_size']:.1f}, queue {stats['avg_queue_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# app/benchmarks/bench_embedding_backends.py
+"""
+Throughput, single-query latency and retrieval quality of the embedding
+backends on the bundled data/*.json corpora.
+
+    python -m benchmarks.bench_embedding_backends --backends torch torch-int8 onnx onnx-int8 --threads 4
+
+recall@k compares each backend's top-k documents with the reference (first)
+backend's; title hit@k is how often a document's own title retrieves it.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.common import load_corpora, percentiles, time_calls
+from embedding import MODEL_NAME
+from embedding_backends import BACKENDS, load_encoder
+
+
+def top_k(doc_vectors, query_vectors, k):
+    scores = query_vectors @ doc_vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--threads", type=int, default=0, help="intra-op threads (0 = library default)")
+    parser.add_argument("--repeat", type=int, default=20, help="corpus copies for the throughput run")
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    docs = [doc for corpus in load_corpora().values() for doc in corpus]
+    texts = [d["text"] for d in docs]
+    titles = [d["title"] for d in docs]
+    sentences = [s for t in texts for s in t.split(". ") if s]
+    queries = titles + sentences
+
+    reference = None
+    print(f"{len(docs)} documents, {len(queries)} queries, k={args.k}, threads={args.threads or 'default'}")
+    for backend in args.backends:
+        t0 = time.perf_counter()
+        try:
+            encoder = load_encoder(MODEL_NAME, backend, args.threads)
+        except Exception as e:
+            print(f"{backend:<11} unavailable: {e}")
+            continue
+        load_s = time.perf_counter() - t0
+        encoder.encode(["warm up"])
+
+        corpus = texts * args.repeat
+        t0 = time.perf_counter()
+        encoder.encode(corpus)
+        throughput = len(corpus) / (time.perf_counter() - t0)
+
+        latency = percentiles(time_calls(lambda q: encoder.encode([q]), [(q,) for q in queries]))
+
+        doc_vectors = encoder.encode(texts)
+        query_vectors = encoder.encode(queries)
+        ranked = top_k(doc_vectors, query_vectors, args.k)
+        title_hits = np.mean([i in ranked[i] for i in range(len(titles))])
+        if reference is None:
+            reference = ranked
+        recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(ranked, reference)])
+
+        print(
+            f"{backend:<11} load {load_s:6.2f}s  {throughput:8.1f} docs/s  "
+            f"query p50 {latency['p50']:6.2f} ms  p95 {latency['p95']:6.2f} ms  "
+            f"recall@{args.k} {recall:.3f}  title hit@{args.k} {title_hits:.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# app/benchmarks/bench_fanout.py
+"""
+"All bots" search latency: querying every bot's index one after another
+versus the concurrent fan-out + reciprocal-rank fusion in pipeline.search_all,
+against Pinecone stubs with different simulated round trips.
+
+    python -m benchmarks.bench_fanout --rtt-ms 20 35 50 80 --queries 50
+"""
+import argparse
+import asyncio
+
+from benchmarks.common import format_row, load_corpora, percentiles, time_calls
+from benchmarks.fakes import install_fake_encoder, install_fake_pinecone
+from chunking import CHUNK_QUERY_FACTOR, group_by_parent
+from connectors import pinecone_client
+from embedding import embed_array
+from fusion import fuse_targets
+import pipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rtt-ms", type=float, nargs="+", default=[20.0, 35.0, 50.0, 80.0],
+                        help="simulated round trip of each index (one index per value)")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=4)
+    args = parser.parse_args()
+
+    install_fake_encoder()
+    corpora = list(load_corpora().values())
+    names = [f"bot{i}" for i in range(len(args.rtt_ms))]
+    fake = install_fake_pinecone(names)
+    for i, name in enumerate(names):
+        docs = corpora[i % len(corpora)]
+        vectors = embed_array([d["text"] for d in docs])
+        fake.indexes[name].upsert([(f"{name}-{d['id']}", v, {"title": d["title"], "text": d["text"]})
+                                   for d, v in zip(docs, vectors)])
+        fake.indexes[name].rtt_ms = args.rtt_ms[i]
+
+    targets = [("pinecone", n) for n in names]
+    docs = [d for corpus in corpora for d in corpus]
+    queries = [(v,) for v in embed_array([docs[i % len(docs)]["title"] for i in range(args.queries)])]
+
+    def sequential(vector):
+        results = {
+            t: group_by_parent(pinecone_client.pinecone_query_index(t[1], vector, args.top_k * CHUNK_QUERY_FACTOR), args.top_k)
+            for t in targets
+        }
+        return fuse_targets(results, top_k=args.top_k)
+
+    def fan_out(vector):
+        return asyncio.run(pipeline.search_all(vector, targets, top_k=args.top_k))
+
+    print(f"{len(targets)} indexes, rtt {args.rtt_ms} ms (sum {sum(args.rtt_ms):g}, max {max(args.rtt_ms):g}), {args.queries} queries")
+    for label, fn in (("sequential + RRF", sequential), ("fan-out + RRF", fan_out)):
+        fn(queries[0][0])
+        print(format_row(label, percentiles(time_calls(fn, queries))))
+
+
+if __name__ == "__main__":
+    main()
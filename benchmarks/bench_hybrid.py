@@ -0,0 +1,84 @@
+# app/benchmarks/bench_hybrid.py
+"""
+Dense vs BM25 vs hybrid (reciprocal-rank fused) retrieval on the bundled
+data/*.json corpora plus synthetic documents that each carry an exact
+identifier (SKU, error code, coupon), queried by title and by identifier.
+
+    python -m benchmarks.bench_hybrid --synthetic 2000 --k 3
+    python -m benchmarks.bench_hybrid --fake-encoder   # without MiniLM
+
+hit@k is how often the document a query was made from is in the top k.
+"""
+import argparse
+import random
+import tempfile
+
+import numpy as np
+
+from benchmarks.common import format_row, load_corpora, percentiles, time_calls
+from benchmarks.fakes import install_fake_encoder
+from connectors.local_index import LocalVectorIndex
+from connectors.sparse_index import BM25Index
+from embedding import embed_array
+from fusion import reciprocal_rank_fusion
+
+CODE_FORMATS = ("SKU-{:05d}", "ERR-{:04d}", "SAVE{:03d}")
+
+
+def build_corpus(n_synthetic, seed=0):
+    """Bundled docs plus `n_synthetic` recombined ones; returns docs and (query, doc id, kind) triples."""
+    rng = random.Random(seed)
+    docs = [d for corpus in load_corpora().values() for d in corpus]
+    sentences = [s.strip() for d in docs for s in d["text"].split(". ") if s.strip()]
+    queries = [(d["title"], d["id"], "title") for d in docs]
+    for i in range(n_synthetic):
+        code = rng.choice(CODE_FORMATS).format(rng.randrange(10 ** 5))
+        text = ". ".join(rng.sample(sentences, 3)) + f". Applies to {code}."
+        doc = {"id": f"syn_{i:05d}", "title": f"Note {i}", "text": text}
+        docs.append(doc)
+        queries.append((f"What about {code}?", doc["id"], "identifier"))
+    return docs, queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=2000)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--fake-encoder", action="store_true", help="use seeded random vectors instead of MiniLM")
+    args = parser.parse_args()
+    if args.fake_encoder:
+        install_fake_encoder()
+
+    docs, queries = build_corpus(args.synthetic)
+    vectors = embed_array([d["text"] for d in docs])
+    query_vectors = embed_array([q for q, _, _ in queries])
+    metas = [{"title": d["title"], "text": d["text"]} for d in docs]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dense = LocalVectorIndex(f"{tmp}/dense", vectors.shape[1], hnsw_threshold=float("inf"))
+        dense.upsert([(d["id"], v, m) for d, v, m in zip(docs, vectors, metas)])
+        sparse = BM25Index(f"{tmp}/sparse")
+        sparse.add([(d["id"], m) for d, m in zip(docs, metas)])
+        sparse.save()
+        depth = args.k * 3
+
+        retrievers = {
+            "dense": lambda q, v: dense.query(v, args.k),
+            "bm25": lambda q, v: sparse.query(q, args.k),
+            "hybrid (rrf)": lambda q, v: reciprocal_rank_fusion(
+                {"dense": dense.query(v, depth), "sparse": sparse.query(q, depth)}, top_k=args.k
+            ),
+        }
+        print(f"{len(docs)} docs, {len(queries)} queries, k={args.k}, "
+              f"{'fake' if args.fake_encoder else 'MiniLM'} embeddings, {sparse._tfs.size} postings")
+        calls = [(q, v) for (q, _, _), v in zip(queries, query_vectors)]
+        for name, fn in retrievers.items():
+            hits = {"title": [], "identifier": []}
+            for (q, doc_id, kind), v in zip(queries, query_vectors):
+                hits[kind].append(any(d["id"] == doc_id for _, d in fn(q, v)))
+            recall = "  ".join(f"{kind} hit@{args.k} {np.mean(h):.3f}" for kind, h in hits.items() if h)
+            print(f"{format_row(name, percentiles(time_calls(fn, calls)))}   {recall}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# app/benchmarks/bench_ingest_memory.py
+"""
+Peak RSS of a bulk ingest with embeddings kept as float32 arrays (current
+pipeline) versus converted to Python lists right after encoding (the old
+embed_texts path). Each mode runs in a fresh process against a Pinecone
+stand-in that discards vectors, so only the pipeline's own memory counts.
+The BM25 index is off unless --sparse, which builds it in a temporary
+directory to show what it adds per document.
+
+    python -m benchmarks.bench_ingest_memory --docs 100000
+    python -m benchmarks.bench_ingest_memory --docs 100000 --real-model
+    python -m benchmarks.bench_ingest_memory --docs 50000 --sparse
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import REPO_ROOT, load_corpora, peak_rss_mb
+
+
+def synthetic_docs(n_docs):
+    """Generator of unique documents built from the bundled corpora."""
+    samples = [doc for docs in load_corpora().values() for doc in docs]
+    for i in range(n_docs):
+        doc = samples[i % len(samples)]
+        yield {"id": f"doc{i}", "title": doc["title"], "text": f"{doc['text']} (variant {i})"}
+
+
+def run_child(args):
+    os.environ["EMBEDDING_CACHE"] = "0"
+    import embedding
+    import ingest
+    from benchmarks.fakes import install_fake_encoder, install_fake_pinecone
+
+    if not args.real_model:
+        install_fake_encoder()
+    embedding.warm_up()
+    install_fake_pinecone(["bench"], discard=True)
+    if args.mode == "lists":
+        ingest.embed_array = embedding.embed_texts
+
+    before = peak_rss_mb()
+    t0 = time.perf_counter()
+    stats = ingest.ingest_documents(
+        synthetic_docs(args.docs), "bench",
+        embed_batch_size=args.embed_batch_size, backend="Pinecone", sparse=args.sparse,
+    )
+    print(json.dumps({
+        "mode": args.mode,
+        "docs": stats.succeeded,
+        "vectors": stats.vectors,
+        "seconds": time.perf_counter() - t0,
+        "rss_before_mb": before,
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=100_000)
+    parser.add_argument("--embed-batch-size", type=int, default=512)
+    parser.add_argument("--real-model", action="store_true", help="encode with MiniLM instead of a fake encoder")
+    parser.add_argument("--sparse", action="store_true", help="also build the BM25 index (in a temporary directory)")
+    parser.add_argument("--mode", choices=["arrays", "lists"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_child(args)
+        return
+
+    results = {}
+    for mode in ("lists", "arrays"):
+        cmd = [sys.executable, "-m", "benchmarks.bench_ingest_memory", "--mode", mode,
+               "--docs", str(args.docs), "--embed-batch-size", str(args.embed_batch_size)]
+        if args.real_model:
+            cmd.append("--real-model")
+        if args.sparse:
+            cmd.append("--sparse")
+        with tempfile.TemporaryDirectory() as tmp:
+            # Every run starts from an empty BM25 index, outside the working tree.
+            env = {**os.environ, "SPARSE_INDEX_DIR": tmp}
+            out = subprocess.run(cmd, cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True).stdout
+        results[mode] = json.loads(out.strip().splitlines()[-1])
+        r = results[mode]
+        print(f"{mode:<7} {r['docs']} docs ({r['vectors']} passages) in {r['seconds']:.1f}s  peak RSS {r['peak_rss_mb']:.1f} MB "
+              f"(+{r['peak_rss_mb'] - r['rss_before_mb']:.1f} MB during ingest)")
+    saved = results["lists"]["peak_rss_mb"] - results["arrays"]["peak_rss_mb"]
+    print(f"peak RSS reduction with arrays: {saved:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
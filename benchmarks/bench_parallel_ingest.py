@@ -0,0 +1,140 @@
+# app/benchmarks/bench_parallel_ingest.py
+"""
+Ingest throughput of load_data.load_json_files_parallel at 1, 2, 4, 8 and 16
+worker processes, against the sequential loader (load_json_to_pinecone_index
+once per file). The synthetic corpus is split over --files JSON Lines files
+like the four bundled datasets; large files are sharded by byte range.
+
+By default each worker embeds with a fake encoder that burns --call-ms plus
+--text-ms per text of real CPU time, so the scaling reflects the cores of
+this machine; --real-model loads MiniLM in every worker with its share of
+torch threads. Upserts go to an in-process Pinecone stand-in.
+--cache-rows N turns on the embedding cache, one SQLite file per run shared
+by all its workers and capped at N rows, and checks the cap held.
+
+    python -m benchmarks.bench_parallel_ingest --docs 50000 --workers 1 2 4 8 16
+    python -m benchmarks.bench_parallel_ingest --real-model --docs 5000 --workers 1 4
+    python -m benchmarks.bench_parallel_ingest --docs 20000 --workers 4 --cache-rows 5000
+"""
+import argparse
+import contextlib
+import functools
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.common import peak_rss_mb, synthetic_corpus
+
+
+def write_corpus(directory, n_docs, n_files, seed):
+    paths = [os.path.join(directory, f"corpus-{i}.jsonl") for i in range(n_files)]
+    files = [open(p, "w", encoding="utf-8") for p in paths]
+    try:
+        for i, doc in enumerate(synthetic_corpus(n_docs, seed=seed)):
+            files[i % n_files].write(json.dumps(doc) + "\n")
+    finally:
+        for f in files:
+            f.close()
+    return [(path, f"bench-{i}") for i, path in enumerate(paths)]
+
+
+def run(files, workers, args, setup):
+    """Load every file into fresh indexes; returns (seconds, documents, failed documents, cache rows)."""
+    import embedding
+    import load_data
+    from benchmarks.fakes import install_fake_pinecone
+
+    # Fresh index names too: sparse indexes are cached per process by name.
+    files = [(path, f"{index}-w{workers}") for path, index in files]
+    install_fake_pinecone([index for _, index in files], rtt_ms=args.rtt_ms, discard=True)
+    run_dir = tempfile.mkdtemp(prefix=f"run-{workers}-", dir=os.getcwd())
+    cwd = os.getcwd()
+    os.chdir(run_dir)  # fresh manifests and sparse indexes per run
+    cache_path = os.path.join(run_dir, "embeddings.sqlite3")
+    if args.cache_rows:
+        # Read by the workers spawned for this run; the parent reopens its own cache.
+        os.environ["EMBEDDING_CACHE_PATH"] = cache_path
+        embedding._cache, embedding._cache_loaded = None, False
+    out = io.StringIO()
+    t0 = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(out):
+            if workers == 0:
+                all_stats = [load_data.load_json_to_pinecone_index(path, index, backend="Pinecone")
+                             for path, index in files]
+            else:
+                all_stats = load_data.load_json_files_parallel(
+                    files, processes=workers, backend="Pinecone", setup=setup,
+                )
+    finally:
+        os.chdir(cwd)
+    seconds = time.perf_counter() - t0
+    if args.verbose:
+        print(out.getvalue())
+    cache_rows = None
+    if args.cache_rows:
+        with contextlib.closing(sqlite3.connect(cache_path)) as db:
+            cache_rows = db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    return seconds, sum(s.succeeded for s in all_stats), sum(s.failed for s in all_stats), cache_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=50_000)
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--shard-mb", type=float, default=4.0, help="byte-range shard size for large files")
+    parser.add_argument("--call-ms", type=float, default=20.0, help="fake encoder CPU time per encode call")
+    parser.add_argument("--text-ms", type=float, default=2.0, help="fake encoder CPU time per passage")
+    parser.add_argument("--rtt-ms", type=float, default=5.0, help="simulated Pinecone round trip per upsert")
+    parser.add_argument("--real-model", action="store_true", help="encode with MiniLM instead of a fake encoder")
+    parser.add_argument("--no-sequential", action="store_true", help="skip the single-process baseline")
+    parser.add_argument("--cache-rows", type=int, default=0,
+                        help="enable the shared embedding cache capped at this many rows (0 = off)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="show the loader's output")
+    args = parser.parse_args()
+
+    # Inherited by the worker processes.
+    os.environ.update({
+        "EMBEDDING_CACHE": "1" if args.cache_rows else "0",
+        "EMBEDDING_CACHE_MAX_ROWS": str(args.cache_rows),
+        "TRACE_LOG": "0",
+        "INGEST_SHARD_BYTES": str(int(args.shard_mb * 1024 * 1024)),
+    })
+    import embedding
+    from benchmarks.fakes import install_fake_encoder
+
+    setup = None
+    if not args.real_model:
+        setup = functools.partial(install_fake_encoder, call_ms=args.call_ms, text_ms=args.text_ms, spin=True)
+        setup()
+    embedding.warm_up()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            files = write_corpus(tmp, args.docs, args.files, args.seed)
+            size_mb = sum(os.path.getsize(path) for path, _ in files) / 1024 / 1024
+            print(f"{args.docs} documents in {args.files} files ({size_mb:.1f} MB), {os.cpu_count()} cores\n")
+            baseline = None
+            for workers in ([] if args.no_sequential else [0]) + args.workers:
+                seconds, docs, failed, cache_rows = run(files, workers, args, setup)
+                rate = docs / seconds if seconds else 0.0
+                baseline = baseline or rate
+                name = "sequential" if workers == 0 else f"{workers} workers"
+                print(f"{name:<12} {seconds:7.2f}s  {rate:9.1f} docs/s  x{rate / baseline:5.2f}"
+                      f"{f'  ({failed} failed)' if failed else ''}"
+                      f"{f'  cache {cache_rows}/{args.cache_rows} rows' if args.cache_rows else ''}"
+                      f"{'  ✗ CACHE OVER CAP' if cache_rows and cache_rows > args.cache_rows else ''}")
+        finally:
+            os.chdir(cwd)
+    print(f"\npeak RSS of the parent: {peak_rss_mb():.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
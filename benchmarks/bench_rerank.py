@@ -0,0 +1,67 @@
+# app/benchmarks/bench_rerank.py
+"""
+Cost and effect of the cross-encoder re-ranking stage for different
+candidate counts N, to pick RERANK_CANDIDATES / RERANK_BUDGET_MS.
+
+    python -m benchmarks.bench_rerank --candidates 4 8 16 32 --budget-ms 250
+    python -m benchmarks.bench_rerank --fake   # stand-in models, timing only
+
+For each N: re-rank stage latency percentiles, how often the budget cut it
+short, and hit@k (the query's source document in the final top k) against
+first-stage retrieval alone.
+"""
+import argparse
+import collections
+import tempfile
+
+import numpy as np
+
+from benchmarks.bench_hybrid import build_corpus
+from benchmarks.common import format_row, percentiles
+from benchmarks.fakes import install_fake_encoder, install_fake_reranker
+from connectors.local_index import LocalVectorIndex
+from embedding import embed_array
+import rerank
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--budget-ms", type=float, default=rerank.RERANK_BUDGET_MS)
+    parser.add_argument("--batch-size", type=int, default=rerank.RERANK_BATCH_SIZE)
+    parser.add_argument("--synthetic", type=int, default=500)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--fake", action="store_true", help="fake bi-encoder and cross-encoder (timing only)")
+    args = parser.parse_args()
+    if args.fake:
+        install_fake_encoder()
+        install_fake_reranker()
+    model = rerank.get_reranker(wait=True)
+
+    docs, queries = build_corpus(args.synthetic)
+    vectors = embed_array([d["text"] for d in docs])
+    query_vectors = embed_array([q for q, _, _ in queries])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = LocalVectorIndex(f"{tmp}/dense", vectors.shape[1], hnsw_threshold=float("inf"))
+        index.upsert([(d["id"], v, {"title": d["title"], "text": d["text"]}) for d, v in zip(docs, vectors)])
+
+        first_stage = [index.query(v, max(args.candidates)) for v in query_vectors]
+        baseline = np.mean([any(d["id"] == doc_id for _, d in hits[:args.k])
+                            for hits, (_, doc_id, _) in zip(first_stage, queries)])
+        print(f"{len(docs)} docs, {len(queries)} queries, k={args.k}, budget {args.budget_ms:g} ms, "
+              f"batch {args.batch_size}; first stage hit@{args.k} {baseline:.3f}")
+
+        for n in args.candidates:
+            samples, statuses, hits = [], collections.Counter(), []
+            for (query, doc_id, _), candidates in zip(queries, first_stage):
+                ranked, report = rerank.rerank(query, candidates[:n], args.k, args.budget_ms, args.batch_size, model)
+                samples.append(report.seconds * 1000)
+                statuses[report.status] += 1
+                hits.append(any(d["id"] == doc_id for _, d in ranked))
+            truncated = statuses["truncated"] / len(queries)
+            print(f"{format_row(f'N={n}', percentiles(samples))}   truncated {truncated:.1%}   hit@{args.k} {np.mean(hits):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# app/benchmarks/bench_sentence_scoring.py
+"""
+Microbenchmark of utils.best_sentences_for_query against the original
+per-sentence regex/set implementation on the data/*.json corpora.
+
+    python -m benchmarks.bench_sentence_scoring --rounds 200 --long-copies 50
+"""
+import argparse
+import re
+
+from benchmarks.common import format_row, load_corpora, percentiles, time_calls
+import utils
+
+
+def legacy_best_sentences(texts, query, k=2):
+    """The implementation best_sentences_for_query replaced, kept for comparison."""
+    if isinstance(texts, list):
+        texts = "\n".join(t for t in texts if isinstance(t, str))
+    sents = utils.simple_tokenize_sentences(texts)
+    qtok = set(re.findall(r"\w+", query.lower()))
+    scored = []
+    for s in sents:
+        stok = set(re.findall(r"\w+", s.lower()))
+        scored.append((len(qtok & stok), s))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [s for score, s in scored[:k]] if scored else sents[:k]
+
+
+def run(label, docs, queries, rounds):
+    """Score every query against `docs` the way execute_plan does (one call per doc)."""
+    texts = [d["text"] for d in docs]
+    ingested = [{"text": t, "sentence_index": utils.encode_sentence_index(t)} for t in texts]
+    calls = [(q,) for q in queries] * rounds
+
+    def cold(q):
+        utils._cached_sentence_index.cache_clear()
+        for t in texts:
+            utils.best_sentences_for_query(t, q, k=2)
+
+    def decode(q):
+        utils._decoded_sentence_index.cache_clear()
+        for d in ingested:
+            utils.best_sentences_for_query(d, q, k=2)
+
+    variants = {
+        "legacy regex/set": lambda q: [legacy_best_sentences(t, q, k=2) for t in texts],
+        "vectorized, cold": cold,
+        "vectorized, cached": lambda q: [utils.best_sentences_for_query(t, q, k=2) for t in texts],
+        "ingest index, decoded": decode,
+        "ingest index, cached": lambda q: [utils.best_sentences_for_query(d, q, k=2) for d in ingested],
+        "vectorized + bm25": lambda q: [utils.best_sentences_for_query(t, q, k=2, weighting="bm25") for t in texts],
+    }
+    chars = sum(len(t) for t in texts)
+    print(f"\n{label}: {len(texts)} docs, {chars} chars, {len(queries)} queries x {rounds} rounds (per query)")
+    for name, fn in variants.items():
+        fn(queries[0])  # warm up
+        print(format_row(name, percentiles(time_calls(fn, calls))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--long-copies", type=int, default=50, help="corpus copies joined into each long document")
+    args = parser.parse_args()
+
+    corpora = load_corpora()
+    docs = [d for corpus in corpora.values() for d in corpus]
+    queries = [d["title"] for d in docs]
+    run("bundled documents", docs, queries, args.rounds)
+
+    long_docs = [
+        {"text": " ".join(f"{d['text']} (copy {i})." for i in range(args.long_copies) for d in corpus)}
+        for corpus in corpora.values()
+    ]
+    run(f"long documents ({args.long_copies} copies)", long_docs, queries, max(args.rounds // 10, 1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# app/benchmarks/bench_vector_backends.py
+"""
+Query latency of the Pinecone path (against a local stub with a simulated
+round trip) versus the local brute-force and HNSW backends.
+
+    python -m benchmarks.bench_vector_backends --docs 20000 --queries 500 --rtt-ms 25
+"""
+import argparse
+import tempfile
+
+import numpy as np
+
+from benchmarks.common import format_row, load_corpora, percentiles, time_calls
+from benchmarks.fakes import install_fake_pinecone
+from connectors import local_index, pinecone_client
+
+DIMENSION = 384
+
+
+def synthetic_corpus(n_docs, seed=0):
+    """Random unit vectors with metadata cycled from the bundled corpora."""
+    rng = np.random.default_rng(seed)
+    samples = [doc for docs in load_corpora().values() for doc in docs]
+    vectors = rng.standard_normal((n_docs, DIMENSION)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    items = [
+        (f"doc{i}", vectors[i], {"title": samples[i % len(samples)]["title"], "text": samples[i % len(samples)]["text"]})
+        for i in range(n_docs)
+    ]
+    return items, vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument("--rtt-ms", type=float, default=25.0, help="simulated Pinecone round trip")
+    args = parser.parse_args()
+
+    items, vectors = synthetic_corpus(args.docs)
+    rng = np.random.default_rng(1)
+    queries = [(vectors[i] + 0.05 * rng.standard_normal(DIMENSION)).astype(np.float32)
+               for i in rng.integers(0, args.docs, args.queries)]
+
+    install_fake_pinecone(["bench"], DIMENSION, rtt_ms=args.rtt_ms)
+    for start in range(0, len(items), 100):
+        pinecone_client.pinecone_upsert_batch("bench", [(i, v.tolist(), m) for i, v, m in items[start:start + 100]])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        brute = local_index.LocalVectorIndex(f"{tmp}/brute", DIMENSION, hnsw_threshold=float("inf"))
+        brute.upsert(items)
+        backends = {
+            f"pinecone stub ({args.rtt_ms:g} ms rtt)": lambda q: pinecone_client.pinecone_query_index("bench", q.tolist(), args.top_k),
+            "local brute force (mmap)": lambda q: brute.query(q, args.top_k),
+        }
+        if local_index.hnswlib is not None:
+            hnsw = local_index.LocalVectorIndex(f"{tmp}/hnsw", DIMENSION, hnsw_threshold=0)
+            hnsw.upsert(items)
+            backends["local hnsw"] = lambda q: hnsw.query(q, args.top_k)
+        else:
+            print("hnswlib not installed; skipping the HNSW backend")
+
+        print(f"{args.docs} docs, {args.queries} queries, top_k={args.top_k}")
+        for name, fn in backends.items():
+            fn(queries[0])  # warm up
+            print(format_row(name, percentiles(time_calls(fn, [(q,) for q in queries]))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# app/benchmarks/common.py
+import glob
+import json
+import os
+import random
+import resource
+import time
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(REPO_ROOT, "data")
+
+
+def load_corpora() -> Dict[str, List[Dict]]:
+    """The bundled data/*.json corpora keyed by file stem."""
+    corpora = {}
+    for path in sorted(glob.glob(os.path.join(DATA_DIR, "*.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            corpora[os.path.splitext(os.path.basename(path))[0]] = json.load(f)
+    return corpora
+
+
+def synthetic_corpus(n_docs: int, seed: int = 0) -> Iterator[Dict]:
+    """
+    `n_docs` unique documents scaled up from the bundled corpora: each one
+    takes the title of a sample document and 3-8 sentences drawn from the
+    same corpus, so vocabulary and lengths stay realistic.
+    """
+    rng = random.Random(seed)
+    corpora = [
+        (docs, [s.strip() for d in docs for s in d["text"].split(". ") if s.strip()])
+        for docs in load_corpora().values() if docs
+    ]
+    for i in range(n_docs):
+        docs, sentences = corpora[i % len(corpora)]
+        sample = rng.choice(docs)
+        text = ". ".join(rng.sample(sentences, min(len(sentences), rng.randint(3, 8))))
+        yield {"id": f"syn_{i:07d}", "title": f"{sample['title']} #{i}", "text": text}
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+def rss_mb() -> Dict[str, float]:
+    """
+    Current resident memory of this process (Linux): "anon" (heap, arrays)
+    and "file" (mapped file pages, which the kernel can drop and re-read).
+    """
+    out = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("RssAnon:", "RssFile:")):
+                key, kb = line.split()[:2]
+                out[key[3:-1].lower()] = int(kb) / 1024
+    return out
+
+
+def percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    if not samples_ms:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0}
+    arr = np.asarray(samples_ms)
+    return {
+        "p50": float(np.percentile(arr, 50)),
+        "p95": float(np.percentile(arr, 95)),
+        "p99": float(np.percentile(arr, 99)),
+        "mean": float(arr.mean()),
+    }
+
+
+def time_calls(fn, args_list) -> List[float]:
+    """Run fn(*args) for each args tuple and return per-call latencies in ms."""
+    samples = []
+    for args in args_list:
+        t0 = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def format_row(name: str, stats: Dict[str, float]) -> str:
+    return f"{name:<28} p50 {stats['p50']:8.3f} ms   p95 {stats['p95']:8.3f} ms   p99 {stats['p99']:8.3f} ms"
@@ -0,0 +1,215 @@
+# app/benchmarks/fakes.py
+"""In-process stand-ins for external services used by the benchmarks."""
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+
+
+class FakePineconeIndex:
+    """Brute-force cosine index with the parts of the Pinecone Index API the app uses."""
+
+    def __init__(self, name, dimension, rtt_ms=0.0, discard=False):
+        self.name = name
+        self.dimension = dimension
+        self.rtt_ms = rtt_ms
+        self.discard = discard  # accept upserts without keeping them (memory benchmarks)
+        self._lock = threading.Lock()
+        self._rows = {}  # id -> (unit vector, metadata)
+        self._matrix = None
+        self._ids = []
+
+    def _network(self):
+        if self.rtt_ms:
+            time.sleep(self.rtt_ms / 1000.0)
+
+    def upsert(self, vectors, namespace=None):
+        self._network()
+        if self.discard:
+            return {"upserted_count": len(vectors)}
+        with self._lock:
+            for doc_id, vector, metadata in vectors:
+                v = np.asarray(vector, dtype=np.float32)
+                self._rows[doc_id] = (v / (np.linalg.norm(v) or 1.0), metadata)
+            self._matrix = None
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids, namespace=None):
+        self._network()
+        with self._lock:
+            for doc_id in ids:
+                self._rows.pop(doc_id, None)
+            self._matrix = None
+
+    def query(self, vector, top_k=10, include_metadata=False, namespace=None, **kwargs):
+        self._network()
+        with self._lock:
+            if self._matrix is None:
+                self._ids = list(self._rows)
+                self._matrix = (
+                    np.vstack([self._rows[i][0] for i in self._ids]) if self._ids
+                    else np.zeros((0, self.dimension), dtype=np.float32)
+                )
+            ids, matrix = self._ids, self._matrix
+        q = np.asarray(vector, dtype=np.float32)
+        q = q / (np.linalg.norm(q) or 1.0)
+        scores = matrix @ q
+        order = np.argsort(-scores)[:top_k]
+        matches = [
+            SimpleNamespace(
+                id=ids[i],
+                score=float(scores[i]),
+                metadata=self._rows[ids[i]][1] if include_metadata else {},
+            )
+            for i in order
+        ]
+        return SimpleNamespace(matches=matches)
+
+    def describe_index_stats(self):
+        return {"dimension": self.dimension, "total_vector_count": len(self._rows)}
+
+
+class FakePinecone:
+    """Replacement for `pinecone.Pinecone` with a simulated network round trip."""
+
+    def __init__(self, rtt_ms=0.0, discard=False):
+        self.rtt_ms = rtt_ms
+        self.discard = discard
+        self.indexes = {}
+
+    def list_indexes(self):
+        return [SimpleNamespace(name=n, host=f"{n}.local") for n in self.indexes]
+
+    def create_index(self, name, dimension, metric="cosine", spec=None):
+        self.indexes[name] = FakePineconeIndex(name, dimension, self.rtt_ms, self.discard)
+
+    def Index(self, name, host=None, pool_threads=1):
+        return self.indexes[name]
+
+
+def install_fake_pinecone(index_names=(), dimension=384, rtt_ms=0.0, discard=False):
+    """
+    Point connectors.pinecone_client at a FakePinecone and return it.
+    Indexes are created up front so the client never takes its create-and-wait path.
+    """
+    from connectors import pinecone_client
+
+    fake = FakePinecone(rtt_ms=rtt_ms, discard=discard)
+    for name in index_names:
+        fake.create_index(name, dimension)
+    pinecone_client.pc = fake
+    pinecone_client.invalidate_index_handle()
+    return fake
+
+
+class FakeEncoder:
+    """
+    Deterministic pseudo-embeddings (seeded by the text) with the encoder API.
+    With call_ms/text_ms set, each encode call also occupies a simulated CPU
+    (one call at a time) for a fixed cost plus a cost per text, like a model
+    forward pass whose overhead does not depend on the batch size. With
+    `spin`, that time is spent busy-looping on a real core instead of
+    sleeping, so concurrent processes compete for the machine's cores.
+    """
+
+    def __init__(self, dimension=384, call_ms=0.0, text_ms=0.0, spin=False):
+        self.dimension = dimension
+        self.call_ms = call_ms
+        self.text_ms = text_ms
+        self.spin = spin
+        self._cpu = threading.Lock()
+
+    def encode(self, texts, batch_size=32):
+        if self.call_ms or self.text_ms:
+            seconds = (self.call_ms + self.text_ms * len(texts)) / 1000.0
+            with self._cpu:
+                if self.spin:
+                    deadline = time.thread_time() + seconds
+                    while time.thread_time() < deadline:
+                        pass
+                else:
+                    time.sleep(seconds)
+        out = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+            out[row] = rng.standard_normal(self.dimension, dtype=np.float32)
+        out /= np.linalg.norm(out, axis=1, keepdims=True)
+        return out
+
+
+def install_fake_encoder(dimension=384, call_ms=0.0, text_ms=0.0, spin=False):
+    """Make embedding.get_model() return a FakeEncoder instead of loading MiniLM."""
+    import embedding
+
+    embedding._model = FakeEncoder(dimension, call_ms, text_ms, spin)
+    return embedding._model
+
+
+class FakeCrossEncoder:
+    """
+    Stand-in for sentence_transformers.CrossEncoder: scores pairs by word
+    overlap and sleeps like a CPU model (fixed cost per call plus per pair).
+    """
+
+    def __init__(self, call_ms=2.0, pair_ms=1.5):
+        self.call_ms = call_ms
+        self.pair_ms = pair_ms
+
+    def predict(self, pairs, batch_size=32):
+        time.sleep((self.call_ms + self.pair_ms * len(pairs)) / 1000.0)
+        scores = []
+        for query, text in pairs:
+            q = set(query.lower().split())
+            scores.append(len(q & set(text.lower().split())) / (len(q) or 1))
+        return np.asarray(scores, dtype=np.float32)
+
+
+def install_fake_reranker(call_ms=2.0, pair_ms=1.5):
+    """Make rerank.get_reranker() return a FakeCrossEncoder instead of loading a model."""
+    import rerank
+
+    rerank._model = FakeCrossEncoder(call_ms, pair_ms)
+    return rerank._model
+
+
+class FakeGenerativeModel:
+    """
+    Stand-in for google.generativeai.GenerativeModel: answers with the start
+    of the prompt's extracted information after a simulated time to first
+    token, then emits one word per `token_ms`.
+    """
+
+    def __init__(self, first_token_ms=300.0, token_ms=10.0, max_words=60):
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+        self.max_words = max_words
+        self.calls = 0
+
+    def _words(self, prompt):
+        context = prompt.split("Extracted Information:", 1)[-1].split("User Query:", 1)[0]
+        return context.split()[:self.max_words] or ["No", "answer."]
+
+    def _stream(self, words):
+        time.sleep(self.first_token_ms / 1000.0)
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(self.token_ms / 1000.0)
+            yield SimpleNamespace(text=word + " ")
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.calls += 1
+        chunks = self._stream(self._words(prompt))
+        if stream:
+            return chunks
+        return SimpleNamespace(text="".join(c.text for c in chunks).strip())
+
+
+def install_fake_gemini(first_token_ms=300.0, token_ms=10.0):
+    """Make the planner executor call a FakeGenerativeModel instead of Gemini."""
+    from connectors.planner import executor
+
+    model = FakeGenerativeModel(first_token_ms, token_ms)
+    executor._gemini = lambda: model
+    return model
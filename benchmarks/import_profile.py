@@ -0,0 +1,110 @@
+# app/benchmarks/import_profile.py
+"""
+Import-time profile of the app's modules (python -X importtime), optionally
+side by side with another git revision to show the effect of lazy loading.
+
+    python -m benchmarks.import_profile
+    python -m benchmarks.import_profile --baseline HEAD~1 --first-embed
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import REPO_ROOT
+
+MODULES = [
+    "embedding",
+    "connectors.pinecone_client",
+    "connectors.planner.executor",
+    "ingest",
+    "load_data",
+]
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def profile_import(module, root, top=5):
+    """Return (total seconds, [(seconds, dependency)...]) for importing `module` in a fresh interpreter."""
+    env = dict(os.environ, PYTHONPATH=root, EMBEDDING_CACHE="0")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=root, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "unknown error"
+        raise RuntimeError(error)
+    total = 0
+    deps = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if not m:
+            continue
+        cumulative, depth, name = int(m.group(2)), len(m.group(3)) // 2, m.group(4)
+        if depth == 0 and name == module:
+            total = cumulative
+        elif depth == 1:
+            deps.append((cumulative / 1e6, name))
+    deps.sort(reverse=True)
+    return total / 1e6, deps[:top]
+
+
+def time_first_embed(root):
+    """Seconds from interpreter start to the first embedding (includes the model load)."""
+    code = (
+        "import time; t0 = time.perf_counter(); import embedding; "
+        "embedding.embed_texts(['hello']); print(time.perf_counter() - t0)"
+    )
+    env = dict(os.environ, PYTHONPATH=root, EMBEDDING_CACHE="0")
+    proc = subprocess.run([sys.executable, "-c", code], cwd=root, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    return float(proc.stdout.strip().splitlines()[-1])
+
+
+def export_revision(rev, dest):
+    archive = subprocess.run(["git", "archive", rev], cwd=REPO_ROOT, capture_output=True, check=True)
+    subprocess.run(["tar", "-x", "-C", dest], input=archive.stdout, check=True)
+
+
+def report(label, root, first_embed):
+    print(f"\n== {label} ({root})")
+    totals = {}
+    for module in MODULES:
+        try:
+            total, deps = profile_import(module, root)
+        except RuntimeError as e:
+            print(f"{module:<32} failed: {e}")
+            continue
+        totals[module] = total
+        heaviest = ", ".join(f"{name} {secs:.2f}s" for secs, name in deps[:3])
+        print(f"{module:<32} {total:7.3f}s   heaviest: {heaviest}")
+    if first_embed:
+        try:
+            print(f"{'time to first embedding':<32} {time_first_embed(root):7.3f}s")
+        except RuntimeError as e:
+            print(f"time to first embedding failed: {e}")
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", help="git revision to compare against, e.g. HEAD~1")
+    parser.add_argument("--first-embed", action="store_true", help="also time the first embed_texts call")
+    args = parser.parse_args()
+
+    current = report("working tree", REPO_ROOT, args.first_embed)
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as tmp:
+            export_revision(args.baseline, tmp)
+            baseline = report(f"baseline {args.baseline}", tmp, args.first_embed)
+        print("\n== import time saved")
+        for module, secs in current.items():
+            if module in baseline:
+                print(f"{module:<32} {baseline[module] - secs:+7.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# app/benchmarks/load_test.py
+"""
+End-to-end load test of the ingestion and query paths against local
+stand-ins for Pinecone and Gemini, so retrieval changes can be measured
+without paid services.
+
+1. Ingest: a synthetic corpus scaled from data/*.json is written to a JSON
+   Lines file and loaded with load_data.load_json_to_pinecone_index.
+2. Query: for each --users level, that many concurrent users each send
+   --queries questions through the app's path (plan + embed, Pinecone
+   query with BM25 fusion, best_sentences_for_query, execute_plan).
+
+Reports throughput, p50/p95/p99 end-to-end and per stage (from the tracing
+spans) and peak RSS. --save writes the numbers as JSON; --baseline compares
+against such a file and exits non-zero when p95 latency or throughput got
+worse by more than --tolerance.
+
+    python -m benchmarks.load_test --docs 20000 --users 1 4 16 --queries 25
+    python -m benchmarks.load_test --save baseline.json
+    python -m benchmarks.load_test --baseline baseline.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import format_row, peak_rss_mb, percentiles, synthetic_corpus
+
+INDEX_NAME = "load-test"
+BOT = "load-test"
+
+
+def _queries(docs, n, seed):
+    """Titles and single sentences of random corpus documents."""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        doc = rng.choice(docs)
+        out.append(doc["title"] if rng.random() < 0.5 else rng.choice(doc["text"].split(". ")))
+    return out
+
+
+def ingest(args, path):
+    from load_data import load_json_to_pinecone_index
+
+    docs = []
+    with open(path, "w", encoding="utf-8") as f:
+        for doc in synthetic_corpus(args.docs, seed=args.seed):
+            f.write(json.dumps(doc) + "\n")
+            docs.append(doc)
+    out = sys.stdout if args.verbose else io.StringIO()
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(out):
+        stats = load_json_to_pinecone_index(path, INDEX_NAME, resume=False, backend="Pinecone")
+    seconds = time.perf_counter() - t0
+    print(f"ingest: {stats.succeeded} docs ({stats.vectors} vectors) in {seconds:.1f}s "
+          f"= {stats.succeeded / seconds:.0f} docs/s, peak RSS {peak_rss_mb():.0f} MB")
+    return docs, {"docs": stats.succeeded, "vectors": stats.vectors, "seconds": seconds}
+
+
+def answer(query, top_k=4):
+    """One question through the same stages as the Streamlit handler."""
+    import tracing
+    from connectors.planner.executor import execute_plan
+    from pipeline import plan_and_embed, retrieve
+    from utils import best_sentences_for_query
+
+    with tracing.trace(BOT) as t:
+        steps, vector = asyncio.run(plan_and_embed(query))
+        target = ("Pinecone", INDEX_NAME)
+        retrieved = asyncio.run(retrieve(vector, [target], top_k=top_k, query=query))[target]
+        passages = [p for _, doc in retrieved for p in (doc.get("passages") or [doc])]
+        best_sentences_for_query(passages, query, k=3)
+        execute_plan(steps, retrieved, query)
+    return t
+
+
+def run_users(users, queries_per_user, docs, seed):
+    questions = [_queries(docs, queries_per_user, seed + u) for u in range(users)]
+
+    def user(qs):
+        return [answer(q) for q in qs]
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        traces = [t for ts in pool.map(user, questions) for t in ts]
+    wall = time.perf_counter() - t0
+
+    stages = {}
+    for t in traces:
+        per_query = {}
+        for s in t.spans:
+            per_query[s["name"]] = per_query.get(s["name"], 0.0) + s["duration_ms"]
+        for name, ms in per_query.items():
+            stages.setdefault(name, []).append(ms)
+    return {
+        "users": users,
+        "queries": len(traces),
+        "qps": len(traces) / wall,
+        "latency": percentiles([t.total_ms for t in traces]),
+        "stages": {name: percentiles(ms) for name, ms in stages.items()},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare(results, baseline_path, tolerance):
+    """Print regressions against a saved run; returns True when there are none."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {r["users"]: r for r in json.load(f)["query"]}
+    ok = True
+    for r in results:
+        base = baseline.get(r["users"])
+        if base is None:
+            continue
+        p95, base_p95 = r["latency"]["p95"], base["latency"]["p95"]
+        if p95 > base_p95 * (1 + tolerance):
+            print(f"✗ {r['users']} users: p95 {p95:.1f} ms vs {base_p95:.1f} ms in the baseline")
+            ok = False
+        if r["qps"] < base["qps"] * (1 - tolerance):
+            print(f"✗ {r['users']} users: {r['qps']:.1f} queries/s vs {base['qps']:.1f} in the baseline")
+            ok = False
+    if ok:
+        print(f"✓ within {tolerance:.0%} of {baseline_path}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--queries", type=int, default=25, help="queries per user")
+    parser.add_argument("--rtt-ms", type=float, default=20.0, help="simulated Pinecone round trip")
+    parser.add_argument("--llm-first-token-ms", type=float, default=300.0)
+    parser.add_argument("--llm-token-ms", type=float, default=5.0)
+    parser.add_argument("--real-model", action="store_true", help="encode with MiniLM instead of a fake encoder")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the results as JSON to this path")
+    parser.add_argument("--baseline", help="compare with results saved by --save")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--verbose", action="store_true", help="show the loader's output")
+    args = parser.parse_args()
+    save, baseline = (os.path.abspath(p) if p else None for p in (args.save, args.baseline))
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The loader, sparse index and caches keep state under relative
+        # paths; run in a scratch directory so the repo's are untouched.
+        os.environ.update({"EMBEDDING_CACHE": "0", "TRACE_LOG": "0"})
+        os.chdir(tmp)
+        import embedding
+        from benchmarks.fakes import install_fake_encoder, install_fake_gemini, install_fake_pinecone
+
+        if not args.real_model:
+            install_fake_encoder()
+        embedding.warm_up()
+        install_fake_pinecone([INDEX_NAME], rtt_ms=args.rtt_ms)
+        install_fake_gemini(args.llm_first_token_ms, args.llm_token_ms)
+
+        docs, ingest_result = ingest(args, os.path.join(tmp, "corpus.jsonl"))
+        results = []
+        for users in args.users:
+            r = run_users(users, args.queries, docs, args.seed)
+            results.append(r)
+            print(f"\n{users} users: {r['queries']} queries, {r['qps']:.1f} queries/s, peak RSS {r['peak_rss_mb']:.0f} MB")
+            print(format_row("end to end", r["latency"]))
+            for name, stats in sorted(r["stages"].items(), key=lambda kv: -kv[1]["p50"]):
+                print(format_row(f"  {name}", stats))
+        os.chdir(cwd)
+
+    report = {"docs": args.docs, "rtt_ms": args.rtt_ms, "ingest": ingest_result, "query": results}
+    if save:
+        with open(save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved results to {save}")
+    if baseline and not compare(results, baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# app/bots.py
+import os
+
+from connectors import DEFAULT_BACKEND
+
+DEFAULT_BOTS = {
+    "customer_service": {
+        "display_name": "Customer Service",
+        "db_type": DEFAULT_BACKEND,
+        "index_name": os.getenv("PINECONE_INDEX_CUSTOMER_SERVICE", "multi-chatbot-dense"),
+        "model": "mistralai/Mistral-7B-Instruct-v0.2",
+        "persona": "Empathetic, helpful, patient tone.",
+        "prompt_template": "You are a customer support assistant. Use only retrieved documents to answer clearly and politely."
+    },
+
+    "ecommerce": {
+        "display_name": "E-commerce",
+        "db_type": DEFAULT_BACKEND,
+        "index_name": os.getenv("PINECONE_INDEX_ECOMMERCE", "ecommerce"),
+        "model": "meta-llama/Meta-Llama-3-8B-Instruct",
+        "persona": "Sales-oriented, friendly, highlight deals and recommendations.",
+        "prompt_template": "You are a shopping assistant. Use only product documents and pricing information."
+    },
+
+    "saas": {
+        "display_name": "SaaS Platforms",
+        "db_type": DEFAULT_BACKEND,
+        "index_name": os.getenv("PINECONE_INDEX_SAAS", "saas"),
+        "model": "Qwen/Qwen2.5-7B-Instruct",
+        "persona": "Technical, step-by-step, precise.",
+        "prompt_template": "You are a SaaS support engineer. Use runbooks and troubleshooting documents only."
+    },
+
+    "internal": {
+        "display_name": "Internal Teams",
+        "db_type": DEFAULT_BACKEND,
+        "index_name": os.getenv("PINECONE_INDEX_INTERNAL", "internal"),
+        "model": "microsoft/Phi-3-medium-4k-instruct",
+        "persona": "Formal, concise, security-conscious.",
+        "prompt_template": "You assist internal teams. Use only internal memos and policies."
+    }
+}
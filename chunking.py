@@ -0,0 +1,109 @@
+# app/chunking.py
+import os
+from typing import Dict, List, Optional, Tuple
+
+from utils import simple_tokenize_sentences
+
+# MiniLM truncates input at 256 word pieces (and was trained on 128), so
+# whole documents are split into sentence windows of at most this many
+# words. CHUNK_MAX_WORDS=0 disables chunking: one vector per document.
+CHUNK_MAX_WORDS = int(os.getenv("CHUNK_MAX_WORDS", "100"))
+CHUNK_OVERLAP_SENTENCES = int(os.getenv("CHUNK_OVERLAP_SENTENCES", "1"))
+# Chunk hits fetched per document asked for, so grouping still fills top_k.
+CHUNK_QUERY_FACTOR = 3
+
+CHUNK_ID_SEPARATOR = "#"
+
+
+def chunking_key(max_words: int = CHUNK_MAX_WORDS, overlap: int = CHUNK_OVERLAP_SENTENCES) -> str:
+    """Identifies the chunking settings; part of the index manifest fingerprint."""
+    return f"chunks:{max_words}:{overlap}" if max_words > 0 else "chunks:off"
+
+
+def _split_long_sentence(sentence: str, max_words: int) -> List[str]:
+    words = sentence.split()
+    return [" ".join(words[i:i + max_words]) for i in range(0, len(words), max_words)]
+
+
+def chunk_text(text: str, max_words: int = CHUNK_MAX_WORDS, overlap: int = CHUNK_OVERLAP_SENTENCES) -> List[str]:
+    """
+    Split text into windows of whole sentences with at most `max_words` words.
+    Consecutive windows share their last/first `overlap` sentences; a sentence
+    longer than a window is cut into word windows of its own.
+    """
+    if max_words <= 0:
+        return [text]
+    sentences = []
+    for sentence in simple_tokenize_sentences(text):
+        if len(sentence.split()) > max_words:
+            sentences.extend(_split_long_sentence(sentence, max_words))
+        else:
+            sentences.append(sentence)
+    if not sentences:
+        return [text]
+
+    counts = [len(s.split()) for s in sentences]
+    chunks = []
+    start = 0
+    while start < len(sentences):
+        end, words = start, 0
+        while end < len(sentences) and (end == start or words + counts[end] <= max_words):
+            words += counts[end]
+            end += 1
+        chunks.append(" ".join(sentences[start:end]))
+        if end >= len(sentences):
+            break
+        # Step back `overlap` sentences, but always move forward.
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def chunk_document(doc: Dict, max_words: int = CHUNK_MAX_WORDS, overlap: int = CHUNK_OVERLAP_SENTENCES) -> List[Dict]:
+    """
+    Passages of one {"id", "title", "text"} document, each with the parent id
+    and its position. Chunk ids are "<doc id>#<n>"; with chunking disabled the
+    single passage keeps the document id.
+    """
+    doc_id = doc.get("id")
+    texts = chunk_text(doc.get("text", ""), max_words, overlap)
+    chunks = []
+    for i, text in enumerate(texts):
+        chunk_id = doc_id if max_words <= 0 else f"{doc_id}{CHUNK_ID_SEPARATOR}{i}"
+        chunks.append({
+            "id": chunk_id,
+            "title": doc.get("title", ""),
+            "text": text,
+            "parent_id": doc_id,
+            "chunk": i,
+        })
+    return chunks
+
+
+def group_by_parent(results: List[Tuple[float, Dict]], top_k: Optional[int] = None) -> List[Tuple[float, Dict]]:
+    """
+    Merge chunk hits (score, chunk) into one (score, doc) per parent document.
+    The score is the best chunk's; `text` holds only the matched passages in
+    document order and `passages` the chunk dicts themselves. Hits from
+    indexes built without chunking pass through as their own parent.
+    """
+    groups = {}
+    for score, chunk in results:
+        parent_id = chunk.get("parent_id") or chunk.get("id")
+        group = groups.get(parent_id)
+        if group is None:
+            groups[parent_id] = group = {"score": score, "title": chunk.get("title", ""), "passages": []}
+        elif score is not None and (group["score"] is None or score > group["score"]):
+            group["score"] = score
+        group["passages"].append(chunk)
+
+    merged = []
+    for parent_id, group in groups.items():
+        passages = sorted(group["passages"], key=lambda c: c.get("chunk", 0))
+        merged.append((group["score"], {
+            "id": parent_id,
+            "title": group["title"],
+            "text": " ".join(p.get("text", "") for p in passages),
+            "passages": passages,
+        }))
+    merged.sort(key=lambda item: item[0] if item[0] is not None else float("-inf"), reverse=True)
+    return merged[:top_k] if top_k else merged
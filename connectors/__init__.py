@@ -0,0 +1,36 @@
+# app/connectors/__init__.py
+import os
+from typing import Callable, NamedTuple
+
+# Backend used when a bot or the loader does not name one (see DEFAULT_BOTS "db_type").
+DEFAULT_BACKEND = os.getenv("VECTOR_BACKEND", "Pinecone")
+
+
+class VectorBackend(NamedTuple):
+    """The three operations the loaders and the query path need from a vector store."""
+    name: str
+    upsert_batch: Callable    # (index_name, [(id, vector, metadata), ...])
+    query_index: Callable     # (index_name, vectors, top_k) -> [(score, {id, title, text})]
+    delete_from_index: Callable  # (index_name, [id, ...])
+
+
+def get_backend(db_type=None) -> VectorBackend:
+    """Resolve a backend by name; modules are imported on first use."""
+    db_type = (db_type or DEFAULT_BACKEND).lower()
+    if db_type == "pinecone":
+        from connectors import pinecone_client
+        return VectorBackend(
+            "Pinecone",
+            pinecone_client.pinecone_upsert_batch,
+            pinecone_client.pinecone_query_index,
+            pinecone_client.pinecone_delete_from_index,
+        )
+    if db_type == "local":
+        from connectors import local_index
+        return VectorBackend(
+            "Local",
+            local_index.local_upsert_batch,
+            local_index.local_query_index,
+            local_index.local_delete_from_index,
+        )
+    raise ValueError(f"Unknown vector backend: {db_type}")
@@ -0,0 +1,138 @@
+# app/connectors/doc_store.py
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from connectors.file_lock import WriterLock
+
+
+class DocStore:
+    """
+    id -> metadata (title, text, sentence index, ...) in an append-only JSON
+    Lines file. Only the byte offset of each id's latest record is held in
+    memory; records are read back for the hits a query returns. A later
+    record for the same id replaces the earlier one, and deletes are
+    appended as {"delete": [ids]} until `compact()` rewrites the file.
+    Writes hold a cross-process WriterLock; only a holder truncates a torn
+    tail, other processes stop reading before it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._writer = WriterLock(path + ".lock")
+        self._offsets: Dict[str, int] = {}
+        self._size = 0  # bytes read, to notice other writers
+        self._reader = None
+        self._load()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._offsets
+
+    def _load(self):
+        self._offsets = {}
+        self._size = 0
+        if self._reader is not None:
+            # The file may have been replaced by a compaction since it was opened.
+            self._reader.close()
+            self._reader = None
+        if not os.path.exists(self.path):
+            return
+        # Without the writer lock another process may be mid-append.
+        repair = self._writer.acquire(blocking=False)
+        try:
+            self._read(repair)
+        finally:
+            if repair:
+                self._writer.release()
+
+    def _read(self, repair):
+        good_bytes = 0
+        with open(self.path, "r+b" if repair else "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete line")
+                    entry = json.loads(line)
+                except ValueError:
+                    if repair:
+                        # Torn write at the tail from a crashed writer: cut it so
+                        # later appends start on a clean line.
+                        f.truncate(good_bytes)
+                    break
+                if "delete" in entry:
+                    for doc_id in entry["delete"]:
+                        self._offsets.pop(doc_id, None)
+                else:
+                    self._offsets[entry["id"]] = good_bytes
+                good_bytes += len(line)
+        self._size = good_bytes
+
+    def _catch_up(self):
+        # Under the writer lock: re-read what another process appended since.
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size != self._size:
+            self._load()
+
+    def _append(self, entries: List[Dict]) -> List[int]:
+        with open(self.path, "ab") as f:
+            offset = f.tell()
+            offsets = []
+            for entry in entries:
+                line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+                f.write(line)
+                offsets.append(offset)
+                offset += len(line)
+            self._size = f.tell()
+        return offsets
+
+    def put_many(self, items: Iterable[Tuple[str, Dict]]):
+        """Store [(id, metadata), ...]; an existing id is replaced."""
+        entries = [{"id": doc_id, **(metadata or {})} for doc_id, metadata in items]
+        if not entries:
+            return
+        with self._lock, self._writer:
+            self._catch_up()
+            for entry, offset in zip(entries, self._append(entries)):
+                self._offsets[entry["id"]] = offset
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        """The metadata stored for an id (without the id), or None."""
+        with self._lock:
+            offset = self._offsets.get(doc_id)
+            if offset is None:
+                return None
+            if self._reader is None:
+                self._reader = open(self.path, "rb")
+            self._reader.seek(offset)
+            entry = json.loads(self._reader.readline())
+        entry.pop("id", None)
+        return entry
+
+    def delete(self, doc_ids: Iterable[str]):
+        with self._lock, self._writer:
+            self._catch_up()
+            doc_ids = [doc_id for doc_id in doc_ids if doc_id in self._offsets]
+            if not doc_ids:
+                return
+            self._append([{"delete": doc_ids}])
+            for doc_id in doc_ids:
+                del self._offsets[doc_id]
+
+    def compact(self):
+        """Rewrite the file with the latest record of every stored id."""
+        with self._lock, self._writer:
+            self._catch_up()
+            live = [(doc_id, self.get(doc_id)) for doc_id in sorted(self._offsets, key=self._offsets.get)]
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write("".join(json.dumps({"id": i, **m}, ensure_ascii=False) + "\n" for i, m in live))
+            os.replace(tmp, self.path)
+            self._load()
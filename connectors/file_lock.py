@@ -0,0 +1,57 @@
+# app/connectors/file_lock.py
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: no cross-process lock, every open may repair
+    fcntl = None
+
+
+class WriterLock:
+    """
+    Exclusive cross-process lock (flock) on a lock file, held by a process
+    while it writes an append-only store. Only a holder may truncate torn
+    tails: a process that opens the store while another one holds the lock
+    may be looking at a write in progress and must skip the tail in memory.
+    Reentrant within one instance.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+        self._depth = 0
+        self._lock = threading.RLock()
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Take the lock; with blocking=False, return False instead of waiting for another process."""
+        if not self._lock.acquire(blocking):
+            return False
+        if self._depth == 0 and fcntl is not None:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except OSError:
+                os.close(fd)
+                self._lock.release()
+                if blocking:
+                    raise
+                return False
+            self._fd = fd
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+
+    def __enter__(self) -> "WriterLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
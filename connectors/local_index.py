@@ -0,0 +1,486 @@
+# app/connectors/local_index.py
+import atexit
+import json
+import os
+import threading
+
+import numpy as np
+
+from answer_cache import read_index_stamp
+from connectors.doc_store import DocStore
+from connectors.file_lock import WriterLock
+from connectors.vector_codecs import Float16Codec, ProductQuantizer
+from tracing import traced
+
+try:
+    import hnswlib
+except ImportError:  # optional: brute force is used for every corpus size
+    hnswlib = None
+
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "local_index")
+DIMENSION = 384  # all-MiniLM-L6-v2
+# Corpora with at least this many live vectors are served from an HNSW graph.
+HNSW_THRESHOLD = int(os.getenv("LOCAL_INDEX_HNSW_THRESHOLD", "20000"))
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+# What the brute-force scan reads (HNSW search always uses the float32 rows):
+#   float32  the full-precision vectors (exact, default)
+#   float16  a half-precision copy, half the memory (about 10x slower to scan:
+#            NumPy converts it to float32 block by block)
+#   pq       product-quantised codes, LOCAL_INDEX_PQ_SUBVECTORS bytes per vector
+# With compact codes the float32 file stays on disk and only the
+# LOCAL_INDEX_RESCORE_CANDIDATES best approximate rows are read back from it
+# to re-score them exactly (0 returns the approximate ranking).
+VECTOR_STORAGE = os.getenv("LOCAL_INDEX_VECTORS", "float32")
+STORAGES = ("float32", "float16", "pq")
+RESCORE_CANDIDATES = int(os.getenv("LOCAL_INDEX_RESCORE_CANDIDATES", "100"))
+PQ_SUBVECTORS = int(os.getenv("LOCAL_INDEX_PQ_SUBVECTORS", "48"))
+# Smaller indexes are scanned in float32 until there is enough data to train PQ on.
+PQ_TRAIN_MIN = int(os.getenv("LOCAL_INDEX_PQ_TRAIN_MIN", "2000"))
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class LocalVectorIndex:
+    """
+    On-disk cosine index for one collection.
+
+    Vectors are appended to a raw float32 file that is memory-mapped for search,
+    optionally shadowed by compact float16 / PQ codes (see VECTOR_STORAGE).
+    Row ids live in an append-only JSON Lines log replayed on load; metadata
+    is kept once in a DocStore by id and only read for returned hits.
+    Overwritten or deleted rows become tombstones until `compact()`.
+    """
+
+    def __init__(
+        self,
+        path,
+        dimension=DIMENSION,
+        hnsw_threshold=HNSW_THRESHOLD,
+        storage=VECTOR_STORAGE,
+        rescore_candidates=RESCORE_CANDIDATES,
+        pq_subvectors=PQ_SUBVECTORS,
+        pq_train_min=PQ_TRAIN_MIN,
+    ):
+        if storage not in STORAGES:
+            raise ValueError(f"Unknown local index vector storage {storage!r}; expected one of {STORAGES}")
+        self.path = path
+        self.dimension = dimension
+        self.hnsw_threshold = hnsw_threshold
+        self.storage = storage
+        self.rescore_candidates = rescore_candidates
+        self.pq_subvectors = pq_subvectors
+        self.pq_train_min = pq_train_min
+        self._lock = threading.RLock()
+        self._ids = []        # row -> doc id
+        self._row_of = {}     # doc id -> live row
+        self._live = np.zeros(0, dtype=bool)
+        self._matrix = np.zeros((0, dimension), dtype=np.float32)
+        self._mapped_rows = 0
+        self._codec = None
+        self._codes = None    # row -> compact code, aligned with _matrix
+        self._hnsw = None
+        self._hnsw_dirty = False
+        self._log_bytes = 0   # size of the log as read, to notice other writers
+        os.makedirs(path, exist_ok=True)
+        # Held while writing; only a holder repairs torn tails (see file_lock.py).
+        self._writer = WriterLock(os.path.join(path, "writer.lock"))
+        self._docs = DocStore(os.path.join(path, "docs.jsonl"))
+        self._load()
+
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.path, "vectors.f32")
+
+    @property
+    def _log_path(self):
+        return os.path.join(self.path, "rows.jsonl")
+
+    @property
+    def _hnsw_path(self):
+        return os.path.join(self.path, "hnsw.bin")
+
+    @property
+    def _codes_path(self):
+        return os.path.join(self.path, f"codes.{self.storage}")
+
+    @property
+    def _pq_path(self):
+        return os.path.join(self.path, "pq_centroids.npy")
+
+    def __len__(self):
+        return len(self._row_of)
+
+    def _load(self):
+        # Without the writer lock another process may be mid-append: read up
+        # to the last complete line and leave the files alone.
+        repair = self._writer.acquire(blocking=False)
+        try:
+            self._read_files(repair)
+        finally:
+            if repair:
+                self._writer.release()
+        self._load_hnsw()
+
+    def _read_files(self, repair):
+        # Metadata written inline by older versions of the log, moved to the doc store below.
+        inline = {}
+        good_bytes = 0
+        if os.path.exists(self._log_path):
+            with open(self._log_path, "r+b" if repair else "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("incomplete line")
+                        entry = json.loads(line)
+                    except ValueError:
+                        if repair:
+                            # Torn write at the tail of the log from a crashed
+                            # writer: cut it so later appends start on a clean line.
+                            f.truncate(good_bytes)
+                        break
+                    good_bytes += len(line)
+                    if entry.get("deleted"):
+                        doc_id = self._ids[entry["row"]]
+                        if self._row_of.get(doc_id) == entry["row"]:
+                            del self._row_of[doc_id]
+                        continue
+                    row = len(self._ids)
+                    self._ids.append(entry["id"])
+                    if "metadata" in entry:
+                        inline[row] = entry["metadata"]
+                    self._row_of[entry["id"]] = row
+        self._log_bytes = good_bytes
+        rows = len(self._ids)
+        live = np.zeros(rows, dtype=bool)
+        live[list(self._row_of.values())] = True
+        self._live = live
+        self._docs.put_many(
+            (doc_id, inline[row]) for doc_id, row in self._row_of.items()
+            if row in inline and doc_id not in self._docs
+        )
+        # Vector rows without a log entry are a crashed batch (dropped) or one
+        # still being written (not mapped).
+        if repair and os.path.exists(self._vectors_path) and os.path.getsize(self._vectors_path) > rows * self._row_bytes:
+            with open(self._vectors_path, "r+b") as f:
+                f.truncate(rows * self._row_bytes)
+        self._remap()
+        self._sync_codes()
+
+    @property
+    def _row_bytes(self):
+        return self.dimension * 4
+
+    def _catch_up(self):
+        """Under the writer lock: reload when another process wrote since this one read the files."""
+        log_size = os.path.getsize(self._log_path) if os.path.exists(self._log_path) else 0
+        vectors_size = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        if log_size != self._log_bytes or vectors_size != len(self._ids) * self._row_bytes:
+            self._reset()
+            self._load()
+
+    def _reset(self):
+        self._ids, self._row_of = [], {}
+        self._live = np.zeros(0, dtype=bool)
+        self._matrix = np.zeros((0, self.dimension), dtype=np.float32)
+        self._mapped_rows = 0
+        self._codec = None
+        self._codes = None
+        self._hnsw = None
+        self._hnsw_dirty = False
+
+    def _remap(self):
+        rows = len(self._ids)
+        if rows == self._mapped_rows:
+            return
+        self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dimension))
+        self._mapped_rows = rows
+
+    def _sync_codes(self):
+        """Encode float32 rows that have no compact code yet, training PQ once there is enough data."""
+        if self.storage == "float32":
+            return
+        with self._writer:
+            self._write_codes()
+
+    def _write_codes(self):
+        rows = len(self._ids)
+        if self._codec is None:
+            if self.storage == "float16":
+                self._codec = Float16Codec(self.dimension)
+            elif os.path.exists(self._pq_path):
+                self._codec = ProductQuantizer.load(self._pq_path)
+            elif len(self) >= self.pq_train_min:
+                self._codec = ProductQuantizer.train(np.asarray(self._matrix[self._live]), self.pq_subvectors)
+                self._codec.save(self._pq_path)
+                if os.path.exists(self._codes_path):
+                    os.remove(self._codes_path)
+            else:
+                return
+        row_bytes = self._codec.row_bytes
+        size = os.path.getsize(self._codes_path) if os.path.exists(self._codes_path) else 0
+        if size % row_bytes:
+            # Half a row from a crash. Whole rows past ours were encoded by a
+            # process that has read more of the log, and are kept.
+            with open(self._codes_path, "r+b") as f:
+                f.truncate(size - size % row_bytes)
+        encoded = min(size // row_bytes, rows)
+        if encoded < rows:
+            with open(self._codes_path, "ab") as f:
+                for start in range(encoded, rows, 65536):
+                    f.write(self._codec.encode(np.asarray(self._matrix[start:min(rows, start + 65536)])).tobytes())
+        self._codes = np.memmap(
+            self._codes_path, dtype=self._codec.dtype, mode="r", shape=(rows, self._codec.width),
+        ) if rows else None
+
+    def _hnsw_meta(self):
+        # A graph saved before later upserts or deletes no longer matches the log.
+        return {"rows": len(self._ids), "tombstones": len(self._ids) - len(self)}
+
+    def _load_hnsw(self):
+        if hnswlib is None or len(self) < self.hnsw_threshold:
+            return
+        meta_path = self._hnsw_path + ".json"
+        if os.path.exists(self._hnsw_path) and os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                if json.load(f) == self._hnsw_meta():
+                    index = hnswlib.Index(space="ip", dim=self.dimension)
+                    index.load_index(self._hnsw_path, max_elements=max(len(self._ids), 1))
+                    index.set_ef(HNSW_EF_SEARCH)
+                    self._hnsw = index
+                    return
+        self._build_hnsw()
+
+    def _build_hnsw(self):
+        rows = np.flatnonzero(self._live)
+        index = hnswlib.Index(space="ip", dim=self.dimension)
+        index.init_index(
+            max_elements=max(len(self._ids) * 2, 1024),
+            ef_construction=HNSW_EF_CONSTRUCTION,
+            M=HNSW_M,
+            allow_replace_deleted=False,
+        )
+        index.set_ef(HNSW_EF_SEARCH)
+        if len(rows):
+            index.add_items(np.asarray(self._matrix[rows]), rows)
+        self._hnsw = index
+        self._hnsw_dirty = True
+
+    def upsert(self, items):
+        """Insert or overwrite (id, vector, metadata) tuples."""
+        if not items:
+            return
+        vectors = _normalize([v for _, v, _ in items])
+        with self._lock, self._writer:
+            self._catch_up()
+            start = len(self._ids)
+            lines = []
+            replaced = []
+            for offset, (doc_id, _, metadata) in enumerate(items):
+                old = self._row_of.get(doc_id)
+                if old is not None:
+                    replaced.append(old)
+                    lines.append({"row": old, "deleted": True})
+                lines.append({"id": doc_id})
+                self._row_of[doc_id] = start + offset
+            # Documents, then vectors, then the log: a crash before the log
+            # write leaves extra rows that `_load` truncates, never log entries
+            # pointing at missing vectors.
+            self._docs.put_many((doc_id, metadata) for doc_id, _, metadata in items)
+            with open(self._vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+            self._append_log(lines)
+
+            self._ids.extend(doc_id for doc_id, _, _ in items)
+            live = np.ones(len(self._ids), dtype=bool)
+            live[:start] = self._live
+            live[replaced] = False
+            self._live = live
+            self._remap()
+            self._sync_codes()
+
+            if self._hnsw is not None:
+                if len(self._ids) > self._hnsw.get_max_elements():
+                    self._hnsw.resize_index(len(self._ids) * 2)
+                self._hnsw.add_items(vectors, np.arange(start, len(self._ids)))
+                for row in replaced:
+                    self._hnsw.mark_deleted(row)
+                self._hnsw_dirty = True
+            elif hnswlib is not None and len(self) >= self.hnsw_threshold:
+                self._build_hnsw()
+
+    def delete(self, doc_ids):
+        with self._lock, self._writer:
+            self._catch_up()
+            rows = [self._row_of.pop(doc_id) for doc_id in doc_ids if doc_id in self._row_of]
+            if not rows:
+                return
+            self._append_log([{"row": row, "deleted": True} for row in rows])
+            self._docs.delete(doc_ids)
+            self._live[rows] = False
+            if self._hnsw is not None:
+                for row in rows:
+                    self._hnsw.mark_deleted(row)
+                self._hnsw_dirty = True
+
+    def _append_log(self, entries):
+        with open(self._log_path, "ab") as f:
+            f.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries).encode("utf-8"))
+            self._log_bytes = f.tell()
+
+    def query(self, vector, top_k=4):
+        """Return [(score, {id, title, text}), ...] best first, like pinecone_query_index."""
+        q = _normalize(vector)[0]
+        with self._lock:
+            live_count = len(self)
+            if not live_count:
+                return []
+            k = min(top_k, live_count)
+            if self._hnsw is not None:
+                rows, scores = self._search_hnsw(q, k, live_count)
+            elif self._codes is not None:
+                rows, scores = self._scan_codes(q, k, live_count)
+            else:
+                scores = self._matrix @ q
+                scores = np.where(self._live, scores, -np.inf)
+                rows = np.argpartition(-scores, k - 1)[:k]
+                rows = rows[np.argsort(-scores[rows])]
+                scores = scores[rows]
+            return [self._result(int(row), float(score)) for row, score in zip(rows, scores)]
+
+    def _search_hnsw(self, q, k, live_count):
+        # Only live rows are returned, over-fetching when the graph still holds
+        # rows deleted since it was built (deleted rows are never resurrected).
+        fetch = k
+        while True:
+            labels, distances = self._hnsw.knn_query(q, k=fetch)
+            rows, scores = labels[0].astype(np.intp), 1.0 - distances[0]
+            alive = self._live[rows]
+            if alive.sum() >= k or fetch >= live_count:
+                return rows[alive][:k], scores[alive][:k]
+            fetch = min(fetch * 2, live_count)
+
+    def _scan_codes(self, q, k, live_count):
+        approx = self._codec.scores(self._codes, q)
+        approx[~self._live] = -np.inf
+        n = min(max(k, self.rescore_candidates), live_count)
+        rows = np.argpartition(-approx, n - 1)[:n]
+        if self.rescore_candidates:
+            rows.sort()  # read the float32 rows in file order
+            scores = self._read_vectors(rows) @ q
+        else:
+            scores = approx[rows]
+        best = np.argsort(-scores)[:k]
+        return rows[best], scores[best]
+
+    def _read_vectors(self, rows):
+        # Plain reads rather than the memory map, so the rows touched for
+        # re-scoring do not stay mapped into this process.
+        out = np.empty((len(rows), self.dimension), dtype=np.float32)
+        row_bytes = self.dimension * 4
+        with open(self._vectors_path, "rb") as f:
+            for i, row in enumerate(rows):
+                f.seek(int(row) * row_bytes)
+                f.readinto(out[i])
+        return out
+
+    def metadata(self, doc_id):
+        """Stored metadata of a live id, or None."""
+        return self._docs.get(doc_id) if doc_id in self._row_of else None
+
+    def _result(self, row, score):
+        meta = self._docs.get(self._ids[row]) or {}
+        doc = {
+            'id': self._ids[row],
+            'title': meta.get('title', ''),
+            'text': meta.get('text', '')
+        }
+        for key in ('sentence_index', 'parent_id', 'chunk'):
+            if meta.get(key) is not None:
+                doc[key] = meta[key]
+        return (score, doc)
+
+    def flush(self):
+        """Persist the HNSW graph; vectors and the row log are written eagerly."""
+        with self._lock:
+            if self._hnsw is not None and self._hnsw_dirty:
+                self._hnsw.save_index(self._hnsw_path)
+                with open(self._hnsw_path + ".json", "w", encoding="utf-8") as f:
+                    json.dump(self._hnsw_meta(), f)
+                self._hnsw_dirty = False
+
+    def compact(self):
+        """Rewrite the files without tombstoned rows."""
+        with self._lock, self._writer:
+            self._catch_up()
+            rows = np.flatnonzero(self._live)
+            vectors = np.asarray(self._matrix[rows])
+            entries = [{"id": self._ids[r]} for r in rows]
+            self._matrix = np.zeros((0, self.dimension), dtype=np.float32)
+            self._mapped_rows = 0
+            self._codes = None
+            with open(self._vectors_path + ".tmp", "wb") as f:
+                f.write(vectors.tobytes())
+            with open(self._log_path + ".tmp", "w", encoding="utf-8") as f:
+                f.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries))
+            os.replace(self._vectors_path + ".tmp", self._vectors_path)
+            os.replace(self._log_path + ".tmp", self._log_path)
+            self._docs.compact()
+            # Codes are rebuilt from the new rows (and PQ re-trained on them).
+            stale_files = [self._hnsw_path, self._hnsw_path + ".json", self._pq_path]
+            stale_files += [os.path.join(self.path, f"codes.{storage}") for storage in STORAGES]
+            for stale in stale_files:
+                if os.path.exists(stale):
+                    os.remove(stale)
+            self._reset()
+            self._load()
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_local_index(index_name):
+    """
+    Open (once per process) the local index stored under LOCAL_INDEX_DIR.
+    Reopened when the index is reloaded by another process (see answer_cache stamps),
+    like the BM25 index that shadows it.
+    """
+    stamp = read_index_stamp("Local", index_name)
+    with _indexes_lock:
+        index, seen = _indexes.get(index_name, (None, None))
+        if index is None or seen != stamp:
+            if index is not None:
+                index.flush()
+            index = LocalVectorIndex(os.path.join(LOCAL_INDEX_DIR, index_name))
+        _indexes[index_name] = (index, stamp)
+        return index
+
+def local_upsert_batch(index_name, vectors):
+    """Upsert a list of (id, vector, metadata) tuples"""
+    get_local_index(index_name).upsert(vectors)
+
+def local_delete_from_index(index_name, doc_ids):
+    """Delete vectors by id"""
+    get_local_index(index_name).delete(doc_ids)
+
+@traced("local.query")
+def local_query_index(index_name, vectors, top_k=4):
+    """Query a local index; same return shape as pinecone_query_index"""
+    try:
+        return get_local_index(index_name).query(vectors, top_k=top_k)
+    except Exception as e:
+        print(f"Local index query error: {e}")
+        return []
+
+@atexit.register
+def _flush_all():
+    for index, _ in list(_indexes.values()):
+        index.flush()
@@ -1,70 +1,162 @@
 # app/connectors/pinecone_client.py
 import os
+import threading
+import time
+from collections import defaultdict
 from dotenv import load_dotenv
+
+from tracing import traced
+
 load_dotenv()
-import streamlit as st
-try:
-    PINECONE_API_KEY = st.secrets["pinecone"]["api_key"]
-except:
-    PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-
-try:
-    from pinecone import Pinecone, ServerlessSpec
-    pc = Pinecone(api_key=PINECONE_API_KEY) if PINECONE_API_KEY else None
-    print(f"DEBUG: Pinecone client initialized")
-except Exception as e:
-    print(f"DEBUG: Failed to initialize Pinecone: {e}")
-    pc = None
 
-def get_or_create_index(index_name):
-    """Get or create a Pinecone index"""
+# The Pinecone SDK is imported and the client built on first use; assigning a
+# stand-in to `pc` (as the benchmarks do) bypasses that.
+pc = None
+_client_lock = threading.Lock()
+
+def _api_key():
+    key = os.getenv("PINECONE_API_KEY")
+    if key:
+        return key
+    try:
+        import streamlit as st
+        return st.secrets["pinecone"]["api_key"]
+    except Exception:
+        return None
+
+def get_client():
+    """Return the process-wide Pinecone client, creating it on first call"""
+    global pc
     if pc is None:
+        with _client_lock:
+            if pc is None:
+                try:
+                    from pinecone import Pinecone
+                    api_key = _api_key()
+                    pc = Pinecone(api_key=api_key) if api_key else None
+                    print(f"DEBUG: Pinecone client initialized")
+                except Exception as e:
+                    print(f"DEBUG: Failed to initialize Pinecone: {e}")
+    return pc
+
+# Index handles are cached per process so the query and upsert paths only
+# touch the data plane; the control plane is consulted once per index per TTL.
+INDEX_HANDLE_TTL = float(os.getenv("PINECONE_INDEX_HANDLE_TTL", "3600"))
+INDEX_POOL_THREADS = int(os.getenv("PINECONE_POOL_THREADS", "8"))
+
+_index_handles = {}  # index_name -> (Index, resolved_at)
+_index_lock = threading.Lock()
+_control_plane_calls = defaultdict(int)
+
+def _count_control_plane(index_name):
+    _control_plane_calls[index_name] += 1
+
+def control_plane_stats():
+    """Number of control-plane calls made per index in this process"""
+    return dict(_control_plane_calls)
+
+def invalidate_index_handle(index_name=None):
+    """Drop one cached index handle, or all of them when no name is given"""
+    with _index_lock:
+        if index_name is None:
+            _index_handles.clear()
+        else:
+            _index_handles.pop(index_name, None)
+
+def get_or_create_index(index_name):
+    """Get or create a Pinecone index, reusing a cached handle when possible"""
+    client = get_client()
+    if client is None:
         raise Exception("Pinecone not initialized")
-    
-    existing_indexes = [idx.name for idx in pc.list_indexes()]
-    
-    if index_name not in existing_indexes:
-        print(f"Creating index: {index_name}")
-        pc.create_index(
-            name=index_name,
-            dimension=384,  # all-MiniLM-L6-v2
-            metric="cosine",
-            spec=ServerlessSpec(cloud="aws", region="us-east-1")
-        )
-        import time
-        time.sleep(10)
-    
-    return pc.Index(index_name)
+
+    cached = _index_handles.get(index_name)
+    if cached and time.monotonic() - cached[1] < INDEX_HANDLE_TTL:
+        return cached[0]
+
+    with _index_lock:
+        cached = _index_handles.get(index_name)
+        if cached and time.monotonic() - cached[1] < INDEX_HANDLE_TTL:
+            return cached[0]
+
+        _count_control_plane(index_name)
+        hosts = {idx.name: idx.host for idx in client.list_indexes()}
+
+        if index_name not in hosts:
+            print(f"Creating index: {index_name}")
+            _count_control_plane(index_name)
+            from pinecone import ServerlessSpec
+            client.create_index(
+                name=index_name,
+                dimension=384,  # all-MiniLM-L6-v2
+                metric="cosine",
+                spec=ServerlessSpec(cloud="aws", region="us-east-1")
+            )
+            time.sleep(10)
+
+        # Passing the host from list_indexes skips the describe_index lookup
+        # Index() would otherwise make; the handle keeps its own HTTP connection
+        # pool for data-plane requests.
+        if hosts.get(index_name):
+            index = client.Index(index_name, host=hosts[index_name], pool_threads=INDEX_POOL_THREADS)
+        else:
+            _count_control_plane(index_name)
+            index = client.Index(index_name, pool_threads=INDEX_POOL_THREADS)
+        _index_handles[index_name] = (index, time.monotonic())
+        return index
 
 def pinecone_upsert_to_index(index_name, doc_id, vector, metadata):
     """Upsert document to specific index"""
+    pinecone_upsert_batch(index_name, [(doc_id, vector, metadata)])
+    print(f"✓ Added {doc_id} to index {index_name}")
+
+def _as_list(vector):
+    # The SDK serialises plain lists; NumPy rows are converted only here, at the boundary.
+    return vector.tolist() if hasattr(vector, "tolist") else vector
+
+def pinecone_upsert_batch(index_name, vectors):
+    """Upsert a list of (id, vector, metadata) tuples in one request"""
     try:
         index = get_or_create_index(index_name)
-        index.upsert(vectors=[(doc_id, vector, metadata)])
-        print(f"✓ Added {doc_id} to index {index_name}")
+        index.upsert(vectors=[(doc_id, _as_list(vector), metadata) for doc_id, vector, metadata in vectors])
     except Exception as e:
+        invalidate_index_handle(index_name)
         raise Exception(f"Pinecone upsert error: {e}")
 
+def pinecone_delete_from_index(index_name, doc_ids, batch_size=1000):
+    """Delete vectors by id, in requests of at most `batch_size` ids"""
+    try:
+        index = get_or_create_index(index_name)
+        for start in range(0, len(doc_ids), batch_size):
+            index.delete(ids=list(doc_ids[start:start + batch_size]))
+    except Exception as e:
+        invalidate_index_handle(index_name)
+        raise Exception(f"Pinecone delete error: {e}")
+
+@traced("pinecone.query")
 def pinecone_query_index(index_name, vectors, top_k=4):
     """Query specific Pinecone index"""
     try:
         index = get_or_create_index(index_name)
         results = index.query(
-            vector=vectors,
+            vector=_as_list(vectors),
             top_k=top_k,
             include_metadata=True
         )
         
         retrieved = []
         for match in results.matches:
-            retrieved.append((match.score, {
+            doc = {
                 'id': match.id,
                 'title': match.metadata.get('title', ''),
                 'text': match.metadata.get('text', '')
-            }))
+            }
+            for key in ('sentence_index', 'parent_id', 'chunk'):
+                if match.metadata.get(key) is not None:
+                    doc[key] = match.metadata[key]
+            retrieved.append((match.score, doc))
         
         return retrieved
     except Exception as e:
+        invalidate_index_handle(index_name)
         print(f"Pinecone query error: {e}")
         return []
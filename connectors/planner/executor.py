@@ -1,23 +1,83 @@
 # app/planner/executor.py
-from typing import List, Tuple, Dict
-from utils import best_sentences_for_query
-from google.generativeai import GenerativeModel
+import math
+import re
+import time
+from typing import Iterator, List, NamedTuple, Tuple, Dict
+from llm_cache import get_llm_cache, llm_cache_key
+from tracing import current_trace, span
+from utils import ranked_sentences
 from dotenv import load_dotenv
 import os
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-def execute_plan(plan: List[str], retrieved_docs: List[Tuple[float, Dict]], query: str) -> Dict:
-    # Use top docs (score descending) to build a grounded answer
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+# Budget (estimated tokens) for the "Extracted Information" part of the prompt.
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", "800"))
+# Candidate sentences taken from each retrieved document.
+PROMPT_SENTENCES_PER_DOC = int(os.getenv("PROMPT_SENTENCES_PER_DOC", "4"))
+# Sentences sharing at least this share of their words with a chosen one are dropped.
+NEAR_DUPLICATE_OVERLAP = 0.8
+
+_WORD = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for English text)."""
+    return math.ceil(len(text) / 4)
+
+
+class PromptContext(NamedTuple):
+    parts: List[str]        # sentences for the prompt, most relevant first
+    passage_ids: List[str]  # passages of the documents they were taken from
+    citations: List[str]    # titles of those documents
+    tokens: int             # estimated tokens of `parts`
+
+
+def select_context(
+    retrieved_docs: List[Tuple[float, Dict]],
+    query: str,
+    budget_tokens: int = PROMPT_CONTEXT_TOKENS,
+) -> PromptContext:
+    """
+    Fill the context budget with the best sentences of the retrieved docs.
+    Candidates are ranked by their rank within their document, then by the
+    document's score, so every document contributes its best sentence before
+    any contributes a second; sentences with no query overlap come last.
+    Exact and near duplicates are skipped, as are sentences that no longer
+    fit the budget (a shorter later one still may).
+    """
     used = [ (s,d) for s,d in retrieved_docs if s is not None ]
-    used = sorted(used, key=lambda x: x[0], reverse=True)[:3]
-    parts = []
-    citations = []
-    for score, doc in used:
-        parts.extend(best_sentences_for_query(doc.get("text",""), query, k=2))
+    used = sorted(used, key=lambda x: x[0], reverse=True)
+    candidates = []
+    for doc_rank, (_, doc) in enumerate(used):
+        # Grouped chunk hits carry only their matched passages.
+        passages = doc.get("passages") or [doc]
+        for rank, (score, sentence) in enumerate(ranked_sentences(passages, query, k=PROMPT_SENTENCES_PER_DOC)):
+            candidates.append((score <= 0, rank, doc_rank, sentence))
+    candidates.sort(key=lambda c: c[:3])
+
+    parts, chosen_words, doc_ranks, tokens = [], [], set(), 0
+    for _, _, doc_rank, sentence in candidates:
+        cost = estimate_tokens(sentence) + 1
+        if tokens + cost > budget_tokens:
+            continue
+        words = set(_WORD.findall(sentence.lower()))
+        if any(len(words & other) >= NEAR_DUPLICATE_OVERLAP * max(len(words), len(other), 1) for other in chosen_words):
+            continue
+        parts.append(sentence)
+        chosen_words.append(words)
+        doc_ranks.add(doc_rank)
+        tokens += cost
+
+    passage_ids, citations = [], []
+    for doc_rank in sorted(doc_ranks):
+        doc = used[doc_rank][1]
+        passage_ids.extend(p.get("id", "") for p in (doc.get("passages") or [doc]))
         citations.append(doc.get("title","(untitled)"))
-    answer = " ".join(parts).strip() or "I couldn't extract a concise answer from the documents."
-    #use gemini llm to refine answer based on plan
-    llm_prompt = f"""You are an expert assistant. Based on the following plan and extracted information, provide a concise and accurate answer to the user's query.
+    return PromptContext(parts, passage_ids, citations, tokens)
+
+def build_prompt(plan: List[str], parts: List[str], query: str) -> str:
+    return f"""You are an expert assistant. Based on the following plan and extracted information, provide a concise and accurate answer to the user's query.
 Plan:
 {', '.join(plan)}
 Extracted Information:
@@ -27,15 +87,61 @@ User Query:
 Provide the final answer below:
 Final Answer:
 """
-    # Here you would call the Gemini LLM API with llm_prompt to get the refined answer
-
-    model = GenerativeModel('gemini-2.0-flash')
-    response = model.generate_content(llm_prompt)
-    refined_answer = response.text
-    return {"answer": refined_answer, "citations": citations}
 
+def _gemini():
+    # Imported here so loading the app does not pay for the Gemini SDK up front.
+    from google.generativeai import GenerativeModel
+    return GenerativeModel(GEMINI_MODEL)
 
+def execute_plan(plan: List[str], retrieved_docs: List[Tuple[float, Dict]], query: str) -> Dict:
+    # Use top docs (score descending) to build a grounded answer
+    context = select_context(retrieved_docs, query)
+    answer = " ".join(context.parts).strip() or "I couldn't extract a concise answer from the documents."
+    #use gemini llm to refine answer based on plan
+    llm_prompt = build_prompt(plan, context.parts, query)
+    cache = get_llm_cache()
+    key = llm_cache_key(GEMINI_MODEL, plan, context.passage_ids, query, context.parts)
+    cached = cache.get(key) if cache else None
+    if cached is not None:
+        return {"answer": cached, "citations": context.citations, "cached": True}
+    t0 = time.perf_counter()
+    with span("gemini.generate", prompt_tokens=estimate_tokens(llm_prompt)):
+        response = _gemini().generate_content(llm_prompt)
+        refined_answer = response.text
+    if cache:
+        cache.put(key, refined_answer, time.perf_counter() - t0, estimate_tokens(llm_prompt))
+    return {"answer": refined_answer, "citations": context.citations}
 
+def stream_plan(plan: List[str], retrieved_docs: List[Tuple[float, Dict]], query: str) -> Tuple[Iterator[str], List[str]]:
+    """Like execute_plan, but returns (iterator of answer text chunks as Gemini produces them, citations)"""
+    context = select_context(retrieved_docs, query)
+    prompt = build_prompt(plan, context.parts, query)
+    trace = current_trace()
+    cache = get_llm_cache()
+    key = llm_cache_key(GEMINI_MODEL, plan, context.passage_ids, query, context.parts)
+    cached = cache.get(key) if cache else None
+    if cached is not None:
+        if trace is not None:
+            trace.attrs["llm_cache"] = "hit"
+        return iter([cached]), context.citations
 
+    t0 = time.perf_counter()
+    with span("gemini.request", prompt_tokens=estimate_tokens(prompt)):
+        response = _gemini().generate_content(prompt, stream=True)
 
+    # The chunks may be consumed on another thread, so the trace is passed along.
+    def chunks():
+        texts = []
+        with span("gemini.stream", in_trace=trace) as attrs:
+            attrs["chunks"] = 0
+            for chunk in response:
+                text = getattr(chunk, "text", "")
+                if text:
+                    attrs["chunks"] += 1
+                    texts.append(text)
+                    yield text
+        # Only a response streamed to the end is cached.
+        if cache:
+            cache.put(key, "".join(texts), time.perf_counter() - t0, estimate_tokens(prompt))
 
+    return chunks(), context.citations
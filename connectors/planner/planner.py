@@ -1,4 +1,8 @@
 # app/planner/planner.py
+from tracing import traced
+
+
+@traced("plan")
 def plan_steps_for_query(query: str):
     steps = []
     steps.append("Retrieve relevant documents from the active chatbot's database.")
@@ -0,0 +1,390 @@
+# app/connectors/sparse_index.py
+import atexit
+import base64
+import json
+import os
+import threading
+
+import numpy as np
+
+from answer_cache import read_index_stamp
+from connectors.doc_store import DocStore
+from tracing import traced
+from utils import BM25_B, BM25_K1, hash_tokens
+
+SPARSE_INDEX_DIR = os.getenv("SPARSE_INDEX_DIR", "sparse_index")
+# Build the BM25 index during ingestion (and use it for hybrid search).
+SPARSE_INDEX_ENABLED = os.getenv("SPARSE_INDEX", "1") != "0"
+# Appended postings are merged into the sorted arrays once there are this many.
+MERGE_THRESHOLD = 200_000
+# save() rewrites the document log once more than this share of rows is dead.
+COMPACT_DEAD_FRACTION = 0.5
+
+_TF_MAX = np.iinfo(np.uint16).max
+
+
+def _term_counts(text):
+    ids = np.asarray(hash_tokens(text), dtype=np.uint32)
+    if not len(ids):
+        return ids, np.zeros(0, dtype=np.uint16), 0
+    terms, counts = np.unique(ids, return_counts=True)
+    return terms, np.minimum(counts, _TF_MAX).astype(np.uint16), len(ids)
+
+
+def _entry_counts(entry):
+    """(terms, tfs, length) of a log entry; older logs stored the passage itself."""
+    if "terms" not in entry:
+        return _term_counts(entry.get("title", "") + " " + entry.get("text", ""))
+    terms = np.frombuffer(base64.b64decode(entry["terms"]), dtype=np.uint32)
+    tfs = np.frombuffer(base64.b64decode(entry["tfs"]), dtype=np.uint16)
+    return terms, tfs, entry["len"]
+
+
+def _log_entry(doc_id, terms, tfs, length):
+    return {
+        "id": doc_id,
+        "len": int(length),
+        "terms": base64.b64encode(terms.tobytes()).decode("ascii"),
+        "tfs": base64.b64encode(tfs.tobytes()).decode("ascii"),
+    }
+
+
+class BM25Index:
+    """
+    Okapi BM25 over passages, kept next to a dense index under the same ids.
+
+    Postings live in flat arrays sorted by term (crc32 token id): posting j
+    is (rows[j], tfs[j]) and the postings of terms[i] are ptr[i]:ptr[i + 1].
+    Added documents collect in a small unsorted tail that is merged in before
+    the next query. The JSON Lines log holds only each passage's term counts
+    (adds and deletes are the source of truth; `save()` snapshots the arrays
+    and later log entries are replayed on load). Titles and texts of the hits
+    returned are looked up by id: `lookup` reads them from the dense index's
+    doc store where there is one, otherwise the index keeps its own DocStore.
+    """
+
+    def __init__(self, path, lookup=None):
+        self.path = path
+        self._lock = threading.RLock()
+        self._reader = None
+        os.makedirs(path, exist_ok=True)
+        self._docs = DocStore(os.path.join(path, "metadata.jsonl")) if lookup is None else None
+        self._lookup = lookup or self._docs.get
+        self._reset()
+        self._load()
+
+    def _reset(self):
+        self._ids = []          # row -> id
+        self._row_of = {}       # id -> live row
+        self._doc_len = np.zeros(0, dtype=np.uint32)
+        self._offsets = np.zeros(0, dtype=np.int64)  # row -> byte offset in the log
+        self._live = np.zeros(0, dtype=bool)
+        self._live_len_sum = 0
+        self._terms = np.zeros(0, dtype=np.uint32)
+        self._ptr = np.zeros(1, dtype=np.int64)
+        self._rows = np.zeros(0, dtype=np.int32)
+        self._tfs = np.zeros(0, dtype=np.uint16)
+        self._tail = []         # [(terms, tfs, row), ...] not merged yet
+        self._tail_postings = 0
+        self._dirty = False
+
+    @property
+    def _log_path(self):
+        return os.path.join(self.path, "docs.jsonl")
+
+    @property
+    def _snapshot_path(self):
+        return os.path.join(self.path, "postings.npz")
+
+    def __len__(self):
+        return len(self._row_of)
+
+    # -- loading ---------------------------------------------------------
+
+    def _load(self):
+        log_start = 0
+        if os.path.exists(self._snapshot_path):
+            with np.load(self._snapshot_path, allow_pickle=False) as snap:
+                self._ids = snap["ids"].tolist()
+                self._doc_len = snap["doc_len"]
+                self._offsets = snap["offsets"]
+                self._live = snap["live"]
+                self._terms, self._ptr = snap["terms"], snap["ptr"]
+                self._rows, self._tfs = snap["rows"], snap["tfs"]
+                log_start = int(snap["log_size"])
+            self._row_of = {self._ids[r]: r for r in np.flatnonzero(self._live)}
+            self._live_len_sum = int(self._doc_len[self._live].sum())
+        if os.path.exists(self._log_path):
+            self._replay(log_start)
+        if self._legacy_log():
+            self.compact()
+
+    def _legacy_log(self):
+        # Logs written before term counts were logged repeat every passage's metadata.
+        if not os.path.exists(self._log_path):
+            return False
+        with open(self._log_path, "rb") as f:
+            first = f.readline()
+        try:
+            entry = json.loads(first)
+        except ValueError:
+            return False
+        return "id" in entry and "terms" not in entry
+
+    def _replay(self, start):
+        good_bytes = start
+        with open(self._log_path, "r+b") as f:
+            f.seek(start)
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete line")
+                    entry = json.loads(line)
+                except ValueError:
+                    f.truncate(good_bytes)
+                    break
+                if "delete" in entry:
+                    self._delete_rows(entry["delete"])
+                else:
+                    self._add_row(entry["id"], *_entry_counts(entry), good_bytes)
+                good_bytes += len(line)
+
+    # -- updates ---------------------------------------------------------
+
+    def _grow(self, rows):
+        if rows <= len(self._live):
+            return
+        capacity = max(rows, 2 * len(self._live), 1024)
+        self._doc_len = np.resize(self._doc_len, capacity)
+        self._offsets = np.resize(self._offsets, capacity)
+        live = np.zeros(capacity, dtype=bool)
+        live[:len(self._live)] = self._live
+        self._live = live
+
+    def _add_row(self, doc_id, terms, tfs, length, offset):
+        old = self._row_of.get(doc_id)
+        if old is not None:
+            self._kill(old)
+        row = len(self._ids)
+        self._grow(row + 1)
+        self._ids.append(doc_id)
+        self._row_of[doc_id] = row
+        self._doc_len[row] = length
+        self._offsets[row] = offset
+        self._live[row] = True
+        self._live_len_sum += length
+        self._tail.append((terms, tfs, row))
+        self._tail_postings += len(terms)
+        self._dirty = True
+
+    def _kill(self, row):
+        if self._live[row]:
+            self._live[row] = False
+            self._live_len_sum -= int(self._doc_len[row])
+            self._dirty = True
+
+    def _delete_rows(self, doc_ids):
+        for doc_id in doc_ids:
+            row = self._row_of.pop(doc_id, None)
+            if row is not None:
+                self._kill(row)
+
+    def _append_log(self, entries):
+        with open(self._log_path, "ab") as f:
+            offset = f.tell()
+            offsets = []
+            for entry in entries:
+                line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+                f.write(line)
+                offsets.append(offset)
+                offset += len(line)
+        return offsets
+
+    def add(self, items):
+        """Index [(id, metadata), ...]; an existing id is replaced"""
+        items = list(items)
+        counts = [
+            (doc_id, *_term_counts(metadata.get("title", "") + " " + metadata.get("text", "")))
+            for doc_id, metadata in items
+        ]
+        with self._lock:
+            if self._docs is not None:
+                self._docs.put_many(items)
+            offsets = self._append_log([_log_entry(*c) for c in counts])
+            for c, offset in zip(counts, offsets):
+                self._add_row(*c, offset)
+            if self._tail_postings >= MERGE_THRESHOLD:
+                self._merge()
+
+    def delete(self, doc_ids):
+        doc_ids = list(doc_ids)
+        with self._lock:
+            self._append_log([{"delete": doc_ids}])
+            self._delete_rows(doc_ids)
+            if self._docs is not None:
+                self._docs.delete(doc_ids)
+
+    def _merge(self):
+        """Fold the tail into the sorted posting arrays."""
+        if not self._tail:
+            return
+        tail_terms = np.concatenate([t for t, _, _ in self._tail])
+        tail_tfs = np.concatenate([f for _, f, _ in self._tail])
+        tail_rows = np.concatenate([np.full(len(t), r, dtype=np.int32) for t, _, r in self._tail])
+        all_terms = np.concatenate([np.repeat(self._terms, np.diff(self._ptr)), tail_terms])
+        # Tail rows are newer than every existing row, so a stable sort by
+        # term keeps postings of each term in row order.
+        order = np.argsort(all_terms, kind="stable")
+        all_terms = all_terms[order]
+        self._rows = np.concatenate([self._rows, tail_rows])[order]
+        self._tfs = np.concatenate([self._tfs, tail_tfs])[order]
+        self._terms, starts = np.unique(all_terms, return_index=True)
+        self._ptr = np.append(starts, len(all_terms)).astype(np.int64)
+        self._tail = []
+        self._tail_postings = 0
+
+    # -- search ----------------------------------------------------------
+
+    def _read_doc(self, row):
+        if self._reader is None:
+            self._reader = open(self._log_path, "rb")
+        self._reader.seek(int(self._offsets[row]))
+        return json.loads(self._reader.readline())
+
+    def query(self, text, top_k=4):
+        """Return [(bm25 score, {id, title, text, ...}), ...] best first, like the dense backends"""
+        q_terms = np.unique(np.asarray(hash_tokens(text), dtype=np.uint32))
+        with self._lock:
+            self._merge()
+            n_live = len(self)
+            if not n_live or not len(q_terms):
+                return []
+            avgdl = max(self._live_len_sum / n_live, 1e-9)
+            scores = np.zeros(len(self._ids), dtype=np.float32)
+            found = np.searchsorted(self._terms, q_terms)
+            for term, i in zip(q_terms, found):
+                if i >= len(self._terms) or self._terms[i] != term:
+                    continue
+                rows = self._rows[self._ptr[i]:self._ptr[i + 1]]
+                tfs = self._tfs[self._ptr[i]:self._ptr[i + 1]]
+                alive = self._live[rows]
+                rows, tfs = rows[alive], tfs[alive].astype(np.float32)
+                if not len(rows):
+                    continue
+                df = len(rows)
+                idf = np.log(1 + (n_live - df + 0.5) / (df + 0.5))
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_len[rows] / avgdl)
+                scores[rows] += idf * tfs * (BM25_K1 + 1) / (tfs + norm)
+            hits = np.flatnonzero(scores > 0)
+            if not len(hits):
+                return []
+            k = min(top_k, len(hits))
+            best = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+            best = best[np.argsort(-scores[best], kind="stable")]
+            ranked = [(self._ids[row], float(scores[row])) for row in best]
+        results = []
+        for doc_id, score in ranked:
+            meta = self._lookup(doc_id)
+            if meta is None:
+                continue  # no longer in the doc store (deleted from the dense index)
+            doc = {"id": doc_id, "title": meta.get("title", ""), "text": meta.get("text", "")}
+            for key in ("sentence_index", "parent_id", "chunk"):
+                if meta.get(key) is not None:
+                    doc[key] = meta[key]
+            results.append((score, doc))
+        return results
+
+    # -- persistence -----------------------------------------------------
+
+    def save(self):
+        """Snapshot the posting arrays; compacts the log first when mostly dead"""
+        with self._lock:
+            rows = len(self._ids)
+            if rows and len(self) < (1 - COMPACT_DEAD_FRACTION) * rows:
+                self.compact()
+                return
+            if not self._dirty:
+                return
+            self._merge()
+            log_size = os.path.getsize(self._log_path) if os.path.exists(self._log_path) else 0
+            tmp = self._snapshot_path + ".tmp.npz"
+            np.savez(
+                tmp,
+                ids=np.asarray(self._ids, dtype=str),
+                doc_len=self._doc_len[:rows],
+                offsets=self._offsets[:rows],
+                live=self._live[:rows],
+                terms=self._terms,
+                ptr=self._ptr,
+                rows=self._rows,
+                tfs=self._tfs,
+                log_size=np.int64(log_size),
+            )
+            os.replace(tmp, self._snapshot_path)
+            self._dirty = False
+
+    def compact(self):
+        """Rewrite the log and arrays with live documents only (and older logs as term counts)"""
+        with self._lock:
+            live_docs = [self._read_doc(row) for row in sorted(self._row_of.values())]
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+            if self._docs is not None:
+                # Passages of an older log move to the doc store.
+                self._docs.put_many(
+                    (d["id"], {k: v for k, v in d.items() if k != "id"})
+                    for d in live_docs if "terms" not in d and d["id"] not in self._docs
+                )
+                self._docs.compact()
+            counts = [(d["id"], *_entry_counts(d)) for d in live_docs]
+            del live_docs
+            for stale in (self._log_path, self._snapshot_path):
+                if os.path.exists(stale):
+                    os.remove(stale)
+            self._reset()
+            for c, offset in zip(counts, self._append_log([_log_entry(*c) for c in counts])):
+                self._add_row(*c, offset)
+            self._dirty = True
+            self.save()
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def _dense_lookup(backend, index_name):
+    """Metadata by id from the dense index's own doc store, when the backend keeps one locally."""
+    if backend.lower() != "local":
+        return None
+    from connectors.local_index import get_local_index
+    return lambda doc_id: get_local_index(index_name).metadata(doc_id)
+
+def get_sparse_index(backend, index_name):
+    """
+    Open (once per process) the BM25 index that shadows `index_name` on `backend`.
+    Reopened when the index is reloaded by another process (see answer_cache stamps).
+    """
+    key = f"{backend.lower()}-{index_name}"
+    stamp = read_index_stamp(backend, index_name)
+    with _indexes_lock:
+        index, seen = _indexes.get(key, (None, None))
+        if index is None or (seen != stamp and not index._dirty):
+            index = BM25Index(os.path.join(SPARSE_INDEX_DIR, key), lookup=_dense_lookup(backend, index_name))
+        _indexes[key] = (index, stamp)
+        return index
+
+@traced("bm25.query")
+def sparse_query_index(backend, index_name, query, top_k=4):
+    """BM25 hits for a text query; empty when no sparse index was built"""
+    if not os.path.exists(os.path.join(SPARSE_INDEX_DIR, f"{backend.lower()}-{index_name}")):
+        return []
+    try:
+        return get_sparse_index(backend, index_name).query(query, top_k=top_k)
+    except Exception as e:
+        print(f"Sparse index query error: {e}")
+        return []
+
+@atexit.register
+def _save_all():
+    for index, _ in list(_indexes.values()):
+        index.save()
@@ -0,0 +1,113 @@
+# app/connectors/vector_codecs.py
+"""
+Compact encodings of unit vectors for the local index's brute-force scan.
+Float16Codec keeps a half-precision copy (2 bytes per dimension);
+ProductQuantizer splits a vector into `subvectors` slices and stores the id
+of the nearest of 256 trained centroids per slice (1 byte per slice, 48 bytes
+instead of 1536 for MiniLM). Both give approximate inner products; the index
+re-scores its best candidates with the float32 vectors.
+"""
+import numpy as np
+
+# Rows decoded / looked up per step, which bounds the temporary arrays of a scan.
+SCAN_BLOCK = 512
+
+
+class Float16Codec:
+    name = "float16"
+    dtype = np.float16
+
+    def __init__(self, dimension):
+        self.width = dimension  # code columns per vector
+
+    @property
+    def row_bytes(self):
+        return self.width * 2
+
+    def encode(self, vectors):
+        return np.asarray(vectors, dtype=np.float32).astype(np.float16)
+
+    def scores(self, codes, q):
+        """Inner products of the query with every encoded row."""
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCAN_BLOCK):
+            out[start:start + SCAN_BLOCK] = codes[start:start + SCAN_BLOCK].astype(np.float32) @ q
+        return out
+
+
+class ProductQuantizer:
+    """Per-slice k-means codebooks: centroids has shape (subvectors, centroids, slice width)."""
+
+    name = "pq"
+    dtype = np.uint8
+
+    def __init__(self, centroids):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.width, self.n_centroids, self.sub_dim = self.centroids.shape
+
+    @property
+    def row_bytes(self):
+        return self.width
+
+    @classmethod
+    def train(cls, vectors, subvectors, n_centroids=256, iterations=12, sample=10000, seed=0):
+        """Fit the codebooks with Lloyd's k-means on (a sample of) `vectors`."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n, dimension = vectors.shape
+        if dimension % subvectors:
+            raise ValueError(f"Dimension {dimension} is not divisible into {subvectors} subvectors")
+        rng = np.random.default_rng(seed)
+        if n > sample:
+            vectors = vectors[rng.choice(n, sample, replace=False)]
+            n = sample
+        k = min(n_centroids, n)
+        sub_dim = dimension // subvectors
+        centroids = np.empty((subvectors, k, sub_dim), dtype=np.float32)
+        for m in range(subvectors):
+            x = vectors[:, m * sub_dim:(m + 1) * sub_dim]
+            c = x[rng.choice(n, k, replace=False)].copy()
+            for _ in range(iterations):
+                assign = _nearest(x, c)
+                counts = np.bincount(assign, minlength=k)
+                sums = np.stack([np.bincount(assign, weights=x[:, j], minlength=k) for j in range(sub_dim)], axis=1)
+                filled = counts > 0
+                c[filled] = sums[filled] / counts[filled, None]
+                # Re-seed empty clusters with random points.
+                c[~filled] = x[rng.choice(n, int((~filled).sum()))]
+            centroids[m] = c
+        return cls(centroids)
+
+    def encode(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        codes = np.empty((len(vectors), self.width), dtype=np.uint8)
+        for m in range(self.width):
+            x = vectors[:, m * self.sub_dim:(m + 1) * self.sub_dim]
+            codes[:, m] = _nearest(x, self.centroids[m])
+        return codes
+
+    def scores(self, codes, q):
+        """Asymmetric inner products: the query against every row's centroids, via one lookup table."""
+        table = np.einsum("mkd,md->mk", self.centroids, q.reshape(self.width, self.sub_dim)).ravel()
+        base = np.arange(self.width, dtype=np.intp) * self.n_centroids
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCAN_BLOCK):
+            block = codes[start:start + SCAN_BLOCK].astype(np.intp) + base
+            out[start:start + SCAN_BLOCK] = table[block].sum(axis=1)
+        return out
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.save(f, self.centroids)
+
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(path))
+
+
+def _nearest(x, centroids):
+    # argmin ||x - c||^2 = argmax (x.c - ||c||^2 / 2), in blocks to bound memory.
+    half_norms = 0.5 * (centroids ** 2).sum(axis=1)
+    out = np.empty(len(x), dtype=np.intp)
+    for start in range(0, len(x), SCAN_BLOCK):
+        out[start:start + SCAN_BLOCK] = np.argmax(x[start:start + SCAN_BLOCK] @ centroids.T - half_norms, axis=1)
+    return out
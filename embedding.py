@@ -1,18 +1,102 @@
 # app/embedding.py
 import os
-from sentence_transformers import SentenceTransformer
+import threading
 from typing import List
 
-# Initialize the embedding model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+import numpy as np
+
+from embedding_backends import DEFAULT_BACKEND, load_encoder
+from embedding_cache import DEFAULT_CACHE_PATH, EmbeddingCache
+from tracing import traced
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", DEFAULT_BACKEND)
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 = library default
+# Identifies the vectors this process produces: quantised backends give slightly
+# different embeddings, so they must not share cache entries or manifests.
+MODEL_KEY = MODEL_NAME if EMBEDDING_BACKEND == DEFAULT_BACKEND else f"{MODEL_NAME}:{EMBEDDING_BACKEND}"
+
+# The model (and torch behind it) is loaded on first use rather than at import,
+# so scripts and Streamlit workers only pay for it when they embed something.
+# One instance is shared by every caller in the process.
+_model = None
+_cache = None
+_cache_loaded = False
+_load_lock = threading.Lock()
+
+def get_model():
+    """Return the shared encoder for EMBEDDING_BACKEND, loading it on first call"""
+    global _model
+    if _model is None:
+        with _load_lock:
+            if _model is None:
+                _model = load_encoder(MODEL_NAME, EMBEDDING_BACKEND, EMBEDDING_THREADS)
+    return _model
+
+def _get_cache():
+    # Persistent embedding cache shared by the loaders and the query path.
+    # Set EMBEDDING_CACHE=0 to disable it.
+    global _cache, _cache_loaded
+    if not _cache_loaded:
+        with _load_lock:
+            if not _cache_loaded and os.getenv("EMBEDDING_CACHE", "1") != "0":
+                _cache = EmbeddingCache(
+                    path=os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH),
+                    memory_items=int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "10000")),
+                    max_rows=int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "500000")),
+                )
+            _cache_loaded = True
+    return _cache
+
+def warm_up():
+    """Load the model and run one forward pass so the first real query is fast"""
+    get_model().encode(["warm up"])
+    _get_cache()
+
+@traced("embed")
+def embed_array(texts: List[str], normalize: bool = False) -> np.ndarray:
+    """
+    Generate embeddings as one C-contiguous float32 array
+    Args:
+        texts: List of strings
+        normalize: scale every row to unit L2 norm (in place, no extra copy)
+    Returns:
+        Array of shape (len(texts), dimension)
+    """
+    cache = _get_cache()
+    if cache is None:
+        out = np.ascontiguousarray(get_model().encode(texts), dtype=np.float32)
+    else:
+        vectors = cache.get_many(MODEL_KEY, texts)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            # Encode each distinct uncached text once.
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            encoded = get_model().encode(unique)
+            cache.put_many(MODEL_KEY, unique, encoded)
+            row_of = {text: row for row, text in enumerate(unique)}
+            for i in missing:
+                vectors[i] = encoded[row_of[texts[i]]]
+        if not vectors:
+            return np.zeros((0, 0), dtype=np.float32)
+        out = np.empty((len(vectors), len(vectors[0])), dtype=np.float32)
+        for row, vector in enumerate(vectors):
+            out[row] = vector
+    if normalize and len(out):
+        out /= np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+    return out
 
 def embed_texts(texts: List[str]):
     """
-    Generate embeddings for a list of texts using sentence-transformers
+    Generate embeddings for a list of texts with the configured backend
     Args:
         texts: List of strings
     Returns:
         List of embedding vectors
     """
-    embeddings = model.encode(texts, convert_to_numpy=True)
-    return embeddings.tolist()
+    return embed_array(texts).tolist()
+
+def cache_stats():
+    """Hit/miss counters of the embedding cache (empty when disabled)"""
+    cache = _get_cache()
+    return cache.stats() if cache is not None else {}
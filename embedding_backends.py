@@ -0,0 +1,148 @@
+# app/embedding_backends.py
+import json
+import os
+from typing import List
+
+import numpy as np
+
+# EMBEDDING_BACKEND selects how MiniLM runs:
+#   torch       full-precision sentence-transformers model (default)
+#   torch-int8  same model with dynamic int8 quantisation of the Linear layers
+#   onnx        ONNX Runtime on an exported copy of the model
+#   onnx-int8   ONNX Runtime on a dynamically int8-quantised export
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+DEFAULT_BACKEND = "torch"
+ONNX_EXPORT_DIR = os.getenv("ONNX_EXPORT_DIR", ".onnx_models")
+ENCODE_BATCH_SIZE = 32
+
+
+def _set_torch_threads(threads):
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+
+class TorchEncoder:
+    """sentence-transformers model, optionally with int8 dynamic quantisation."""
+
+    def __init__(self, model_name: str, quantize: bool = False, threads: int = 0):
+        from sentence_transformers import SentenceTransformer
+
+        _set_torch_threads(threads)
+        self.model = SentenceTransformer(model_name, device="cpu")
+        if quantize:
+            import torch
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def encode(self, texts: List[str], batch_size: int = ENCODE_BATCH_SIZE) -> np.ndarray:
+        return self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True).astype(np.float32, copy=False)
+
+
+class OnnxEncoder:
+    """
+    MiniLM on ONNX Runtime: tokenizer + exported transformer + mean pooling
+    (+ L2 normalisation when the sentence-transformers pipeline has it).
+    The first run exports the model with torch; later runs need only
+    onnxruntime and the tokenizer saved next to the export.
+    """
+
+    def __init__(self, model_name: str, quantize: bool = False, threads: int = 0):
+        try:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError(
+                f"The onnx embedding backends need onnxruntime and transformers "
+                f"(pip install onnxruntime transformers): {e}"
+            ) from e
+
+        export_dir = os.path.join(ONNX_EXPORT_DIR, model_name.replace("/", "__"))
+        model_path = os.path.join(export_dir, "model.onnx")
+        if not os.path.exists(model_path):
+            export_onnx(model_name, export_dir)
+        if quantize:
+            quantized_path = os.path.join(export_dir, "model-int8.onnx")
+            if not os.path.exists(quantized_path):
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+                quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+            model_path = quantized_path
+
+        with open(os.path.join(export_dir, "pipeline.json"), "r", encoding="utf-8") as f:
+            pipeline = json.load(f)
+        self.max_seq_length = pipeline["max_seq_length"]
+        self.normalize = pipeline["normalize"]
+        self.tokenizer = AutoTokenizer.from_pretrained(export_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts: List[str], batch_size: int = ENCODE_BATCH_SIZE) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        # Length-sorted batches keep padding (and wasted FLOPs) small.
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        out = [None] * len(texts)
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            tokens = self.tokenizer(
+                [texts[i] for i in idx],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            feeds = {k: v.astype(np.int64) for k, v in tokens.items() if k in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.normalize:
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            for row, i in enumerate(idx):
+                out[i] = pooled[row]
+        return np.vstack(out).astype(np.float32, copy=False)
+
+
+def export_onnx(model_name: str, export_dir: str):
+    """Export the transformer of a sentence-transformers model to ONNX with dynamic shapes."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    os.makedirs(export_dir, exist_ok=True)
+
+    sample = st_model.tokenizer(["export sample"], return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    dynamic = {n: {0: "batch", 1: "sequence"} for n in names}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[n] for n in names),
+            os.path.join(export_dir, "model.onnx"),
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic,
+            opset_version=14,
+        )
+    st_model.tokenizer.save_pretrained(export_dir)
+    with open(os.path.join(export_dir, "pipeline.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "max_seq_length": st_model.max_seq_length,
+            "normalize": any(isinstance(m, Normalize) for m in st_model),
+        }, f)
+
+
+def load_encoder(model_name: str, backend: str = DEFAULT_BACKEND, threads: int = 0):
+    """Build the encoder for `backend`; every encoder has encode(texts) -> float32 array."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {BACKENDS}")
+    if backend.startswith("onnx"):
+        return OnnxEncoder(model_name, quantize=backend.endswith("int8"), threads=threads)
+    return TorchEncoder(model_name, quantize=backend.endswith("int8"), threads=threads)
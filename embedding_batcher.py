@@ -0,0 +1,145 @@
+# app/embedding_batcher.py
+"""
+Micro-batching of query embeddings across sessions. Each query needs one
+vector; encoding them one by one from several sessions runs concurrent
+batch-of-one forward passes that fight over the same CPU threads. Instead,
+callers from any thread hand their text to one shared worker, which waits at
+most EMBED_BATCH_MAX_WAIT_MS after the first request for more (up to
+EMBED_BATCH_MAX_SIZE) and encodes them with a single embed_array call.
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from embedding import embed_array
+from tracing import span
+
+EMBED_BATCHING = os.getenv("EMBED_BATCHING", "1") != "0"
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "3"))
+# Queueing delays kept for the percentile in stats().
+_DELAY_WINDOW = 1000
+
+
+class EmbeddingBatcher:
+    """One worker thread encoding the texts submitted from any thread in batches."""
+
+    def __init__(
+        self,
+        max_batch_size: int = EMBED_BATCH_MAX_SIZE,
+        max_wait_ms: float = EMBED_BATCH_MAX_WAIT_MS,
+        encode: Optional[Callable[[List[str]], np.ndarray]] = None,
+    ):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._encode = encode or embed_array
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._queue_seconds = 0.0
+        self._encode_seconds = 0.0
+        self._delays = deque(maxlen=_DELAY_WINDOW)
+
+    def submit(self, text: str) -> Future:
+        """Queue one text; the future resolves to its vector."""
+        future = Future()
+        self._queue.put((text, time.perf_counter(), future))
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                    self._worker.start()
+        return future
+
+    def embed(self, text: str, timeout: Optional[float] = None) -> np.ndarray:
+        return self.submit(text).result(timeout)
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = batch[0][1] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                # Past the deadline, still take whatever is already queued.
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [item for item in self._collect() if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                vectors = self._encode([text for text, _, _ in batch])
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+            for (_, _, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+            with self._lock:
+                self._requests += len(batch)
+                self._batches += 1
+                self._encode_seconds += finished - started
+                for _, submitted, _ in batch:
+                    self._queue_seconds += started - submitted
+                    self._delays.append(started - submitted)
+
+    def stats(self) -> Dict[str, float]:
+        """Requests, batches, average batch size and queueing/encode times in ms."""
+        with self._lock:
+            batches, requests = self._batches, self._requests
+            delays = np.asarray(self._delays)
+            queue_seconds, encode_seconds = self._queue_seconds, self._encode_seconds
+        return {
+            "requests": requests,
+            "batches": batches,
+            "avg_batch_size": requests / batches if batches else 0.0,
+            "avg_queue_ms": queue_seconds / requests * 1000 if requests else 0.0,
+            "p95_queue_ms": float(np.percentile(delays, 95)) * 1000 if len(delays) else 0.0,
+            "avg_encode_ms": encode_seconds / batches * 1000 if batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_embedding_batcher() -> EmbeddingBatcher:
+    """The process-wide batcher shared by every session."""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = EmbeddingBatcher()
+        return _batcher
+
+
+def embed_query(text: str) -> np.ndarray:
+    """One query vector, batched with concurrent callers (unless EMBED_BATCHING=0)."""
+    if not EMBED_BATCHING:
+        return embed_array([text])[0]
+    with span("embed", batched=True):
+        return get_embedding_batcher().embed(text)
+
+
+async def embed_query_async(text: str) -> np.ndarray:
+    """embed_query for coroutines: waits for the batch without blocking the event loop."""
+    if not EMBED_BATCHING:
+        return (await asyncio.to_thread(embed_array, [text]))[0]
+    with span("embed", batched=True):
+        return await asyncio.wrap_future(get_embedding_batcher().submit(text))
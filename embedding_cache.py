@@ -0,0 +1,158 @@
+# app/embedding_cache.py
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+DEFAULT_CACHE_PATH = os.path.join(".embedding_cache", "embeddings.sqlite3")
+DEFAULT_MEMORY_ITEMS = 10_000
+DEFAULT_MAX_ROWS = 500_000
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Whitespace/Unicode normalisation that does not change the model's tokens."""
+    return _WS.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding store: an in-memory LRU in front of SQLite.
+    Keys are sha256(model name + normalised text); vectors are float32 blobs.
+    The SQLite table is trimmed to `max_rows`, evicting the rows least recently
+    written or read from disk first (memory hits do not touch SQLite).
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        memory_items: int = DEFAULT_MEMORY_ITEMS,
+        max_rows: int = DEFAULT_MAX_ROWS,
+    ):
+        self.path = path
+        self.memory_items = memory_items
+        self.max_rows = max_rows
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Ingestion worker processes share the file; wait for each other's writes.
+        self._db = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model_name: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Return a cached vector or None for every text, in order."""
+        keys = [self.key(model_name, t) for t in texts]
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for k in keys:
+                if k in self._memory:
+                    self._memory.move_to_end(k)
+                    found[k] = self._memory[k]
+            missing = [k for k in dict.fromkeys(keys) if k not in found]
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for k, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    found[k] = vector
+                    self._remember(k, vector)
+                if rows:
+                    now = time.time()
+                    self._db.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(now, k) for k, _ in rows],
+                    )
+            if missing:
+                self._db.commit()
+
+            results = []
+            seen_disk = set(missing)
+            for k in keys:
+                vector = found.get(k)
+                if vector is None:
+                    self._stats["misses"] += 1
+                elif k in seen_disk:
+                    self._stats["disk_hits"] += 1
+                else:
+                    self._stats["memory_hits"] += 1
+                results.append(vector)
+        return results
+
+    def put_many(self, model_name: str, texts: Sequence[str], vectors: Sequence) -> None:
+        """Store vectors for texts, evicting stale rows past `max_rows`."""
+        now = time.time()
+        rows = {}
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                k = self.key(model_name, text)
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember(k, vector)
+                rows[k] = (k, vector.tobytes(), now)
+            if not rows:
+                return
+            if not self._db.in_transaction:
+                # Take the write lock up front so the count below stays exact until commit.
+                self._db.execute("BEGIN IMMEDIATE")
+            self._db.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                list(rows.values()),
+            )
+            # Other processes (e.g. ingestion workers) write to the same file, so
+            # count inside this write transaction rather than tracking it locally.
+            self._rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if self._rows > self.max_rows:
+                overflow = self._rows - self.max_rows
+                self._db.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    " SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                )
+                self._rows -= overflow
+                self._stats["evictions"] += overflow
+            self._db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        stats["memory_items"] = len(self._memory)
+        stats["disk_rows"] = self._rows
+        return stats
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM embeddings")
+            self._db.commit()
+            self._rows = 0
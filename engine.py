@@ -0,0 +1,258 @@
+# app/engine.py
+"""
+Headless query engine: plan → embed → retrieve → extract → generate for one
+bot (or every bot), independent of any UI. The Streamlit app drives it in
+process or, with QUERY_API_URL set, through the HTTP API in api.py, which
+serves it to any number of concurrent callers.
+
+A query is answered in two steps: `prepare()` (plan, embed, retrieve,
+re-rank, extract the grounded answer) and the optional streamed Gemini
+refinement, after which `finish()` caches the answer and closes the trace.
+`query_events()` / `events()` run both and yield the progress as events:
+
+    {"event": "plan", "steps": [...]}
+    {"event": "context", "status", "answer", "citations", "documents"}
+    {"event": "token", "text"}                       (refinement, repeated)
+    {"event": "error", "message"}                    (refinement failed)
+    {"event": "done", "status", "answer", "citations", "refined", "timings", ...}
+"""
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from answer_cache import get_answer_cache
+from bots import DEFAULT_BOTS
+from connectors.planner.executor import GOOGLE_API_KEY, stream_plan
+from embedding_batcher import get_embedding_batcher
+from llm_cache import get_llm_cache
+from pipeline import (
+    QueryTimings, aiter_in_thread, plan_and_embed, record_first_token, rerank_results, retrieve, search_all,
+)
+from rerank import RERANK_CANDIDATES, RERANK_ENABLED
+from tracing import Trace, current_trace, recent_traces, stage_percentiles, start_trace
+from utils import best_sentences_for_query
+
+TOP_K = 4
+ANSWER_SENTENCES = 3
+
+NO_RESULTS = "No documents returned from Pinecone."
+NO_TEXT = "Retrieved docs but couldn't find any 'text' fields."
+
+
+@dataclass
+class PreparedQuery:
+    """State of one query between retrieval and the end of generation."""
+    bot: str
+    query: str
+    all_bots: bool
+    trace: Trace
+    timings: QueryTimings = field(default_factory=QueryTimings)
+    # "ok", "cached" (answer cache hit), "no_results", "no_text" or "error"
+    status: str = "ok"
+    steps: List[str] = field(default_factory=list)
+    vector: Optional[np.ndarray] = None
+    retrieved: List[Tuple[float, Dict]] = field(default_factory=list)
+    answer: str = ""
+    citations: List[str] = field(default_factory=list)
+    refined: bool = False
+
+    def context_event(self) -> Dict:
+        return {
+            "event": "context",
+            "status": self.status,
+            "answer": self.answer,
+            "citations": self.citations,
+            "documents": [
+                {
+                    "id": doc.get("id"),
+                    "title": doc.get("title", ""),
+                    "score": None if score is None else float(score),
+                    "source": doc.get("source"),
+                }
+                for score, doc in self.retrieved
+            ],
+        }
+
+    def done_event(self) -> Dict:
+        t = self.timings
+        return {
+            "event": "done",
+            "status": self.status,
+            "answer": self.answer,
+            "citations": self.citations,
+            "refined": self.refined,
+            "timings": {
+                "plan": t.plan_seconds,
+                "embed": t.embed_seconds,
+                "retrieve": t.retrieve_seconds,
+                "first_token": t.first_token_seconds,
+                "total": t.since_start(),
+            },
+            "rerank": t.rerank.summary() if t.rerank is not None else None,
+            "trace_id": self.trace.id,
+        }
+
+
+class QueryEngine:
+    """Answers queries against the bots in `bots` (bot key -> {db_type, index_name, ...})."""
+
+    def __init__(self, bots: Optional[Dict[str, Dict]] = None):
+        self.bots = bots or DEFAULT_BOTS
+
+    def _bot(self, bot_key: str) -> Dict:
+        if bot_key not in self.bots:
+            raise KeyError(f"Unknown bot: {bot_key}")
+        return self.bots[bot_key]
+
+    def answer_cache(self, bot_key: str):
+        bot = self._bot(bot_key)
+        return get_answer_cache(bot_key, bot["db_type"], bot["index_name"])
+
+    def targets(self, bot_key: str, all_bots: bool = False) -> List[Tuple[str, str]]:
+        """(backend, index) pairs a query of this bot searches."""
+        bots = self.bots.values() if all_bots else [self._bot(bot_key)]
+        return list(dict.fromkeys((b["db_type"], b["index_name"]) for b in bots))
+
+    async def prepare(self, bot_key: str, query: str, all_bots: bool = False) -> PreparedQuery:
+        """Plan, embed, retrieve (or hit the answer cache), re-rank and extract the grounded answer."""
+        targets = self.targets(bot_key, all_bots)
+        trace = current_trace() or start_trace(bot_key, all_bots=all_bots)
+        p = PreparedQuery(bot=bot_key, query=query, all_bots=all_bots, trace=trace)
+        # With re-ranking, over-fetch candidates for the cross-encoder to reorder.
+        fetch_k = RERANK_CANDIDATES if RERANK_ENABLED else TOP_K
+        stage = "embedding"
+        try:
+            # Planning overlaps the query embedding; retrieval is skipped on a cache hit.
+            p.steps, p.vector = await plan_and_embed(query, p.timings)
+            stage = "retrieval"
+            if all_bots:
+                # The per-bot answer cache only covers the bot's own index.
+                results = await search_all(p.vector, targets, top_k=fetch_k, timings=p.timings, query=query)
+            else:
+                cached = self.answer_cache(bot_key).get(p.vector)
+                if cached is not None:
+                    p.status, p.answer, p.citations = "cached", cached["content"], cached["citations"]
+                    trace.attrs["answer_cache"] = "hit"
+                    return p
+                results = (await retrieve(p.vector, targets, top_k=fetch_k, timings=p.timings, query=query))[targets[0]]
+            if RERANK_ENABLED:
+                stage = "re-ranking"
+                results = await rerank_results(query, results, top_k=TOP_K, timings=p.timings)
+        except Exception as e:
+            p.status, p.answer = "error", f"{stage.capitalize()} error: {e}"
+            trace.attrs["error_stage"] = stage
+            return p
+
+        p.retrieved = results
+        # Grouped chunk hits carry their matched passages, whose precomputed
+        # sentence index is reused.
+        passages = [
+            passage for _, doc in results for passage in (doc.get("passages") or [doc])
+            if isinstance(passage.get("text"), str) and passage["text"].strip()
+        ]
+        if not results:
+            p.status, p.answer = "no_results", NO_RESULTS
+        elif not passages:
+            p.status, p.answer = "no_text", NO_TEXT
+        else:
+            best = await asyncio.to_thread(best_sentences_for_query, passages, query, ANSWER_SENTENCES)
+            p.answer, p.citations = " ".join(best), best
+        return p
+
+    def refine_stream(self, p: PreparedQuery) -> Iterator[str]:
+        """Gemini's refined answer as text chunks (nothing without GOOGLE_API_KEY or a grounded answer)."""
+        if p.status != "ok" or not GOOGLE_API_KEY:
+            return iter(())
+        chunks, _ = stream_plan(p.steps, p.retrieved, p.query)
+        return record_first_token(chunks, p.timings)
+
+    def finish(self, p: PreparedQuery, refined: Optional[str] = None) -> Dict:
+        """Adopt the refined answer, cache the result and close the trace; returns the done event."""
+        if p.status == "ok" and refined and refined.strip():
+            p.answer, p.refined = refined, True
+        if p.status == "ok" and not p.all_bots:
+            self.answer_cache(p.bot).put(
+                p.vector,
+                {"content": p.answer, "citations": p.citations},
+                compute_seconds=p.timings.since_start(),
+            )
+        p.trace.finish()
+        return p.done_event()
+
+    def query_events(self, bot_key: str, query: str, all_bots: bool = False, refine: bool = True) -> Iterator[Dict]:
+        """Answer a query from synchronous code (e.g. a Streamlit script), yielding its events."""
+        self._bot(bot_key)
+        trace = start_trace(bot_key, all_bots=all_bots)
+        try:
+            p = asyncio.run(self.prepare(bot_key, query, all_bots))
+            yield {"event": "plan", "steps": p.steps}
+            yield p.context_event()
+            refined = []
+            if refine:
+                try:
+                    for chunk in self.refine_stream(p):
+                        refined.append(chunk)
+                        yield {"event": "token", "text": chunk}
+                except Exception as e:
+                    yield {"event": "error", "message": f"Could not refine the answer with Gemini: {e}"}
+            yield self.finish(p, "".join(refined))
+        finally:
+            trace.finish()
+
+    async def events(self, bot_key: str, query: str, all_bots: bool = False, refine: bool = True) -> AsyncIterator[Dict]:
+        """Async version of query_events for an event loop serving many queries."""
+        self._bot(bot_key)
+        trace = start_trace(bot_key, all_bots=all_bots)
+        try:
+            p = await self.prepare(bot_key, query, all_bots)
+            yield {"event": "plan", "steps": p.steps}
+            yield p.context_event()
+            refined = []
+            if refine:
+                try:
+                    async for chunk in aiter_in_thread(await asyncio.to_thread(self.refine_stream, p)):
+                        refined.append(chunk)
+                        yield {"event": "token", "text": chunk}
+                except Exception as e:
+                    yield {"event": "error", "message": f"Could not refine the answer with Gemini: {e}"}
+            yield self.finish(p, "".join(refined))
+        finally:
+            trace.finish()
+
+    async def answer(self, bot_key: str, query: str, all_bots: bool = False, refine: bool = True) -> Dict:
+        """The whole query at once: plan steps, documents, final answer, timings."""
+        result = {}
+        async for event in self.events(bot_key, query, all_bots, refine):
+            if event["event"] == "error":
+                result.setdefault("errors", []).append(event["message"])
+            elif event["event"] != "token":
+                result.update({k: v for k, v in event.items() if k != "event"})
+        return result
+
+    def stats(self, bot_key: str) -> Dict:
+        """Cache counters, query embedding batching and rolling stage latencies of a bot."""
+        recent = recent_traces(bot_key)
+        llm_cache = get_llm_cache()
+        return {
+            "answer_cache": self.answer_cache(bot_key).stats(),
+            "embedding_batches": get_embedding_batcher().stats(),
+            "llm_cache": llm_cache.stats() if llm_cache else None,
+            "latency": stage_percentiles(bot_key),
+            "last_trace": recent[0] if recent else None,
+        }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_query_engine() -> QueryEngine:
+    """The process-wide engine over DEFAULT_BOTS."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = QueryEngine()
+        return _engine
@@ -0,0 +1,65 @@
+# app/fusion.py
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Standard RRF damping constant (Cormack et al.); larger values flatten the
+# advantage of top ranks.
+RRF_K = 60
+
+
+def normalize_scores(results: List[Tuple[float, Dict]]) -> List[float]:
+    """
+    Z-score the similarity scores of one result list so lists from indexes
+    with different score ranges (or metrics) become comparable.
+    """
+    scores = np.asarray([s if s is not None else np.nan for s, _ in results], dtype=np.float64)
+    if not len(scores) or np.all(np.isnan(scores)):
+        return [0.0] * len(results)
+    mean, std = np.nanmean(scores), np.nanstd(scores)
+    z = (scores - mean) / std if std > 1e-12 else np.zeros_like(scores)
+    return [0.0 if np.isnan(v) else float(v) for v in z]
+
+
+def _doc_key(doc: Dict) -> Hashable:
+    return (doc.get("id"), doc.get("title", ""))
+
+
+def reciprocal_rank_fusion(
+    result_lists: Dict[str, List[Tuple[float, Dict]]],
+    top_k: Optional[int] = None,
+    k: int = RRF_K,
+    weights: Optional[Dict[str, float]] = None,
+) -> List[Tuple[float, Dict]]:
+    """
+    Merge ranked (score, doc) lists from several indexes into one.
+    Every doc scores sum(weight / (k + rank)) over the lists it appears in;
+    ties (e.g. the top hit of each index) go to the higher normalised score.
+    Docs with the same id and title in several lists are merged. Returned
+    docs are copies carrying "source" (the list the best hit came from) and
+    "source_scores" ({list name: original score}).
+    """
+    fused: Dict[Hashable, Dict] = {}
+    for name, results in result_lists.items():
+        weight = (weights or {}).get(name, 1.0)
+        ranked = sorted(results, key=lambda r: r[0] if r[0] is not None else float("-inf"), reverse=True)
+        for rank, ((score, doc), z) in enumerate(zip(ranked, normalize_scores(ranked)), start=1):
+            entry = fused.get(_doc_key(doc))
+            if entry is None:
+                entry = fused[_doc_key(doc)] = {
+                    "rrf": 0.0, "best_z": z, "doc": {**doc, "source": name, "source_scores": {}},
+                }
+            elif z > entry["best_z"]:
+                entry["best_z"] = z
+                entry["doc"]["source"] = name
+            entry["rrf"] += weight / (k + rank)
+            entry["doc"]["source_scores"][name] = score
+
+    merged = sorted(fused.values(), key=lambda e: (e["rrf"], e["best_z"]), reverse=True)
+    out = [(e["rrf"], e["doc"]) for e in merged]
+    return out[:top_k] if top_k else out
+
+
+def fuse_targets(results: Dict[Sequence, List[Tuple[float, Dict]]], top_k: Optional[int] = None) -> List[Tuple[float, Dict]]:
+    """reciprocal_rank_fusion over `pipeline.retrieve` output, naming lists "<backend>:<index>"."""
+    return reciprocal_rank_fusion({f"{b}:{i}": hits for (b, i), hits in results.items()}, top_k=top_k)
@@ -0,0 +1,382 @@
+# app/ingest.py
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from answer_cache import mark_index_updated
+from chunking import chunk_document
+from connectors import get_backend
+from connectors.sparse_index import SPARSE_INDEX_ENABLED, get_sparse_index
+from embedding import embed_array
+from utils import encode_sentence_index
+
+DEFAULT_EMBED_BATCH_SIZE = 64
+DEFAULT_UPSERT_BATCH_SIZE = 100
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 0.5
+# Pinecone caps metadata at 40 KB per vector; leave headroom for title and keys.
+MAX_METADATA_CHARS = 36_000
+
+
+@dataclass
+class IngestStats:
+    """Counters and timings collected while ingesting one document stream."""
+    index_name: str
+    succeeded: int = 0
+    vectors: int = 0
+    failed: int = 0
+    skipped: int = 0
+    failed_ids: List[str] = field(default_factory=list)
+    embed_seconds: float = 0.0
+    upsert_seconds: float = 0.0
+    wall_seconds: float = 0.0
+    retries: int = 0
+    started_at: float = field(default_factory=time.perf_counter, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def merge(self, **counts):
+        """Add to several counters at once, under the lock upsert threads count retries with."""
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    @property
+    def total(self) -> int:
+        return self.succeeded + self.failed + self.skipped
+
+    @property
+    def elapsed(self) -> float:
+        return self.wall_seconds or (time.perf_counter() - self.started_at)
+
+    @property
+    def docs_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.total / elapsed if elapsed else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.succeeded} succeeded ({self.vectors} vectors), {self.failed} failed, "
+            f"{self.skipped} unchanged in {self.wall_seconds:.2f}s "
+            f"({self.docs_per_second:.1f} docs/s; embed {self.embed_seconds:.2f}s, "
+            f"upsert {self.upsert_seconds:.2f}s, {self.retries} retries)"
+        )
+
+
+class IngestCheckpoint:
+    """Small JSON file recording how far a source has been ingested."""
+
+    def __init__(self, path: str, source: Optional[str] = None):
+        self.path = path
+        self.source = source
+
+    def _fingerprint(self) -> Optional[Dict]:
+        if not self.source or not os.path.exists(self.source):
+            return None
+        st = os.stat(self.source)
+        return {"source": os.path.abspath(self.source), "size": st.st_size, "mtime": st.st_mtime}
+
+    def load(self) -> Dict:
+        """
+        Return resume arguments for `JsonDocumentStream`: the byte offset when the
+        source is unchanged since the checkpoint, otherwise only the last doc id.
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if saved.get("fingerprint") == self._fingerprint() and saved.get("offset"):
+            return {"start_offset": saved["offset"]}
+        if saved.get("doc_id"):
+            return {"resume_after_id": saved["doc_id"]}
+        return {}
+
+    def save(self, offset: Optional[int], doc_id: str):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"offset": offset, "doc_id": doc_id, "fingerprint": self._fingerprint()}, f)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    """Yield lists of at most `size` items from any iterable."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _with_retries(fn: Callable, max_retries: int, stats: IngestStats):
+    """Call `fn` until it succeeds or `max_retries` extra attempts are used up."""
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception:
+            if attempt >= max_retries:
+                raise
+            attempt += 1
+            stats.record_retry()
+            time.sleep(RETRY_BACKOFF_SECONDS * (2 ** (attempt - 1)))
+
+
+def _chunk_metadata(chunk: Dict) -> Dict:
+    # The sentence index is precomputed here so answer extraction at query
+    # time does not re-split and re-tokenize every retrieved passage.
+    text = chunk.get("text", "")
+    metadata = {"title": chunk.get("title", ""), "text": text}
+    if chunk.get("parent_id") and chunk["parent_id"] != chunk["id"]:
+        metadata["parent_id"] = chunk["parent_id"]
+        metadata["chunk"] = chunk["chunk"]
+    sentence_index = encode_sentence_index(text)
+    if len(text) + len(sentence_index) <= MAX_METADATA_CHARS:
+        metadata["sentence_index"] = sentence_index
+    return metadata
+
+
+def document_vectors(docs: List[Dict], chunks: List[List[Dict]], embeddings) -> List[tuple]:
+    """
+    Pair embedded passages with their metadata: one (doc id, [(vector id,
+    vector, metadata), ...]) per document, in the order of `docs`.
+    """
+    vectors = iter(embeddings)
+    return [
+        (doc["id"], [(chunk["id"], next(vectors), _chunk_metadata(chunk)) for chunk in doc_chunks])
+        for doc, doc_chunks in zip(docs, chunks)
+    ]
+
+
+class UpsertWriter:
+    """
+    Upserts embedded documents to one index in requests of `upsert_batch_size`
+    vectors on a thread pool, keeping at most 2 * max_workers requests in flight
+    so memory stays bounded. Used from a single thread: `ingest_documents` feeds
+    it from its embedding loop, parallel_ingest.py from the vectors its worker
+    processes send back. Close it (or leave its `with` block) to wait for the
+    last upserts and save the sparse index.
+    """
+
+    def __init__(
+        self,
+        index_name: str,
+        upsert_batch_size: int = DEFAULT_UPSERT_BATCH_SIZE,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        progress: Optional[Callable[[IngestStats], None]] = None,
+        checkpoint: Optional[IngestCheckpoint] = None,
+        on_commit: Optional[Callable[[Dict[str, List[str]]], None]] = None,
+        backend: Optional[str] = None,
+        sparse: bool = SPARSE_INDEX_ENABLED,
+    ):
+        self.stats = IngestStats(index_name=index_name)
+        self.index_name = index_name
+        self.upsert_batch_size = upsert_batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.progress = progress
+        self.checkpoint = checkpoint
+        self.on_commit = on_commit
+        self.store = get_backend(backend)
+        self.sparse_index = get_sparse_index(self.store.name, index_name) if sparse else None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._pending = []
+        self._buffer = []
+        # Documents whose last passage is in `_buffer`: doc id -> all its vector ids.
+        self._completed = {}
+        self._failed_docs = set()
+        # (offset, doc_id) of the last completed embed batch sitting in `_buffer`.
+        self._marker = None
+        # Once any batch fails the checkpoint must not move past it.
+        self._checkpoint_ok = checkpoint is not None
+
+    def __enter__(self) -> "UpsertWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._executor.shutdown()
+
+    def add(self, documents: List[tuple], marker: Optional[tuple] = None):
+        """
+        Queue the vectors of embedded documents (see `document_vectors`);
+        `marker` is the (offset, doc id) checkpoint to save once they are upserted.
+        """
+        for d, (doc_id, vectors) in enumerate(documents):
+            for i, (vector_id, vector, metadata) in enumerate(vectors):
+                self._buffer.append((vector_id, vector, metadata, doc_id))
+                if i == len(vectors) - 1:
+                    self._completed[doc_id] = [v[0] for v in vectors]
+                    if d == len(documents) - 1:
+                        self._marker = marker
+                if len(self._buffer) >= self.upsert_batch_size:
+                    self._flush()
+
+    def fail(self, doc_ids: List[str]):
+        """Count documents that could not be embedded; the checkpoint stops advancing."""
+        self._checkpoint_ok = False
+        self.stats.failed += len(doc_ids)
+        self.stats.failed_ids.extend(doc_ids)
+
+    def close(self) -> IngestStats:
+        try:
+            self._flush()
+            self._drain(0)
+        finally:
+            self._executor.shutdown()
+        if self.sparse_index is not None:
+            self.sparse_index.save()
+        if self.stats.vectors:
+            mark_index_updated(self.store.name, self.index_name)
+        self.stats.wall_seconds = time.perf_counter() - self.stats.started_at
+        return self.stats
+
+    def _upsert(self, vectors):
+        t0 = time.perf_counter()
+        _with_retries(
+            lambda: self.store.upsert_batch(self.index_name, vectors),
+            self.max_retries,
+            self.stats,
+        )
+        if self.sparse_index is not None:
+            # Only what reached the dense index is searchable by keyword too.
+            self.sparse_index.add([(doc_id, metadata) for doc_id, _, metadata in vectors])
+        return time.perf_counter() - t0
+
+    def _drain(self, limit):
+        # Futures are resolved in submission order, which keeps checkpoints monotonic.
+        stats = self.stats
+        while len(self._pending) > limit:
+            future, ids, parents, done, batch_marker = self._pending.pop(0)
+            try:
+                stats.upsert_seconds += future.result()
+                stats.vectors += len(ids)
+                # A document split across batches only counts once all of them succeeded.
+                done = {doc_id: vids for doc_id, vids in done.items() if doc_id not in self._failed_docs}
+                stats.succeeded += len(done)
+                if self.on_commit and done:
+                    self.on_commit(done)
+                if self._checkpoint_ok and batch_marker:
+                    self.checkpoint.save(*batch_marker)
+            except Exception as e:
+                self._checkpoint_ok = False
+                newly_failed = [p for p in parents if p not in self._failed_docs]
+                self._failed_docs.update(newly_failed)
+                stats.failed += len(newly_failed)
+                stats.failed_ids.extend(newly_failed)
+                print(f"✗ Upsert batch failed ({len(ids)} vectors, first {ids[0]}): {e}")
+            if self.progress:
+                self.progress(stats)
+
+    def _flush(self):
+        buffer = self._buffer
+        if buffer:
+            future = self._executor.submit(self._upsert, [v[:3] for v in buffer])
+            parents = list(dict.fromkeys(v[3] for v in buffer))
+            self._pending.append((future, [v[0] for v in buffer], parents, dict(self._completed), self._marker))
+            self._buffer = []
+            self._completed = {}
+            self._marker = None
+        self._drain(self.max_workers * 2)
+
+
+def ingest_documents(
+    docs: Iterable[Dict],
+    index_name: str,
+    embed_batch_size: int = DEFAULT_EMBED_BATCH_SIZE,
+    upsert_batch_size: int = DEFAULT_UPSERT_BATCH_SIZE,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    progress: Optional[Callable[[IngestStats], None]] = None,
+    checkpoint: Optional[IngestCheckpoint] = None,
+    select: Optional[Callable[[Dict], bool]] = None,
+    on_commit: Optional[Callable[[Dict[str, List[str]]], None]] = None,
+    backend: Optional[str] = None,
+    chunker: Callable[[Dict], List[Dict]] = chunk_document,
+    sparse: bool = SPARSE_INDEX_ENABLED,
+) -> IngestStats:
+    """
+    Split documents into passages, embed them and upsert one vector per passage.
+    Args:
+        docs: iterable of {"id", "title", "text"} dicts (may be a generator)
+        index_name: target index
+        embed_batch_size: documents whose passages go into one `embed_array` call
+        upsert_batch_size: vectors per upsert request
+        max_workers: upsert threads; embedding of the next batch overlaps with these
+        max_retries: extra attempts per failed embed or upsert batch
+        progress: called with the running stats after every finished upsert batch
+        checkpoint: advanced after each upsert batch once it and every earlier batch
+            succeeded; uses `docs.offset` when `docs` is a JsonDocumentStream
+        select: predicate deciding which documents to embed; the rest count as skipped
+        on_commit: called with {doc id: vector ids} for documents whose vectors
+            have all been upserted successfully
+        backend: vector store name for `connectors.get_backend` (default VECTOR_BACKEND)
+        chunker: doc -> passage dicts with "id", "text", "parent_id" (see chunking.py)
+        sparse: also add upserted passages to the index's local BM25 index
+            (connectors/sparse_index.py) for hybrid search
+    Returns:
+        IngestStats with document/vector counts and embed/upsert timings
+    """
+    writer = UpsertWriter(
+        index_name,
+        upsert_batch_size=upsert_batch_size,
+        max_workers=max_workers,
+        max_retries=max_retries,
+        progress=progress,
+        checkpoint=checkpoint,
+        on_commit=on_commit,
+        backend=backend,
+        sparse=sparse,
+    )
+    stats = writer.stats
+    with writer:
+        for batch in batched(docs, embed_batch_size):
+            batch_offset = getattr(docs, "offset", None)
+            if select is not None:
+                selected = [d for d in batch if select(d)]
+                stats.skipped += len(batch) - len(selected)
+                batch = selected
+            valid = [d for d in batch if d.get("id")]
+            if len(valid) < len(batch):
+                stats.failed += len(batch) - len(valid)
+                print(f"✗ Skipped {len(batch) - len(valid)} documents without an id")
+            if not valid:
+                continue
+
+            chunks = [chunker(d) for d in valid]
+            passages = [c for doc_chunks in chunks for c in doc_chunks]
+            t0 = time.perf_counter()
+            try:
+                embeddings = _with_retries(
+                    lambda: embed_array([c.get("text", "") for c in passages]),
+                    max_retries,
+                    stats,
+                )
+            except Exception as e:
+                writer.fail([d["id"] for d in valid])
+                print(f"✗ Embedding batch failed ({len(valid)} docs, first {valid[0]['id']}): {e}")
+                continue
+            finally:
+                stats.embed_seconds += time.perf_counter() - t0
+
+            writer.add(document_vectors(valid, chunks, embeddings), marker=(batch_offset, valid[-1]["id"]))
+    return stats
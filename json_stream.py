@@ -0,0 +1,175 @@
+# app/json_stream.py
+import codecs
+import json
+import os
+import re
+from typing import BinaryIO, Dict, Iterator, Optional, Union
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+JSONL_EXTENSIONS = (".jsonl", ".ndjson")
+
+_SKIP = re.compile("[\\s,\ufeff]*")
+
+
+class JsonDocumentStream:
+    """
+    Iterate documents from a JSON array or JSON Lines file without loading it whole.
+    Args:
+        source: file path or binary file object (e.g. a Streamlit upload)
+        start_offset: byte offset to resume from (a value previously read from `offset`)
+        resume_after_id: skip documents up to and including this id; when the id is
+            not in the source any more, everything is read from the start instead
+        fmt: "json" or "jsonl"; detected from the name / first byte when omitted
+    After each yielded document, `offset` is the byte offset just past it, so
+    passing it back as `start_offset` continues with the next document.
+    """
+
+    def __init__(
+        self,
+        source: Union[str, BinaryIO],
+        start_offset: int = 0,
+        resume_after_id: Optional[str] = None,
+        fmt: Optional[str] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ):
+        self.source = source
+        self.start_offset = start_offset
+        self.resume_after_id = resume_after_id
+        self.chunk_size = chunk_size
+        self.offset = start_offset
+        self.format = fmt
+
+    @property
+    def name(self) -> str:
+        if isinstance(self.source, str):
+            return self.source
+        return getattr(self.source, "name", "") or ""
+
+    def size(self) -> Optional[int]:
+        """Total size of the source in bytes, if it can be determined."""
+        if isinstance(self.source, str):
+            return os.path.getsize(self.source)
+        size = getattr(self.source, "size", None)
+        if size is None and hasattr(self.source, "getbuffer"):
+            size = self.source.getbuffer().nbytes
+        return size
+
+    def detect_format(self) -> str:
+        """"json" or "jsonl", from the explicit format, the name or the first byte."""
+        if self.format is None:
+            if isinstance(self.source, str):
+                with open(self.source, "rb") as f:
+                    self.format = _detect_format(f, self.name)
+            else:
+                self.format = _detect_format(self.source, self.name)
+        return self.format
+
+    def __iter__(self) -> Iterator[Dict]:
+        f = open(self.source, "rb") if isinstance(self.source, str) else self.source
+        try:
+            if self.format is None:
+                self.format = _detect_format(f, self.name)
+            f.seek(self.start_offset)
+            docs = self._iter_jsonl(f) if self.format == "jsonl" else self._iter_array(f)
+            skipping = self.resume_after_id is not None
+            for doc in docs:
+                if skipping:
+                    skipping = doc.get("id") != self.resume_after_id
+                    continue
+                yield doc
+            if skipping:
+                # Nothing was yielded: the checkpointed id is gone, so the source
+                # changed. Re-read all of it rather than silently dropping it.
+                print(f"✗ Resume id {self.resume_after_id} not found in {self.name or 'the source'}; starting over")
+                self.start_offset = self.offset = 0
+                self.resume_after_id = None
+                f.seek(0)
+                docs = self._iter_jsonl(f) if self.format == "jsonl" else self._iter_array(f)
+                yield from docs
+        finally:
+            if isinstance(self.source, str):
+                f.close()
+
+    def _iter_jsonl(self, f: BinaryIO) -> Iterator[Dict]:
+        offset = self.start_offset
+        for line in f:
+            offset += len(line)
+            line = line.strip()
+            if not line:
+                continue
+            doc = json.loads(line.decode("utf-8-sig"))
+            if isinstance(doc, dict):
+                self.offset = offset
+                yield doc
+
+    def _iter_array(self, f: BinaryIO) -> Iterator[Dict]:
+        decoder = json.JSONDecoder()
+        utf8 = codecs.getincrementaldecoder("utf-8")()
+        buf, pos, offset, eof = "", 0, self.start_offset, False
+
+        def fill():
+            # Grow the read size with the pending text so one huge document
+            # is not re-parsed once per small chunk.
+            nonlocal buf, pos, eof
+            chunk = f.read(max(self.chunk_size, len(buf) - pos))
+            eof = not chunk
+            buf = buf[pos:] + utf8.decode(chunk, final=eof)
+            pos = 0
+
+        def skip():
+            nonlocal pos, offset
+            end = _SKIP.match(buf, pos).end()
+            offset += len(buf[pos:end].encode("utf-8"))
+            pos = end
+
+        if self.start_offset == 0:
+            # Fresh start: consume the opening bracket of the array.
+            while True:
+                skip()
+                if pos < len(buf) or eof:
+                    break
+                fill()
+            if pos < len(buf):
+                if buf[pos] != "[":
+                    raise ValueError("Expected a JSON array of documents")
+                pos += 1
+                offset += 1
+
+        while True:
+            skip()
+            if pos >= len(buf):
+                if eof:
+                    return
+                fill()
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                doc, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            if end >= len(buf) and not eof and not isinstance(doc, (dict, list)):
+                # A bare scalar may have been cut at the chunk boundary.
+                fill()
+                continue
+            offset += len(buf[pos:end].encode("utf-8"))
+            pos = end
+            if isinstance(doc, dict):
+                self.offset = offset
+                yield doc
+
+
+def _detect_format(f: BinaryIO, name: str) -> str:
+    if name.lower().endswith(JSONL_EXTENSIONS):
+        return "jsonl"
+    f.seek(0)
+    head = f.read(1024).lstrip(b"\xef\xbb\xbf \t\r\n")
+    return "json" if head[:1] == b"[" else "jsonl"
+
+
+def iter_json_documents(source: Union[str, BinaryIO], **kwargs) -> Iterator[Dict]:
+    """Convenience generator over `JsonDocumentStream`."""
+    return iter(JsonDocumentStream(source, **kwargs))
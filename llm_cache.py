@@ -0,0 +1,110 @@
+# app/llm_cache.py
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence
+
+# Gemini answers keyed by exactly what went into the prompt; a repeated
+# (plan, context, query) skips the call. Entries expire after the TTL and
+# the least recently used one is evicted beyond LLM_CACHE_SIZE.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "512"))
+
+_WS = re.compile(r"\s+")
+_TRAILING_PUNCT = re.compile(r"[\s?!.]+$")
+
+
+def normalize_query(query: str) -> str:
+    """Case, Unicode form, whitespace and trailing ?!. do not change the question."""
+    text = _WS.sub(" ", unicodedata.normalize("NFKC", query)).strip().lower()
+    return _TRAILING_PUNCT.sub("", text)
+
+
+def llm_cache_key(model: str, plan: Sequence[str], passage_ids: Sequence[str], query: str, parts: Sequence[str]) -> str:
+    """
+    Key of one generation: model, plan steps, the passages the context was
+    taken from and the normalised query. The context text is hashed in too,
+    so a passage re-indexed under the same id does not reuse an old answer.
+    """
+    payload = json.dumps(
+        [model, list(plan), list(passage_ids), normalize_query(query), list(parts)],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """LRU + TTL map of cache key -> generated text, with hit/latency/token counters."""
+
+    def __init__(self, ttl_seconds: float = LLM_CACHE_TTL_SECONDS, max_items: int = LLM_CACHE_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        # key -> (text, stored_at, generation seconds, prompt tokens)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lookups = 0
+        self._hits = 0
+        self._saved_seconds = 0.0
+        self._saved_tokens = 0
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            self._lookups += 1
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            text, stored_at, seconds, tokens = entry
+            if now - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            self._saved_seconds += seconds
+            self._saved_tokens += tokens
+            return text
+
+    def put(self, key: str, text: str, seconds: float = 0.0, prompt_tokens: int = 0):
+        if not text or not text.strip():
+            return
+        with self._lock:
+            self._entries[key] = (text, time.monotonic(), seconds, prompt_tokens)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "lookups": self._lookups,
+                "hits": self._hits,
+                "hit_rate": self._hits / self._lookups if self._lookups else 0.0,
+                "saved_seconds": self._saved_seconds,
+                "saved_prompt_tokens": self._saved_tokens,
+                "size": len(self._entries),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """The process-wide response cache, or None with LLM_CACHE=0."""
+    global _cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMResponseCache()
+        return _cache
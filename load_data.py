@@ -1,51 +1,180 @@
-import json
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
-from connectors import pinecone_client
-from embedding import embed_texts
+from answer_cache import mark_index_updated
+from chunking import chunking_key
+from connectors import get_backend
+from connectors.sparse_index import SPARSE_INDEX_ENABLED, get_sparse_index
+from embedding import MODEL_KEY, cache_stats
+from ingest import IngestCheckpoint, UpsertWriter, ingest_documents
+from json_stream import JsonDocumentStream
+from manifest import IndexManifest
+from parallel_ingest import IngestJob, ingest_parallel
 
-def load_json_to_pinecone_index(json_file_path, index_name):
-    """Load JSON data into specific Pinecone index."""
-    with open(json_file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+CHECKPOINT_DIR = ".ingest_checkpoints"
+# Worker processes for load_all_indexes: 1 loads the files one after another
+# in this process, 0 uses one process per core.
+INGEST_PROCESSES = int(os.getenv("INGEST_PROCESSES", "1"))
+DATASETS = [
+    ("data/customer_service.json", "PINECONE_INDEX_CUSTOMER_SERVICE"),
+    ("data/ecommerce.json", "PINECONE_INDEX_ECOMMERCE"),
+    ("data/saas.json", "PINECONE_INDEX_SAAS"),
+    ("data/internal.json", "PINECONE_INDEX_INTERNAL"),
+]
 
-    print(f"\n{'='*60}")
-    print(f"Loading {len(data)} documents to Pinecone index '{index_name}'")
-    print(f"{'='*60}")
-    
-    success = 0
-    failed = 0
-    
-    for item in data:
-        doc_id = item.get("id")
-        text = item.get("text", "")
-        title = item.get("title", "")
-        
+def _print_progress(stats):
+    print(f"  … {stats.succeeded} upserted, {stats.failed} failed ({stats.docs_per_second:.1f} docs/s)")
+
+def _delete_vectors(store, index_name, ids):
+    store.delete_from_index(index_name, ids)
+    if SPARSE_INDEX_ENABLED:
+        get_sparse_index(store.name, index_name).delete(ids)
+
+def _finish_manifest(store, index_name, manifest, json_file_path, complete):
+    """Delete vectors of removed documents (after a complete pass) and outdated passages, then save."""
+    removed = manifest.removed() if complete else []
+    if removed:
         try:
-            embedding = embed_texts([text])[0]
-            pinecone_client.pinecone_upsert_to_index(
-                index_name,
-                doc_id,
-                embedding,
-                {"title": title, "text": text}
-            )
-            success += 1
-            
+            _delete_vectors(store, index_name, manifest.vector_ids(removed))
+            manifest.forget(removed)
+            print(f"Deleted {len(removed)} documents no longer in {json_file_path}")
         except Exception as e:
-            failed += 1
-            print(f"✗ Failed {doc_id}: {e}")
-    
-    print(f"\nSummary: {success} succeeded, {failed} failed\n")
+            print(f"✗ Failed to delete removed documents: {e}")
+    stale = manifest.stale()
+    if stale:
+        try:
+            _delete_vectors(store, index_name, stale)
+            manifest.forget_stale(stale)
+            print(f"Deleted {len(stale)} outdated passage vectors")
+        except Exception as e:
+            print(f"✗ Failed to delete outdated passage vectors: {e}")
+    if removed or stale:
+        if SPARSE_INDEX_ENABLED:
+            get_sparse_index(store.name, index_name).save()
+        mark_index_updated(store.name, index_name)
+    manifest.save()
+
+def _index_manifest(store, index_name):
+    fingerprint = f"{MODEL_KEY}|{chunking_key()}"
+    return IndexManifest.for_index(f"{store.name.lower()}-{index_name}", fingerprint=fingerprint)
+
+def _index_state(store, index_name, json_file_path, incremental):
+    state_key = f"{store.name.lower()}-{index_name}"
+    checkpoint = IngestCheckpoint(os.path.join(CHECKPOINT_DIR, f"{state_key}.json"), json_file_path)
+    manifest = _index_manifest(store, index_name) if incremental else None
+    return checkpoint, manifest
+
+def load_json_to_pinecone_index(json_file_path, index_name, resume=True, incremental=True, backend=None):
+    """Stream a JSON array / JSON Lines file into a specific Pinecone index.
+
+    With `resume`, a crashed run picks up after the last fully upserted batch.
+    With `incremental`, only new or changed documents are embedded and upserted,
+    and vectors of documents no longer in the file (or of passages a changed
+    document no longer has) are deleted.
+    `backend` selects the vector store (defaults to the VECTOR_BACKEND env var).
+    """
+    store = get_backend(backend)
+    checkpoint, manifest = _index_state(store, index_name, json_file_path, incremental)
+    resume_from = checkpoint.load() if resume else {}
+    docs = JsonDocumentStream(json_file_path, **resume_from)
+
+    print(f"\n{'='*60}")
+    print(f"Loading {json_file_path} ({docs.size()} bytes) to {store.name} index '{index_name}'")
+    if resume_from:
+        print(f"Resuming from checkpoint {resume_from}")
+    print(f"{'='*60}")
+
+    stats = ingest_documents(
+        docs,
+        index_name,
+        progress=_print_progress,
+        checkpoint=checkpoint,
+        select=manifest.needs_upsert if manifest else None,
+        on_commit=manifest.commit if manifest else None,
+        backend=store.name,
+    )
+    if not stats.failed:
+        checkpoint.clear()
+
+    if manifest:
+        # A resumed run did not see the documents before the checkpoint, so
+        # only a complete, clean pass may decide what was removed.
+        _finish_manifest(store, index_name, manifest, json_file_path, complete=not resume_from and not stats.failed)
+
+    print(f"\nSummary: {stats.summary()}")
+    print(f"Embedding cache: {cache_stats()}\n")
+    return stats
+
+def load_uploaded_documents(docs, index_name, source_name="upload", backend=None, progress=None):
+    """Ingest uploaded documents through the index's manifest, like load_json_to_pinecone_index.
+
+    Unchanged documents are skipped and passages a changed document no longer
+    has are deleted, so the next load_data.py run stays incremental. An upload
+    is not the whole source, so documents missing from it are kept.
+    """
+    store = get_backend(backend)
+    manifest = _index_manifest(store, index_name)
+    stats = ingest_documents(
+        docs,
+        index_name,
+        progress=progress,
+        select=manifest.needs_upsert,
+        on_commit=manifest.commit,
+        backend=store.name,
+    )
+    _finish_manifest(store, index_name, manifest, source_name, complete=False)
+    return stats
+
+def load_json_files_parallel(files, processes=INGEST_PROCESSES, incremental=True, backend=None, setup=None):
+    """Load several (json_file_path, index_name) pairs at once on a pool of worker processes.
+
+    Files are sharded across the workers (large ones by byte range, see
+    parallel_ingest.py); the vectors are upserted from this process.
+    Interrupted runs are resumed by the incremental manifest rather than
+    byte-offset checkpoints. `setup` runs in every worker after start-up.
+    """
+    store = get_backend(backend)
+    jobs = []
+    for json_file_path, index_name in files:
+        checkpoint, manifest = _index_state(store, index_name, json_file_path, incremental)
+        writer = UpsertWriter(
+            index_name,
+            progress=_print_progress,
+            on_commit=manifest.commit if manifest else None,
+            backend=store.name,
+        )
+        jobs.append((checkpoint, IngestJob(json_file_path, writer, manifest)))
+
+    print(f"\n{'='*60}")
+    for _, job in jobs:
+        print(f"Loading {job.path} ({os.path.getsize(job.path)} bytes) to {store.name} index '{job.writer.index_name}'")
+    print(f"{'='*60}")
+
+    all_stats = ingest_parallel([job for _, job in jobs], processes=processes, setup=setup)
+    for (checkpoint, job), stats in zip(jobs, all_stats):
+        complete = job.complete and not stats.failed
+        if complete:
+            # A sequential run's checkpoint is superseded by this full pass.
+            checkpoint.clear()
+        if job.manifest:
+            _finish_manifest(store, job.writer.index_name, job.manifest, job.path, complete)
+        print(f"\nSummary ({job.writer.index_name}): {stats.summary()}")
+    return all_stats
+
+def load_all_indexes(processes=INGEST_PROCESSES):
+    """Load all configured JSON files to their Pinecone indexes.
 
-def load_all_indexes():
-    """Load all configured JSON files to their Pinecone indexes."""
+    With `processes` other than 1 (INGEST_PROCESSES; 0 = one per core) the
+    files are loaded together on a process pool instead of one after another.
+    """
     print("\n🚀 Starting data load to Pinecone indexes...\n")
-    load_json_to_pinecone_index("data/customer_service.json", os.getenv("PINECONE_INDEX_CUSTOMER_SERVICE"))
-    load_json_to_pinecone_index("data/ecommerce.json", os.getenv("PINECONE_INDEX_ECOMMERCE"))
-    load_json_to_pinecone_index("data/saas.json", os.getenv("PINECONE_INDEX_SAAS"))
-    load_json_to_pinecone_index("data/internal.json", os.getenv("PINECONE_INDEX_INTERNAL"))
+    files = [(json_file_path, os.getenv(index_env)) for json_file_path, index_env in DATASETS]
+    if processes == 1:
+        for json_file_path, index_name in files:
+            load_json_to_pinecone_index(json_file_path, index_name)
+    else:
+        load_json_files_parallel(files, processes)
     print("\n✅ All data loaded successfully!\n")
 
 
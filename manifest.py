@@ -0,0 +1,111 @@
+# app/manifest.py
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+MANIFEST_DIR = ".index_manifests"
+SAVE_INTERVAL_SECONDS = 30.0
+
+
+def content_hash(doc: Dict) -> str:
+    """Hash of the fields that end up in the vector and its metadata."""
+    payload = json.dumps([doc.get("title", ""), doc.get("text", "")], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class IndexManifest:
+    """
+    doc id -> {"hash": content hash, "ids": vector (chunk) ids} of everything
+    currently upserted to one index. `fingerprint` (e.g. the embedding model
+    and chunking settings) invalidates every hash when it changes, forcing a
+    full re-embed; the vector ids are kept so outdated vectors can be deleted.
+    """
+
+    def __init__(self, path: str, fingerprint: Optional[str] = None):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.entries: Dict[str, Dict] = {}
+        self._pending: Dict[str, str] = {}
+        self._stale: List[str] = []
+        self._seen = set()
+        self._last_save = time.monotonic()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        for doc_id, entry in saved.get("docs", {}).items():
+            # Older manifests stored only the hash, for a single vector per doc.
+            if isinstance(entry, str):
+                entry = {"hash": entry, "ids": [doc_id]}
+            if saved.get("fingerprint") != fingerprint:
+                entry["hash"] = None
+            self.entries[doc_id] = entry
+        self._stale = list(saved.get("stale", []))
+
+    @classmethod
+    def for_index(cls, index_name: str, fingerprint: Optional[str] = None) -> "IndexManifest":
+        return cls(os.path.join(MANIFEST_DIR, f"{index_name}.json"), fingerprint)
+
+    def needs_upsert(self, doc: Dict) -> bool:
+        """True when a document is new or its content changed since the last upsert."""
+        doc_id = doc.get("id")
+        if not doc_id:
+            return True
+        return self.observe(doc_id, content_hash(doc))
+
+    def observe(self, doc_id: str, digest: str) -> bool:
+        """`needs_upsert` for a document hashed elsewhere (e.g. in an ingestion worker process)."""
+        self._seen.add(doc_id)
+        if self.entries.get(doc_id, {}).get("hash") == digest:
+            return False
+        self._pending[doc_id] = digest
+        return True
+
+    def removed(self) -> List[str]:
+        """Ids in the manifest that the last full pass over the source did not see."""
+        return [doc_id for doc_id in self.entries if doc_id not in self._seen]
+
+    def commit(self, vector_ids: Dict[str, List[str]]):
+        """
+        Record documents as upserted, given doc id -> ids of all its vectors;
+        called once every batch holding them succeeded. Vectors a document
+        had before but no longer has are queued for deletion.
+        """
+        for doc_id, ids in vector_ids.items():
+            digest = self._pending.pop(doc_id, None)
+            if digest is None:
+                continue
+            keep = set(ids)
+            self._stale.extend(i for i in self.entries.get(doc_id, {}).get("ids", []) if i not in keep)
+            self.entries[doc_id] = {"hash": digest, "ids": list(ids)}
+            if self._stale:
+                self._stale = [i for i in self._stale if i not in keep]
+        if time.monotonic() - self._last_save > SAVE_INTERVAL_SECONDS:
+            self.save()
+
+    def vector_ids(self, doc_ids: Iterable[str]) -> List[str]:
+        """Ids of every vector stored for the given documents."""
+        return [i for doc_id in doc_ids for i in self.entries.get(doc_id, {}).get("ids", [doc_id])]
+
+    def stale(self) -> List[str]:
+        """Vector ids left over from earlier versions of re-upserted documents."""
+        return list(self._stale)
+
+    def forget(self, doc_ids: Iterable[str]):
+        for doc_id in doc_ids:
+            self.entries.pop(doc_id, None)
+
+    def forget_stale(self, vector_ids: Iterable[str]):
+        done = set(vector_ids)
+        self._stale = [i for i in self._stale if i not in done]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "docs": self.entries, "stale": self._stale}, f)
+        os.replace(tmp, self.path)
+        self._last_save = time.monotonic()
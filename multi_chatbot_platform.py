@@ -1,57 +1,24 @@
 import streamlit as st
-import os, json, re
+import itertools
+import os, json, re, secrets, threading, time
 from datetime import datetime
 from dotenv import load_dotenv
 load_dotenv()
 
 from connectors import pinecone_client
-from embedding import embed_texts
-from connectors.planner.planner import plan_steps_for_query
-from connectors.planner.executor import execute_plan
-from utils import best_sentences_for_query
-from pinecone import Pinecone
+import embedding
+from embedding import cache_stats as embedding_cache_stats
+from load_data import load_uploaded_documents
+from json_stream import JsonDocumentStream
+from api_client import QUERY_API_URL, get_query_client
+from bots import DEFAULT_BOTS
+from rerank import RERANK_ENABLED, get_reranker
+from session_store import HISTORY_PAGE_SIZE, get_session_store
+from tracing import TRACE_LOG_ENABLED, TRACE_LOG_PATH, export_jsonl
 
 
 RELEVANCE_THRESHOLD = 0.10
 
-DEFAULT_BOTS = {
-    "customer_service": {
-        "display_name": "Customer Service",
-        "db_type": "Pinecone",
-        "index_name": os.getenv("PINECONE_INDEX_CUSTOMER_SERVICE", "multi-chatbot-dense"),
-        "model": "mistralai/Mistral-7B-Instruct-v0.2",
-        "persona": "Empathetic, helpful, patient tone.",
-        "prompt_template": "You are a customer support assistant. Use only retrieved documents to answer clearly and politely."
-    },
-
-    "ecommerce": {
-        "display_name": "E-commerce",
-        "db_type": "Pinecone",
-        "index_name": os.getenv("PINECONE_INDEX_ECOMMERCE", "ecommerce"),
-        "model": "meta-llama/Meta-Llama-3-8B-Instruct",
-        "persona": "Sales-oriented, friendly, highlight deals and recommendations.",
-        "prompt_template": "You are a shopping assistant. Use only product documents and pricing information."
-    },
-
-    "saas": {
-        "display_name": "SaaS Platforms",
-        "db_type": "Pinecone",
-        "index_name": os.getenv("PINECONE_INDEX_SAAS", "saas"),
-        "model": "Qwen/Qwen2.5-7B-Instruct",
-        "persona": "Technical, step-by-step, precise.",
-        "prompt_template": "You are a SaaS support engineer. Use runbooks and troubleshooting documents only."
-    },
-
-    "internal": {
-        "display_name": "Internal Teams",
-        "db_type": "Pinecone",
-        "index_name": os.getenv("PINECONE_INDEX_INTERNAL", "internal"),
-        "model": "microsoft/Phi-3-medium-4k-instruct",
-        "persona": "Formal, concise, security-conscious.",
-        "prompt_template": "You assist internal teams. Use only internal memos and policies."
-    }
-}
-
 
 def init_state():
     if "bots" not in st.session_state:
@@ -61,42 +28,72 @@ def init_state():
                 **v,
                 "retrieved_documents": [],
                 "memory_context": {},
-                "sessions": {},  # Each bot maintains its own sessions
-                "active_session_id": None  # Each bot has its own active session
+                # Sessions and messages live in the session store; only the
+                # selection and how much history to show are kept here.
+                "active_session_id": None,  # Each bot has its own active session
+                "history_limit": {},  # session id -> messages to render
             }
     
     if "active_bot" not in st.session_state:
         st.session_state.active_bot = "customer_service"
 
+def get_owner_id():
+    """
+    Id of this browser's chats, generated on the first visit and kept in the
+    URL (?owner=...) so it survives reloads; sessions are only shown to it.
+    """
+    if "owner_id" not in st.session_state:
+        owner = st.query_params.get("owner")
+        if not owner:
+            owner = secrets.token_urlsafe(16)
+            st.query_params["owner"] = owner
+        st.session_state.owner_id = owner
+    return st.session_state.owner_id
+
 def create_new_session(bot_key):
     """Create a new chat session for a specific bot"""
-    session_id = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
-    bot = st.session_state.bots[bot_key]
-    bot["sessions"][session_id] = {
-        "name": f"Chat {len(bot['sessions']) + 1}",
-        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "messages": []
-    }
-    return session_id
-
-def get_active_session(bot_key):
+    return get_session_store().create_session(bot_key, get_owner_id())["id"]
+
+def get_sessions(bot_key):
+    """This browser's sessions of a bot by id, oldest first; creates the first one if needed"""
+    store = get_session_store()
+    sessions = {s["id"]: s for s in store.list_sessions(bot_key, get_owner_id())}
+    if not sessions:
+        create_new_session(bot_key)
+        sessions = {s["id"]: s for s in store.list_sessions(bot_key, get_owner_id())}
+    return sessions
+
+def get_active_session(bot_key, sessions=None):
     """Get or create active session for a specific bot"""
     bot = st.session_state.bots[bot_key]
-    
-    # If no sessions exist for this bot, create one
-    if not bot["sessions"]:
-        session_id = create_new_session(bot_key)
-        bot["active_session_id"] = session_id
+    sessions = sessions or get_sessions(bot_key)
     
     # If active_session_id is None or invalid for this bot, use first session
     if (bot["active_session_id"] is None or 
-        bot["active_session_id"] not in bot["sessions"]):
-        bot["active_session_id"] = list(bot["sessions"].keys())[0]
+        bot["active_session_id"] not in sessions):
+        bot["active_session_id"] = list(sessions.keys())[0]
     
     return bot["active_session_id"]
 
+@st.cache_resource(show_spinner=False)
+def start_model_warm_up():
+    """Load the shared embedding model in the background, once per server process.
+
+    The model itself is a process-wide singleton in embedding.py, so every
+    session reuses it; this only moves the load off the first user's query.
+    """
+    thread = threading.Thread(target=embedding.warm_up, name="embedding-warm-up", daemon=True)
+    thread.start()
+    if RERANK_ENABLED:
+        get_reranker(wait=False)
+    return thread
+
 init_state()
 st.set_page_config(layout="wide", page_title="Multi-Chatbot Platform")
+# With QUERY_API_URL the API server holds the models; this process only renders.
+query_client = get_query_client()
+if os.getenv("WARM_UP_MODEL", "1") != "0" and not QUERY_API_URL:
+    start_model_warm_up()
 
 st.title("Multi-Chatbot Platform — Pinecone Backend")
 
@@ -118,6 +115,12 @@ with st.sidebar:
         st.session_state.active_bot = bot_choice
     
     bot = st.session_state.bots[bot_choice]
+
+    search_all_bots = st.checkbox(
+        "🔀 Search all bots",
+        key="search_all_bots",
+        help="Query every bot's index at once and merge the results into one ranking.",
+    )
     # try:
     #     pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
     #     idx = pc.Index(bot["index_name"])
@@ -128,15 +131,73 @@ with st.sidebar:
     
     # Show bot info
     with st.expander("ℹ️ Bot Info"):
-        st.write(f"**Index:** {bot['index_name']}")
+        st.write(f"**Index:** {bot['index_name']} ({bot['db_type']})")
         st.write(f"**Model:** {bot['model']}")
         st.write(f"**Persona:** {bot['persona']}")
+        try:
+            bot_stats = query_client.stats(bot_choice)
+        except Exception as e:
+            bot_stats = None
+            st.caption(f"Could not read stats from {QUERY_API_URL}: {e}")
+        if not QUERY_API_URL:
+            if bot["db_type"].lower() == "pinecone":
+                cp_calls = pinecone_client.control_plane_stats().get(bot["index_name"], 0)
+                st.caption(f"Control-plane calls for this index (this process): {cp_calls}")
+            emb_cache = embedding_cache_stats()
+            if emb_cache:
+                st.caption(f"Embedding cache hit rate: {emb_cache['hit_rate']:.0%} ({emb_cache['disk_rows']} cached vectors)")
+        if bot_stats:
+            ans_cache = bot_stats["answer_cache"]
+            st.caption(
+                f"Answer cache hit rate: {ans_cache['hit_rate']:.0%} of {ans_cache['lookups']} queries "
+                f"({ans_cache['size']} answers, {ans_cache['saved_seconds']:.1f}s latency saved)"
+            )
+            llm = bot_stats["llm_cache"]
+            if llm and llm["lookups"]:
+                st.caption(
+                    f"Gemini response cache (all bots): {llm['hit_rate']:.0%} of {llm['lookups']} calls, "
+                    f"~{llm['saved_prompt_tokens']} prompt tokens and {llm['saved_seconds']:.1f}s saved"
+                )
+            batches = bot_stats["embedding_batches"]
+            if batches["batches"]:
+                st.caption(
+                    f"Query embedding batches: {batches['avg_batch_size']:.1f} queries on average, "
+                    f"queueing {batches['avg_queue_ms']:.1f} ms (p95 {batches['p95_queue_ms']:.1f} ms)"
+                )
+
+    # Rolling per-stage latency of this bot's recent queries (see tracing.py)
+    with st.expander("🔍 Latency traces"):
+        percentiles = bot_stats["latency"] if bot_stats else {}
+        if not percentiles:
+            st.caption("No traced queries for this bot yet.")
+        else:
+            st.table([
+                {"stage": name, "n": p["count"], "p50 ms": round(p["p50"], 1),
+                 "p95 ms": round(p["p95"], 1), "p99 ms": round(p["p99"], 1)}
+                for name, p in sorted(percentiles.items(), key=lambda kv: -kv[1]["p50"])
+            ])
+            last = bot_stats["last_trace"]
+            st.caption(f"Last query: {last['total_ms']:.0f} ms")
+            st.json([
+                {"span": s["name"], "start ms": round(s["start_ms"], 1), "ms": round(s["duration_ms"], 1)}
+                for s in last["spans"]
+            ], expanded=False)
+            if not QUERY_API_URL:
+                st.download_button(
+                    "Download traces (JSONL)",
+                    export_jsonl(bot_choice),
+                    file_name=f"traces_{bot_choice}.jsonl",
+                    mime="application/jsonl",
+                )
+        if TRACE_LOG_ENABLED and not QUERY_API_URL:
+            st.caption(f"All traces are appended to {TRACE_LOG_PATH}")
     
     st.markdown("---")
     st.subheader(f"💬 {bot['display_name']} Sessions")
     
     # Show total sessions for this bot
-    st.caption(f"Total sessions: {len(bot['sessions'])}")
+    sessions = get_sessions(bot_choice)
+    st.caption(f"Total sessions: {len(sessions)}")
     
     # New session button
     if st.button("➕ New Chat Session", use_container_width=True):
@@ -145,14 +206,13 @@ with st.sidebar:
         st.rerun()
     
     # Display sessions for current bot
-    sessions = bot["sessions"]
     if sessions:
         session_options = {
             sid: f"{sdata['name']} ({sdata['created_at']})" 
             for sid, sdata in sessions.items()
         }
         
-        current_active = get_active_session(bot_choice)
+        current_active = get_active_session(bot_choice, sessions)
         
         selected_session = st.selectbox(
             "Active Session",
@@ -174,13 +234,14 @@ with st.sidebar:
                 key=f"rename_{bot_choice}_{selected_session}"
             )
             if st.button("Update Name", key=f"update_{bot_choice}_{selected_session}"):
-                sessions[selected_session]["name"] = new_name
+                get_session_store().rename_session(selected_session, get_owner_id(), new_name)
                 st.success("Session renamed!")
                 st.rerun()
             
             # Delete session
             if len(sessions) > 1:
                 if st.button("🗑️ Delete Session", key=f"delete_{bot_choice}_{selected_session}"):
+                    get_session_store().delete_session(selected_session, get_owner_id())
                     del sessions[selected_session]
                     bot["active_session_id"] = list(sessions.keys())[0]
                     st.success("Session deleted!")
@@ -190,28 +251,29 @@ with st.sidebar:
     
     st.markdown("---")
     st.subheader("📤 Upload Data")
-    uploaded_file = st.file_uploader("Upload JSON data", type=['json'], key=f"upload_{bot_choice}")
+    uploaded_file = st.file_uploader("Upload JSON data", type=['json', 'jsonl'], key=f"upload_{bot_choice}")
     if uploaded_file and st.button("Load to Database", key=f"load_{bot_choice}"):
         try:
-            data = json.load(uploaded_file)
+            docs = JsonDocumentStream(uploaded_file)
+            total_bytes = docs.size() or 1
             index_name = bot["index_name"]
-            
-            success_count = 0
-            with st.spinner(f"Loading {len(data)} documents..."):
-                for item in data:
-                    try:
-                        embedding = embed_texts([item.get("text", "")])[0]
-                        pinecone_client.pinecone_upsert_to_index(
-                            index_name,
-                            item.get("id"), 
-                            embedding, 
-                            {"title": item.get("title", ""), "text": item.get("text", "")}
-                        )
-                        success_count += 1
-                    except Exception as e:
-                        st.error(f"Failed to load {item.get('id')}: {e}")
-            
-            st.success(f"✓ Loaded {success_count}/{len(data)} documents to index '{index_name}'")
+
+            progress_bar = st.progress(0.0, text=f"Loading {uploaded_file.name}...")
+
+            def _update_progress(stats):
+                progress_bar.progress(
+                    min(docs.offset / total_bytes, 1.0),
+                    text=f"{stats.total} documents ({stats.docs_per_second:.1f} docs/s)"
+                )
+
+            stats = load_uploaded_documents(
+                docs, index_name, source_name=uploaded_file.name, progress=_update_progress, backend=bot["db_type"]
+            )
+            if stats.failed_ids:
+                st.error(f"Failed to load: {', '.join(stats.failed_ids[:20])}")
+            st.caption(stats.summary())
+
+            st.success(f"✓ Loaded {stats.succeeded}/{stats.total} documents to index '{index_name}'")
         except Exception as e:
             st.error(f"Error loading data: {e}")
 
@@ -219,8 +281,12 @@ with st.sidebar:
 col_left, col_right = st.columns([1.4, 1])
 
 # Get active session for current bot
-active_session_id = get_active_session(bot_choice)
-active_session = bot["sessions"][active_session_id]
+store = get_session_store()
+sessions = get_sessions(bot_choice)
+active_session_id = get_active_session(bot_choice, sessions)
+active_session = sessions[active_session_id]
+# Only the newest page(s) of a session are read and rendered on each rerun.
+history_limit = bot.setdefault("history_limit", {}).get(active_session_id, HISTORY_PAGE_SIZE)
 
 with col_left:
     
@@ -229,10 +295,16 @@ with col_left:
     st.subheader("Chat History")
     
     # Display chat messages
-    if not active_session["messages"]:
+    messages = store.messages(active_session_id, get_owner_id(), limit=history_limit)
+    if not messages:
         st.info(f"No messages in this session yet. Start chatting with {bot['display_name']}!")
     else:
-        for msg in active_session["messages"]:
+        older = active_session["message_count"] - len(messages)
+        if older > 0:
+            if st.button(f"⬆️ Load older messages ({older} more)", key=f"older_{bot_choice}_{active_session_id}"):
+                bot["history_limit"][active_session_id] = history_limit + HISTORY_PAGE_SIZE
+                st.rerun()
+        for msg in messages:
             with st.chat_message(msg["role"]):
                 st.write(msg["content"])
                 
@@ -243,9 +315,10 @@ with col_left:
                             st.write(f"- {citation}")
     
     # Clear session button
-    if active_session["messages"]:
+    if messages:
         if st.button("🗑️ Clear Chat History", key=f"clear_{bot_choice}"):
-            active_session["messages"] = []
+            store.clear_messages(active_session_id, get_owner_id())
+            bot["history_limit"].pop(active_session_id, None)
             st.rerun()
 
 with col_right:
@@ -264,88 +337,87 @@ with col_right:
             st.warning("Please enter a query.")
         else:
             # Add user message
-            active_session["messages"].append({"role": "user", "content": query})
-            
-            with st.spinner("Planning steps..."):
-                steps = plan_steps_for_query(query)
-                st.info("**Plan:**")
-                for s in steps:
-                    st.write("- " + s)
-
-            # Generate embedding for query
-            with st.spinner("Generating query embedding..."):
+            store.append_message(active_session_id, get_owner_id(), "user", query)
+            if search_all_bots:
+                targets = {(b["db_type"], b["index_name"]) for b in st.session_state.bots.values()}
+                searching = f"{len(targets)} indexes"
+            else:
+                searching = f"{bot['db_type']} index '{bot['index_name']}'"
+
+            # The engine (in-process or behind QUERY_API_URL) does the work;
+            # this handler only renders its events.
+            events = query_client.query_events(bot_choice, query, all_bots=search_all_bots)
+            context, done, pending = None, None, []
+            with st.spinner(f"Planning and searching {searching}..."):
                 try:
-                    emb_vec = embed_texts([query])[0]
+                    plan = next(events)
+                    context = next(events)
                 except Exception as e:
-                    st.error(f"Embedding error: {e}")
-                    emb_vec = None
-
-            # Retrieve from Pinecone
-            retrieved = []
-            if emb_vec is not None:
-                with st.spinner(f"Searching Pinecone index '{bot['index_name']}'..."):
-                    retrieved = pinecone_client.pinecone_query_index(
-                        bot["index_name"],
-                        vectors=emb_vec,
-                        top_k=4
-                    )
-                    st.write(f"Found {len(retrieved)} documents")
-            
-            if not retrieved:
-                clar = "No documents returned from Pinecone."
-                st.warning(clar)
-                active_session["messages"].append({"role": "assistant", "content": clar})
-            else:
-                # 🔹 Extract the `text` field from each retrieved item
-                doc_texts = []
-            
-                for item in retrieved:
-                    text = ""
-            
-                    # Case 1: dict from Pinecone
-                    if isinstance(item, dict):
-                        meta = item.get("metadata", {})
-                        if isinstance(meta, dict):
-                            text = meta.get("text", "")
-                        if not text:
-                            text = item.get("text", "")
-            
-                    # Case 2: tuple/list (score, metadata)
-                    elif isinstance(item, (list, tuple)):
-                        for part in item:
-                            if isinstance(part, dict):
-                                text = part.get("text", "")
-                                if text:
-                                    break
-            
-                    if isinstance(text, str) and text.strip():
-                        doc_texts.append(text.strip())
-            
-                if not doc_texts:
-                    st.warning("Retrieved docs but couldn't find any 'text' fields.")
+                    st.error(f"Query error: {e}")
+
+            if context is not None:
+                if plan["steps"]:
+                    st.info("**Plan:**")
+                    for s in plan["steps"]:
+                        st.write("- " + s)
+
+                status = context["status"]
+                if status == "error":
+                    st.error(context["answer"])
+                elif status == "cached":
+                    # Near-duplicates of a recent query reuse its answer
+                    st.success("**Answer (grounded, cached):**")
+                    st.write(context["answer"])
                 else:
-                    with st.spinner("Generating grounded answer..."):
-                        # ✅ call the fixed function
-                        best_sents = best_sentences_for_query(doc_texts, query, k=3)
-                        answer = " ".join(best_sents)
-                        citations = best_sents  # or build nicer ones if you want
-            
-                    st.success("**Answer (grounded):**")
-                    st.write(answer)
-            
-                    if citations:
-                        st.markdown("**Citations:**")
-                        for c in citations:
-                            st.write("- " + c)
-            
-                    active_session["messages"].append({
-                        "role": "assistant",
-                        "content": answer,
-                        "citations": citations,
-                    })
-                    st.session_state.bots[bot_choice]["sessions"][active_session_id] = active_session
+                    st.write(f"Found {len(context['documents'])} documents in {searching}")
+                    if status != "ok":
+                        st.warning(context["answer"])
+                    else:
+                        st.success("**Answer (grounded):**")
+                        st.write(context["answer"])
+                if status in ("ok", "cached") and context["citations"]:
+                    st.markdown("**Citations:**")
+                    for c in context["citations"]:
+                        st.write("- " + c)
+
+                def _refined_chunks():
+                    # Gemini's refined answer as it streams in; other events are kept for below.
+                    for event in events:
+                        if event["event"] != "token":
+                            pending.append(event)
+                            return
+                        yield event["text"]
+
+                try:
+                    first = next(events)
+                    if first["event"] == "token":
+                        st.success("**Answer (refined):**")
+                        st.write_stream(itertools.chain([first["text"]], _refined_chunks()))
+                    else:
+                        pending.append(first)
+                    pending.extend(events)
+                except Exception as e:
+                    st.warning(f"Could not refine the answer: {e}")
+
+                for event in pending:
+                    if event["event"] == "error":
+                        st.warning(event["message"])
+                    elif event["event"] == "done":
+                        done = event
+
+            if done is not None:
+                if done["status"] == "ok":
+                    t = done["timings"]
+                    first_token = f", first token {t['first_token']:.2f}s" if t["first_token"] else ""
+                    st.caption(
+                        f"plan {t['plan']:.2f}s, embed {t['embed']:.2f}s, "
+                        f"retrieve {t['retrieve']:.2f}s{first_token}"
+                    )
+                    if done["rerank"]:
+                        st.caption(done["rerank"])
+                if done["status"] in ("ok", "cached", "no_results"):
+                    store.append_message(active_session_id, get_owner_id(), "assistant", done["answer"], done["citations"])
 
-            
             st.rerun()
 
     st.markdown("---")
@@ -357,13 +429,13 @@ with col_right:
     #         "bot_display_name": bot['display_name'],
     #         "session_id": active_session_id,
     #         "session_name": active_session["name"],
-    #         "message_count": len(active_session["messages"]),
+    #         "message_count": active_session["message_count"],
     #         "index_name": bot["index_name"],
-    #         "total_sessions_for_bot": len(bot["sessions"]),
-    #         "all_session_ids": list(bot["sessions"].keys()),
+    #         "total_sessions_for_bot": len(sessions),
+    #         "all_session_ids": list(sessions.keys()),
     #         "all_bots": {
     #             k: {
-    #                 "total_sessions": len(v["sessions"]),
+    #                 "total_sessions": len(store.list_sessions(k, get_owner_id())),
     #                 "active_session": v.get("active_session_id")
     #             }
     #             for k, v in st.session_state.bots.items()
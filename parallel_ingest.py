@@ -0,0 +1,266 @@
+# app/parallel_ingest.py
+"""
+Multi-process ingestion. Source files are cut into shards (a whole small
+file, or a byte range of a large one starting and ending on document
+boundaries) and a pool of worker processes reads, chunks and embeds the
+shards, each worker with its own model instance pinned to a share of the
+cores. The embedded passages come back over a bounded queue to the parent,
+where one UpsertWriter per file upserts them, updates the sparse index and
+commits the manifest.
+
+Parallel runs do not write byte-offset checkpoints (shards finish out of
+order); an interrupted run is resumed by the manifest, which skips every
+document already upserted.
+"""
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import embedding
+from chunking import chunk_document
+from ingest import (
+    DEFAULT_EMBED_BATCH_SIZE, DEFAULT_MAX_RETRIES, IngestStats, UpsertWriter, _with_retries, batched,
+    document_vectors,
+)
+from json_stream import JsonDocumentStream
+from manifest import IndexManifest, content_hash
+
+# Files larger than this are split into byte ranges of about this size.
+INGEST_SHARD_BYTES = int(os.getenv("INGEST_SHARD_BYTES", str(16 * 1024 * 1024)))
+# Torch/ONNX threads per worker process; 0 = the cores divided among the workers.
+INGEST_THREADS_PER_PROCESS = int(os.getenv("INGEST_THREADS_PER_PROCESS", "0"))
+# Embedded batches waiting for the parent, per worker, before workers block.
+QUEUE_BATCHES_PER_PROCESS = 2
+
+
+@dataclass
+class IngestJob:
+    """One source file going to one index through its writer."""
+    path: str
+    writer: UpsertWriter
+    manifest: Optional[IndexManifest] = None
+    # False when a shard could not be read to the end (the manifest must not
+    # treat the documents it did not see as removed).
+    complete: bool = True
+
+
+def plan_shards(path: str, shard_bytes: int = INGEST_SHARD_BYTES) -> List[Tuple[int, Optional[int]]]:
+    """
+    (start, end) byte ranges covering a JSON array / JSON Lines file, each
+    starting and ending on a document boundary; end is None for the last one.
+    JSON Lines boundaries are found by seeking; a JSON array is parsed once.
+    """
+    size = os.path.getsize(path)
+    if shard_bytes <= 0 or size <= shard_bytes:
+        return [(0, None)]
+    boundaries = [0]
+    stream = JsonDocumentStream(path)
+    if stream.detect_format() == "jsonl":
+        with open(path, "rb") as f:
+            for target in range(shard_bytes, size, shard_bytes):
+                # Starting one byte early keeps a target that is already a line start.
+                f.seek(target - 1)
+                f.readline()
+                if f.tell() >= size:
+                    break
+                if f.tell() > boundaries[-1]:
+                    boundaries.append(f.tell())
+    else:
+        for _ in stream:
+            if stream.offset - boundaries[-1] >= shard_bytes:
+                boundaries.append(stream.offset)
+        if len(boundaries) > 1 and boundaries[-1] == stream.offset:
+            boundaries.pop()
+    return list(zip(boundaries, boundaries[1:] + [None]))
+
+
+def iter_shard(path: str, start: int = 0, end: Optional[int] = None) -> Iterator[Dict]:
+    """Documents of one shard from `plan_shards`: those starting before `end`."""
+    docs = JsonDocumentStream(path, start_offset=start)
+    for doc in docs:
+        # No document straddles a boundary, so one ending past `end` belongs to the next shard.
+        if end is not None and docs.offset > end:
+            return
+        yield doc
+        if end is not None and docs.offset >= end:
+            return
+
+
+_results = None
+_stop = None
+_manifests: Dict[Tuple[str, str], IndexManifest] = {}
+
+
+def _init_worker(results, stop, threads: int, setup: Optional[Callable[[], None]]):
+    global _results, _stop
+    _results, _stop = results, stop
+    # Finished batches are only left unread when the run is being aborted.
+    results.cancel_join_thread()
+    # Read by get_model() when this process loads its own encoder.
+    embedding.EMBEDDING_THREADS = threads
+    if setup is not None:
+        setup()
+
+
+def _send(message):
+    while True:
+        try:
+            _results.put(message, timeout=1.0)
+            return
+        except queue.Full:
+            if _stop.is_set():
+                raise RuntimeError("ingestion aborted")
+
+
+def _worker_manifest(path: str, fingerprint: str) -> IndexManifest:
+    # Read-only copy used to skip unchanged documents before embedding them;
+    # the parent's manifest records what was actually upserted.
+    if (path, fingerprint) not in _manifests:
+        _manifests[(path, fingerprint)] = IndexManifest(path, fingerprint)
+    return _manifests[(path, fingerprint)]
+
+
+def _ingest_shard(task_id, path, start, end, manifest_key, embed_batch_size, max_retries):
+    error = None
+    try:
+        manifest = _worker_manifest(*manifest_key) if manifest_key else None
+        for batch in batched(iter_shard(path, start, end), embed_batch_size):
+            seen, valid = [], []
+            for doc in batch:
+                if not doc.get("id"):
+                    continue
+                if manifest is not None:
+                    digest = content_hash(doc)
+                    seen.append((doc["id"], digest))
+                    if not manifest.observe(doc["id"], digest):
+                        continue
+                valid.append(doc)
+            counters = IngestStats(index_name="")
+            result = {
+                "seen": seen,
+                "missing_id": sum(1 for doc in batch if not doc.get("id")),
+                "skipped": len(seen) - len(valid) if manifest is not None else 0,
+                "vectors": [],
+                "failed": [],
+            }
+            if valid:
+                chunks = [chunk_document(d) for d in valid]
+                passages = [c for doc_chunks in chunks for c in doc_chunks]
+                t0 = time.perf_counter()
+                try:
+                    embeddings = _with_retries(
+                        lambda: embedding.embed_array([c.get("text", "") for c in passages]),
+                        max_retries,
+                        counters,
+                    )
+                    result["vectors"] = document_vectors(valid, chunks, embeddings)
+                except Exception as e:
+                    result["failed"] = [d["id"] for d in valid]
+                    result["error"] = str(e)
+                result["embed_seconds"] = time.perf_counter() - t0
+            result["retries"] = counters.retries
+            _send(("batch", task_id, result))
+    except Exception as e:
+        error = str(e)
+    try:
+        _send(("done", task_id, error))
+    except RuntimeError:
+        pass
+
+
+def _apply(job: IngestJob, result: Dict):
+    writer, stats = job.writer, job.writer.stats
+    if job.manifest is not None:
+        for doc_id, digest in result["seen"]:
+            job.manifest.observe(doc_id, digest)
+    stats.merge(
+        skipped=result["skipped"],
+        retries=result["retries"],
+        embed_seconds=result.get("embed_seconds", 0.0),
+        failed=result["missing_id"],
+    )
+    if result["missing_id"]:
+        print(f"✗ Skipped {result['missing_id']} documents without an id")
+    if result["failed"]:
+        writer.fail(result["failed"])
+        print(f"✗ Embedding batch failed ({len(result['failed'])} docs, first {result['failed'][0]}): {result['error']}")
+    if result["vectors"]:
+        writer.add(result["vectors"])
+
+
+def ingest_parallel(
+    jobs: List[IngestJob],
+    processes: int = 0,
+    threads_per_process: int = INGEST_THREADS_PER_PROCESS,
+    shard_bytes: int = INGEST_SHARD_BYTES,
+    embed_batch_size: int = DEFAULT_EMBED_BATCH_SIZE,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    setup: Optional[Callable[[], None]] = None,
+) -> List[IngestStats]:
+    """
+    Ingest several files at once on a pool of worker processes.
+    Args:
+        jobs: source file, writer and (for incremental runs) manifest per file
+        processes: worker processes; 0 = one per core
+        threads_per_process: model threads per worker; 0 = cores / processes
+        shard_bytes: target size of the byte ranges large files are split into
+        embed_batch_size: documents whose passages go into one `embed_array` call
+        max_retries: extra attempts per failed embed batch (upserts retry in the writer)
+        setup: picklable callable run in every worker after start-up (benchmarks
+            use it to install stand-in encoders)
+    Returns:
+        The closed writers' IngestStats, in the order of `jobs`
+    """
+    cores = os.cpu_count() or 1
+    processes = processes or cores
+    threads = threads_per_process or max(1, cores // processes)
+    shards = [(j, start, end) for j, job in enumerate(jobs) for start, end in plan_shards(job.path, shard_bytes)]
+    sizes = {job.path: os.path.getsize(job.path) for job in jobs}
+    # Largest shards first so the last ones to finish are short.
+    shards.sort(key=lambda s: -((s[2] if s[2] is not None else sizes[jobs[s[0]].path]) - s[1]))
+    print(f"Ingesting {len(jobs)} files as {len(shards)} shards on {processes} processes × {threads} threads")
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue(maxsize=QUEUE_BATCHES_PER_PROCESS * processes)
+    stop = ctx.Event()
+    pool = ProcessPoolExecutor(
+        max_workers=processes, mp_context=ctx, initializer=_init_worker, initargs=(results, stop, threads, setup),
+    )
+    try:
+        futures = {}
+        for task_id, (j, start, end) in enumerate(shards):
+            manifest = jobs[j].manifest
+            manifest_key = (manifest.path, manifest.fingerprint) if manifest is not None else None
+            futures[task_id] = pool.submit(
+                _ingest_shard, task_id, jobs[j].path, start, end, manifest_key, embed_batch_size, max_retries,
+            )
+        running = set(futures)
+        while running:
+            try:
+                kind, task_id, payload = results.get(timeout=1.0)
+            except queue.Empty:
+                # A worker that died (e.g. killed for memory) never reports its shard.
+                for task_id in [t for t in running if futures[t].done() and futures[t].exception()]:
+                    running.discard(task_id)
+                    job = jobs[shards[task_id][0]]
+                    job.complete = False
+                    print(f"✗ Shard {shards[task_id][1]}… of {job.path} failed: {futures[task_id].exception()}")
+                continue
+            job = jobs[shards[task_id][0]]
+            if kind == "batch":
+                _apply(job, payload)
+                continue
+            running.discard(task_id)
+            if payload is not None:
+                job.complete = False
+                print(f"✗ Shard {shards[task_id][1]}… of {job.path} failed: {payload}")
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        pool.shutdown(cancel_futures=True)
+    return [job.writer.close() for job in jobs]
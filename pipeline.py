@@ -0,0 +1,217 @@
+# app/pipeline.py
+"""
+asyncio query pipeline. The blocking pieces (planner, embedding model,
+vector store clients, Gemini SDK) run in worker threads so that planning
+overlaps embedding, several retrievals run at once, and Gemini's answer
+can be consumed chunk by chunk as it is generated.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from chunking import CHUNK_QUERY_FACTOR, group_by_parent
+from connectors import get_backend
+from connectors.sparse_index import sparse_query_index
+from connectors.planner.executor import stream_plan
+from connectors.planner.planner import plan_steps_for_query
+from embedding_batcher import embed_query_async
+from fusion import fuse_targets, reciprocal_rank_fusion
+from rerank import RERANK_BUDGET_MS, RerankReport, rerank
+
+# (backend name, index name) of one retrieval.
+Target = Tuple[str, str]
+
+# Retrievals get their own pool so a fan-out over every index is not
+# queued behind planner/embedding/Gemini work on asyncio's default executor.
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "8"))
+# Fuse dense hits with BM25 hits from the index's local sparse index.
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") != "0"
+SPARSE_WEIGHT = float(os.getenv("HYBRID_SPARSE_WEIGHT", "1.0"))
+_retrieval_pool = None
+_retrieval_pool_lock = threading.Lock()
+
+
+def _get_retrieval_pool() -> ThreadPoolExecutor:
+    global _retrieval_pool
+    with _retrieval_pool_lock:
+        if _retrieval_pool is None:
+            _retrieval_pool = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieve")
+        return _retrieval_pool
+
+
+@dataclass
+class QueryTimings:
+    """Seconds spent in each stage of one query, measured from `started_at`."""
+    started_at: float = field(default_factory=time.perf_counter)
+    plan_seconds: float = 0.0
+    embed_seconds: float = 0.0
+    retrieve_seconds: float = 0.0
+    rerank: Optional[RerankReport] = None
+    first_token_seconds: Optional[float] = None
+
+    def since_start(self) -> float:
+        return time.perf_counter() - self.started_at
+
+
+async def _timed(fn, *args):
+    t0 = time.perf_counter()
+    result = await asyncio.to_thread(fn, *args)
+    return result, time.perf_counter() - t0
+
+
+async def _timed_embed(embed, query):
+    t0 = time.perf_counter()
+    vector = await embed(query)
+    return vector, time.perf_counter() - t0
+
+
+async def plan_and_embed(
+    query: str,
+    timings: Optional[QueryTimings] = None,
+    embed: Optional[Callable[[str], Awaitable[np.ndarray]]] = None,
+) -> Tuple[List[str], np.ndarray]:
+    """
+    Run the planner and the query embedding concurrently; returns (plan steps, vector).
+    The query is embedded by the shared micro-batcher unless `embed` is given.
+    """
+    (steps, plan_s), (vector, embed_s) = await asyncio.gather(
+        _timed(plan_steps_for_query, query),
+        _timed_embed(embed or embed_query_async, query),
+    )
+    if timings is not None:
+        timings.plan_seconds, timings.embed_seconds = plan_s, embed_s
+    return steps, vector
+
+
+async def retrieve(
+    vector,
+    targets: Sequence[Target],
+    top_k: int = 4,
+    timings: Optional[QueryTimings] = None,
+    query: Optional[str] = None,
+) -> Dict[Target, List[Tuple[float, Dict]]]:
+    """
+    Query every target index at once. Given the query text (and HYBRID_SEARCH),
+    each index's dense hits are fused with its BM25 hits by reciprocal rank.
+    Passage hits of each index are grouped into their parent documents; a
+    failing target yields an empty list.
+    """
+    loop = asyncio.get_running_loop()
+    pool = _get_retrieval_pool()
+    k = top_k * CHUNK_QUERY_FACTOR
+
+    def submit(fn, *args):
+        # run_in_executor does not carry context variables (the current trace) over.
+        return loop.run_in_executor(pool, contextvars.copy_context().run, fn, *args)
+
+    async def one(target):
+        backend, index_name = target
+        dense = submit(get_backend(backend).query_index, index_name, vector, k)
+        if not (query and HYBRID_SEARCH):
+            return group_by_parent(await dense, top_k=top_k)
+        sparse = submit(sparse_query_index, backend, index_name, query, k)
+        dense_hits, sparse_hits = await asyncio.gather(dense, sparse)
+        if not sparse_hits:
+            return group_by_parent(dense_hits, top_k=top_k)
+        hits = reciprocal_rank_fusion(
+            {"dense": dense_hits, "sparse": sparse_hits}, top_k=k, weights={"sparse": SPARSE_WEIGHT}
+        )
+        return group_by_parent(hits, top_k=top_k)
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(one(t) for t in targets), return_exceptions=True)
+    if timings is not None:
+        timings.retrieve_seconds = time.perf_counter() - t0
+    out = {}
+    for target, result in zip(targets, results):
+        if isinstance(result, BaseException):
+            print(f"✗ Retrieval from {target[0]} index '{target[1]}' failed: {result}")
+            result = []
+        out[target] = result
+    return out
+
+
+async def search_all(
+    vector,
+    targets: Sequence[Target],
+    top_k: int = 4,
+    timings: Optional[QueryTimings] = None,
+    query: Optional[str] = None,
+) -> List[Tuple[float, Dict]]:
+    """
+    Fan a query out to several indexes at once and merge the per-index
+    rankings with reciprocal-rank fusion; latency is that of the slowest index.
+    """
+    results = await retrieve(vector, targets, top_k=top_k, timings=timings, query=query)
+    return fuse_targets(results, top_k=top_k)
+
+
+async def rerank_results(
+    query: str,
+    results: List[Tuple[float, Dict]],
+    top_k: int = 4,
+    budget_ms: float = RERANK_BUDGET_MS,
+    timings: Optional[QueryTimings] = None,
+) -> List[Tuple[float, Dict]]:
+    """Cross-encoder re-ranking of over-fetched results within `budget_ms` (see rerank.py)."""
+    ranked, report = await asyncio.to_thread(rerank, query, results, top_k, budget_ms)
+    if timings is not None:
+        timings.rerank = report
+    return ranked
+
+
+_DONE = object()
+
+
+async def aiter_in_thread(iterable: Iterable[str]) -> AsyncIterator[str]:
+    """
+    Consume a blocking iterator (e.g. a streamed Gemini response) in a worker
+    thread and yield its items as they arrive without blocking the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    queue: "asyncio.Queue" = asyncio.Queue()
+
+    def pump():
+        try:
+            for item in iterable:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+        except BaseException as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+
+    threading.Thread(target=pump, name="stream-pump", daemon=True).start()
+    while True:
+        item = await queue.get()
+        if item is _DONE:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+def record_first_token(chunks: Iterable[str], timings: QueryTimings) -> Iterator[str]:
+    """Pass chunks through, noting time-to-first-token in `timings`."""
+    for chunk in chunks:
+        if timings.first_token_seconds is None:
+            timings.first_token_seconds = timings.since_start()
+        yield chunk
+
+
+async def stream_answer(
+    plan: List[str],
+    retrieved_docs: List[Tuple[float, Dict]],
+    query: str,
+    timings: Optional[QueryTimings] = None,
+) -> Tuple[AsyncIterator[str], List[str]]:
+    """Start Gemini on the extracted context; returns (async iterator of answer chunks, citations)."""
+    chunks, citations = await asyncio.to_thread(stream_plan, plan, retrieved_docs, query)
+    if timings is not None:
+        chunks = record_first_token(chunks, timings)
+    return aiter_in_thread(chunks), citations
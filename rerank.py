@@ -0,0 +1,118 @@
+# app/rerank.py
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from tracing import traced
+
+# Optional second stage: over-fetch RERANK_CANDIDATES documents, re-score
+# (query, text) pairs with a small CPU cross-encoder, keep the best top_k.
+RERANK_ENABLED = os.getenv("RERANK", "0") != "0"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "16"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "8"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "250"))
+# Characters of each candidate passed to the model (it truncates at 512 tokens anyway).
+RERANK_MAX_CHARS = 2000
+
+_model = None
+_loading = None
+_load_lock = threading.Lock()
+
+
+def _load():
+    global _model
+    from sentence_transformers import CrossEncoder
+    _model = CrossEncoder(RERANK_MODEL, device="cpu")
+
+
+def get_reranker(wait: bool = True):
+    """
+    Return the shared cross-encoder. With wait=False a missing model is
+    loaded in a background thread and None is returned meanwhile, so a
+    query never pays the load.
+    """
+    global _loading
+    if _model is not None:
+        return _model
+    with _load_lock:
+        if _model is None and _loading is None:
+            _loading = threading.Thread(target=_load, name="rerank-load", daemon=True)
+            _loading.start()
+        loading = _loading
+    if wait:
+        loading.join()
+    return _model
+
+
+@dataclass
+class RerankReport:
+    """What the re-ranking stage of one query did and how long it took."""
+    candidates: int = 0
+    scored: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    budget_ms: float = RERANK_BUDGET_MS
+    # "full", "truncated" (budget ran out), "skipped" (model not loaded / no time)
+    status: str = "skipped"
+
+    def summary(self) -> str:
+        return (
+            f"rerank {self.status}: {self.scored}/{self.candidates} candidates in "
+            f"{self.batches} batches, {self.seconds * 1000:.0f} ms (budget {self.budget_ms:.0f} ms)"
+        )
+
+
+@traced("rerank")
+def rerank(
+    query: str,
+    candidates: List[Tuple[float, Dict]],
+    top_k: int = 4,
+    budget_ms: float = RERANK_BUDGET_MS,
+    batch_size: int = RERANK_BATCH_SIZE,
+    model=None,
+) -> Tuple[List[Tuple[float, Dict]], RerankReport]:
+    """
+    Re-score first-stage (score, doc) candidates, best first, with the
+    cross-encoder and return the top_k plus a report.
+    Candidates are scored in batches in first-stage order; a batch is only
+    started if, judging by the slowest batch so far, it fits in the budget.
+    Candidates scored in time are ranked by cross-encoder score ahead of
+    the rest, which keep their first-stage order. Returned scores are the
+    cross-encoder logits; unscored docs get descending scores below the
+    lowest logit so sorting by score keeps this order. A budget <= 0 skips
+    the stage.
+    """
+    t0 = time.perf_counter()
+    report = RerankReport(candidates=len(candidates), budget_ms=budget_ms)
+    model = model or get_reranker(wait=False)
+    if model is None or len(candidates) <= 1 or budget_ms <= 0:
+        report.seconds = time.perf_counter() - t0
+        return candidates[:top_k], report
+
+    budget = budget_ms / 1000.0
+    pairs = [(query, (doc.get("text") or "")[:RERANK_MAX_CHARS]) for _, doc in candidates]
+    scores = []
+    slowest = 0.0
+    for start in range(0, len(pairs), batch_size):
+        elapsed = time.perf_counter() - t0
+        if start and elapsed + slowest > budget:
+            break
+        b0 = time.perf_counter()
+        scores.extend(np.asarray(model.predict(pairs[start:start + batch_size]), dtype=np.float32).reshape(-1).tolist())
+        slowest = max(slowest, time.perf_counter() - b0)
+        report.batches += 1
+
+    report.scored = len(scores)
+    report.status = "full" if report.scored == len(candidates) else "truncated"
+    order = sorted(range(report.scored), key=lambda i: scores[i], reverse=True)
+    floor = min(scores) - 1.0
+    ranked = [(scores[i], candidates[i][1]) for i in order] + [
+        (floor - i, doc) for i, (_, doc) in enumerate(candidates[report.scored:])
+    ]
+    report.seconds = time.perf_counter() - t0
+    return ranked[:top_k], report
@@ -0,0 +1,169 @@
+# app/session_store.py
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+DEFAULT_SESSION_DB_PATH = os.path.join(".sessions", "sessions.sqlite3")
+# Messages rendered per page of chat history.
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+
+
+class SessionStore:
+    """
+    Chat sessions and their messages in SQLite (WAL), shared by every
+    Streamlit session of the process. Every session belongs to an owner id
+    (one per browser, see multi_chatbot_platform.get_owner_id) and is only
+    listed, read or changed for that owner. Messages are append-only rows
+    keyed by an increasing id, so the newest page of a session is one
+    indexed range scan however long the session gets.
+    """
+
+    def __init__(self, path: str = DEFAULT_SESSION_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY, bot TEXT NOT NULL, name TEXT NOT NULL,"
+            " created_at TEXT NOT NULL, message_count INTEGER NOT NULL DEFAULT 0,"
+            " owner TEXT NOT NULL DEFAULT '')"
+        )
+        columns = [r[1] for r in self._db.execute("PRAGMA table_info(sessions)")]
+        if "owner" not in columns:
+            # Sessions from before owners were recorded stay unowned, hidden from everyone.
+            self._db.execute("ALTER TABLE sessions ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+        self._db.execute("DROP INDEX IF EXISTS sessions_bot")
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_owner_bot ON sessions(owner, bot, created_at)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " session_id TEXT NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,"
+            " role TEXT NOT NULL, content TEXT NOT NULL, citations TEXT, created_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages(session_id, id)")
+        self._db.commit()
+
+    # -- sessions --------------------------------------------------------
+
+    def create_session(self, bot: str, owner: str, name: Optional[str] = None) -> Dict:
+        now = datetime.now()
+        session = {
+            "id": f"session_{now.strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:8]}",
+            "bot": bot,
+            "created_at": now.strftime("%Y-%m-%d %H:%M:%S"),
+            "message_count": 0,
+        }
+        with self._lock:
+            count = self._db.execute(
+                "SELECT COUNT(*) FROM sessions WHERE owner = ? AND bot = ?", (owner, bot)
+            ).fetchone()[0]
+            session["name"] = name or f"Chat {count + 1}"
+            self._db.execute(
+                "INSERT INTO sessions (id, bot, name, created_at, owner) VALUES (?, ?, ?, ?, ?)",
+                (session["id"], bot, session["name"], session["created_at"], owner),
+            )
+            self._db.commit()
+        return session
+
+    def list_sessions(self, bot: str, owner: str) -> List[Dict]:
+        """One owner's sessions of one bot, oldest first."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, name, created_at, message_count FROM sessions"
+                " WHERE owner = ? AND bot = ? ORDER BY created_at, id",
+                (owner, bot),
+            ).fetchall()
+        return [{"id": r[0], "bot": bot, "name": r[1], "created_at": r[2], "message_count": r[3]} for r in rows]
+
+    def _owns(self, session_id: str, owner: str) -> bool:
+        return self._db.execute(
+            "SELECT 1 FROM sessions WHERE id = ? AND owner = ?", (session_id, owner)
+        ).fetchone() is not None
+
+    def rename_session(self, session_id: str, owner: str, name: str):
+        with self._lock:
+            self._db.execute("UPDATE sessions SET name = ? WHERE id = ? AND owner = ?", (name, session_id, owner))
+            self._db.commit()
+
+    def delete_session(self, session_id: str, owner: str):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE id = ? AND owner = ?", (session_id, owner))
+            self._db.commit()
+
+    # -- messages --------------------------------------------------------
+
+    def append_message(
+        self, session_id: str, owner: str, role: str, content: str, citations: Optional[List[str]] = None,
+    ) -> Optional[int]:
+        """Append one message; returns its id (None when the session is not the owner's)."""
+        with self._lock:
+            if not self._owns(session_id, owner):
+                return None
+            cur = self._db.execute(
+                "INSERT INTO messages (session_id, role, content, citations, created_at) VALUES (?, ?, ?, ?, ?)",
+                (session_id, role, content, json.dumps(citations) if citations else None, time.time()),
+            )
+            self._db.execute("UPDATE sessions SET message_count = message_count + 1 WHERE id = ?", (session_id,))
+            self._db.commit()
+            return cur.lastrowid
+
+    def messages(
+        self, session_id: str, owner: str, limit: int = HISTORY_PAGE_SIZE, before_id: Optional[int] = None,
+    ) -> List[Dict]:
+        """
+        The `limit` newest messages of one of the owner's sessions (older than
+        `before_id` when given, for paging backwards), returned oldest first.
+        """
+        query = (
+            "SELECT m.id, m.role, m.content, m.citations FROM messages m"
+            " JOIN sessions s ON s.id = m.session_id WHERE m.session_id = ? AND s.owner = ?"
+        )
+        params = [session_id, owner]
+        if before_id is not None:
+            query += " AND m.id < ?"
+            params.append(before_id)
+        query += " ORDER BY m.id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [
+            {"id": r[0], "role": r[1], "content": r[2], "citations": json.loads(r[3]) if r[3] else []}
+            for r in reversed(rows)
+        ]
+
+    def message_count(self, session_id: str, owner: str) -> int:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT message_count FROM sessions WHERE id = ? AND owner = ?", (session_id, owner)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def clear_messages(self, session_id: str, owner: str):
+        with self._lock:
+            if not self._owns(session_id, owner):
+                return
+            self._db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._db.execute("UPDATE sessions SET message_count = 0 WHERE id = ?", (session_id,))
+            self._db.commit()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """The process-wide store at SESSION_DB_PATH."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore(os.getenv("SESSION_DB_PATH", DEFAULT_SESSION_DB_PATH))
+        return _store
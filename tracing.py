@@ -0,0 +1,209 @@
+# app/tracing.py
+"""
+Lightweight request tracing. A trace covers one query of one bot; code on
+the query path wraps its stages in `span("name")`, which records monotonic
+start/duration into the current trace. Outside a trace spans cost one
+context-variable lookup and record nothing, so shared code (embedding,
+vector queries) can be instrumented without affecting ingestion.
+
+Finished traces feed rolling per-bot, per-stage latency windows
+(`stage_percentiles`) and are appended to a JSON Lines log (TRACE_LOG_PATH;
+TRACE_LOG=0 disables it) for offline analysis.
+"""
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+
+TRACE_LOG_ENABLED = os.getenv("TRACE_LOG", "1") != "0"
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", os.path.join(".traces", "traces.jsonl"))
+# Durations kept per (bot, stage) for the rolling percentiles.
+WINDOW_SIZE = int(os.getenv("TRACE_WINDOW", "500"))
+RECENT_TRACES = 50
+
+_current: "contextvars.ContextVar[Optional[Trace]]" = contextvars.ContextVar("trace", default=None)
+_parent: "contextvars.ContextVar[Optional[int]]" = contextvars.ContextVar("span_parent", default=None)
+_ids = itertools.count(1)
+_lock = threading.Lock()
+_windows: Dict[str, Dict[str, deque]] = defaultdict(dict)
+_recent: Dict[str, deque] = defaultdict(lambda: deque(maxlen=RECENT_TRACES))
+
+
+class Trace:
+    """Spans of one query, timed with perf_counter relative to the trace start."""
+
+    def __init__(self, bot: str, **attrs):
+        self.id = f"{int(time.time() * 1000):x}-{next(_ids)}"
+        self.bot = bot
+        self.attrs = attrs
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        self.total_ms: Optional[float] = None
+        self.spans: List[Dict] = []
+        self._lock = threading.Lock()
+        self._token = None
+
+    def add(self, span: Dict):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.id,
+            "bot": self.bot,
+            "started_at": self.wall_start,
+            "total_ms": self.total_ms,
+            **({"attrs": self.attrs} if self.attrs else {}),
+            "spans": sorted(self.spans, key=lambda s: s["start_ms"]),
+        }
+
+    def finish(self):
+        """End the trace: record its stage timings and write it to the log."""
+        if self.total_ms is not None:
+            return
+        self.total_ms = (time.perf_counter() - self.start) * 1000
+        if self._token is not None:
+            try:
+                _current.reset(self._token)
+            except ValueError:
+                # Finished from another context (e.g. an abandoned async generator).
+                pass
+            self._token = None
+        _record(self)
+
+
+def start_trace(bot: str, **attrs) -> Trace:
+    """Make a new trace current in this context; call finish() when the query is done."""
+    t = Trace(bot, **attrs)
+    t._token = _current.set(t)
+    return t
+
+
+@contextmanager
+def trace(bot: str, **attrs):
+    t = start_trace(bot, **attrs)
+    try:
+        yield t
+    finally:
+        t.finish()
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, in_trace: Optional[Trace] = None, **attrs):
+    """
+    Time the enclosed block as stage `name` of the current trace, if any
+    (or of `in_trace`, for work handed to a thread that does not inherit
+    the context). Yields the span's attrs dict so results can be added to it.
+    """
+    t = in_trace or _current.get()
+    if t is None:
+        yield attrs
+        return
+    span_id = next(_ids)
+    parent = _parent.get()
+    token = _parent.set(span_id)
+    start = time.perf_counter()
+    error = None
+    try:
+        yield attrs
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        end = time.perf_counter()
+        try:
+            _parent.reset(token)
+        except ValueError:
+            # A generator span finished in another context than it started in.
+            pass
+        record = {
+            "name": name,
+            "span_id": span_id,
+            "parent_id": parent,
+            "thread": threading.current_thread().name,
+            "start_ms": (start - t.start) * 1000,
+            "duration_ms": (end - start) * 1000,
+        }
+        if attrs:
+            record["attrs"] = attrs
+        if error:
+            record["error"] = error
+        t.add(record)
+
+
+def traced(name: str):
+    """Decorator form of span() for whole functions."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if _current.get() is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def _record(t: Trace):
+    with _lock:
+        windows = _windows[t.bot]
+        # A stage entered several times in one query (e.g. one retrieval per
+        # index) counts once, with its summed duration.
+        stages = {"total": t.total_ms}
+        for s in t.spans:
+            stages[s["name"]] = stages.get(s["name"], 0.0) + s["duration_ms"]
+        for name, ms in stages.items():
+            if name not in windows:
+                windows[name] = deque(maxlen=WINDOW_SIZE)
+            windows[name].append(ms)
+        _recent[t.bot].append(t)
+    if TRACE_LOG_ENABLED:
+        try:
+            os.makedirs(os.path.dirname(TRACE_LOG_PATH) or ".", exist_ok=True)
+            line = json.dumps(t.to_dict(), ensure_ascii=False) + "\n"
+            with _lock, open(TRACE_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            print(f"✗ Could not write trace log: {e}")
+
+
+def stage_percentiles(bot: str) -> Dict[str, Dict[str, float]]:
+    """{stage: {count, p50, p95, p99}} in ms over the last WINDOW_SIZE traced queries of a bot."""
+    with _lock:
+        windows = {name: np.asarray(d) for name, d in _windows.get(bot, {}).items()}
+    return {
+        name: {
+            "count": int(len(arr)),
+            "p50": float(np.percentile(arr, 50)),
+            "p95": float(np.percentile(arr, 95)),
+            "p99": float(np.percentile(arr, 99)),
+        }
+        for name, arr in windows.items() if len(arr)
+    }
+
+
+def recent_traces(bot: str) -> List[Dict]:
+    """The latest traces of a bot, newest first, as dicts."""
+    with _lock:
+        traces = list(_recent.get(bot, ()))
+    return [t.to_dict() for t in reversed(traces)]
+
+
+def export_jsonl(bot: Optional[str] = None) -> str:
+    """Recent traces (of one bot or all) as JSON Lines, e.g. for a download button."""
+    with _lock:
+        bots = [bot] if bot else list(_recent)
+        traces = [t for b in bots for t in _recent.get(b, ())]
+    return "".join(json.dumps(t.to_dict(), ensure_ascii=False) + "\n" for t in traces)
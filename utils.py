@@ -1,45 +1,252 @@
 # app/utils.py
+import base64
 import re
-from typing import List, Union
+import zlib
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from tracing import traced
+
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+')
+_TOKEN = re.compile(r"\w+")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
 
 
 def simple_tokenize_sentences(text: str) -> List[str]:
     return [s.strip() for s in re.split(r'(?<=[.!?])\s+', text) if s.strip()]
 
 
-def best_sentences_for_query(
-    texts: Union[str, List[str]],
-    query: str,
-    k: int = 2
-) -> List[str]:
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """(start, end) offsets of the sentences `simple_tokenize_sentences` returns."""
+    spans = []
+    start = 0
+    for end, next_start in [(m.start(), m.end()) for m in _SENTENCE_SPLIT.finditer(text)] + [(len(text), len(text))]:
+        piece = text[start:end]
+        stripped = piece.strip()
+        if stripped:
+            lead = len(piece) - len(piece.lstrip())
+            spans.append((start + lead, start + lead + len(stripped)))
+        start = next_start
+    return spans
+
+
+def hash_tokens(text: str) -> List[int]:
+    """crc32 ids of the lowercased \\w+ tokens of `text`, in order."""
+    return [zlib.crc32(t.encode("utf-8")) for t in _TOKEN.findall(text.lower())]
+
+
+@lru_cache(maxsize=1024)
+def token_ids(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted unique token ids (see hash_tokens) and their counts."""
+    ids = np.asarray(hash_tokens(text), dtype=np.uint32)
+    if not len(ids):
+        return ids, np.zeros(0, dtype=np.uint16)
+    ids, counts = np.unique(ids, return_counts=True)
+    return ids, np.minimum(counts, np.iinfo(np.uint16).max).astype(np.uint16)
+
+
+class SentenceIndex(NamedTuple):
     """
-    Robust version:
-    - `texts` can be a single string OR list of strings (multiple docs)
-    - `query` must be a string
-    - returns top-k sentences that overlap most with query words
+    Sentences of one or more documents with their token ids in CSR layout:
+    the ids of sentence i are term_ids[indptr[i]:indptr[i + 1]] and
+    rows[j] is the sentence term j belongs to.
     """
+    sentences: List[str]
+    indptr: np.ndarray      # int64, len(sentences) + 1
+    term_ids: np.ndarray    # uint32
+    term_counts: np.ndarray  # uint16
+    rows: np.ndarray        # int64, len(term_ids)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.bincount(self.rows, weights=self.term_counts, minlength=len(self.sentences))
+
+
+def _csr_index(sentences: List[str], indptr, term_ids, term_counts) -> SentenceIndex:
+    indptr = np.asarray(indptr, dtype=np.int64)
+    rows = np.repeat(np.arange(len(sentences)), np.diff(indptr))
+    return SentenceIndex(sentences, indptr, term_ids, term_counts, rows)
+
+
+def build_sentence_index(text: str, spans: Optional[Sequence[Tuple[int, int]]] = None) -> SentenceIndex:
+    """Split `text` into sentences (or use precomputed spans) and tokenize each once."""
+    if spans is None:
+        spans = sentence_spans(text)
+    sentences = [text[s:e] for s, e in spans]
+    hashed = [hash_tokens(sentence) for sentence in sentences]
+    ids = np.fromiter((h for hs in hashed for h in hs), dtype=np.uint64)
+    sentence_of = np.repeat(np.arange(len(sentences), dtype=np.uint64), [len(hs) for hs in hashed])
+    # One unique over (sentence, token) keys instead of one per sentence.
+    keys, counts = np.unique((sentence_of << np.uint64(32)) | ids, return_counts=True)
+    rows = (keys >> np.uint64(32)).astype(np.int64)
+    indptr = np.searchsorted(rows, np.arange(len(sentences) + 1))
+    return SentenceIndex(
+        sentences,
+        indptr.astype(np.int64),
+        (keys & np.uint64(0xFFFFFFFF)).astype(np.uint32),
+        np.minimum(counts, np.iinfo(np.uint16).max).astype(np.uint16),
+        rows,
+    )
+
+
+def encode_sentence_index(text: str) -> str:
+    """
+    Compact string form of a document's sentence index, stored in vector
+    metadata at ingest time: base64 of spans (int32), indptr (int32), ids
+    (uint32) and counts (uint16), preceded by the sentence count.
+    """
+    spans = sentence_spans(text)
+    index = build_sentence_index(text, spans)
+    header = np.asarray([len(spans), len(index.term_ids)], dtype=np.int32)
+    payload = b"".join([
+        header.tobytes(),
+        np.asarray(spans, dtype=np.int32).reshape(-1).tobytes(),
+        index.indptr.astype(np.int32).tobytes(),
+        index.term_ids.tobytes(),
+        index.term_counts.tobytes(),
+    ])
+    return base64.b64encode(payload).decode("ascii")
+
 
-    # 🔹 Normalize texts → one big string
-    if isinstance(texts, list):
-        texts = "\n".join(t for t in texts if isinstance(t, str))
-    elif not isinstance(texts, str):
-        texts = str(texts)
+def decode_sentence_index(text: str, encoded: str) -> SentenceIndex:
+    payload = base64.b64decode(encoded)
+    n_sents, n_terms = np.frombuffer(payload, dtype=np.int32, count=2)
+    pos = 8
+    spans = np.frombuffer(payload, dtype=np.int32, count=2 * n_sents, offset=pos).reshape(-1, 2)
+    pos += spans.nbytes
+    indptr = np.frombuffer(payload, dtype=np.int32, count=n_sents + 1, offset=pos)
+    pos += indptr.nbytes
+    term_ids = np.frombuffer(payload, dtype=np.uint32, count=n_terms, offset=pos)
+    pos += term_ids.nbytes
+    term_counts = np.frombuffer(payload, dtype=np.uint16, count=n_terms, offset=pos)
+    return _csr_index([text[s:e] for s, e in spans], indptr, term_ids, term_counts)
+
+
+@lru_cache(maxsize=4096)
+def _cached_sentence_index(text: str) -> SentenceIndex:
+    return build_sentence_index(text)
+
+
+@lru_cache(maxsize=4096)
+def _decoded_sentence_index(text: str, encoded: str) -> SentenceIndex:
+    return decode_sentence_index(text, encoded)
+
+
+def sentence_index_for(doc: Union[str, Dict]) -> SentenceIndex:
+    """Sentence index of a document: decoded from metadata when ingested with one, else cached per text."""
+    if isinstance(doc, dict):
+        text = doc.get("text", "") or ""
+        encoded = doc.get("sentence_index")
+        if encoded:
+            try:
+                return _decoded_sentence_index(text, encoded)
+            except ValueError:
+                pass
+        return _cached_sentence_index(text)
+    return _cached_sentence_index(doc if isinstance(doc, str) else str(doc))
+
+
+def _concat(indexes: List[SentenceIndex]) -> SentenceIndex:
+    if len(indexes) == 1:
+        return indexes[0]
+    offsets = np.cumsum([0] + [len(ix.term_ids) for ix in indexes[:-1]])
+    row_offsets = np.cumsum([0] + [len(ix.sentences) for ix in indexes[:-1]])
+    return SentenceIndex(
+        [s for ix in indexes for s in ix.sentences],
+        np.concatenate([[0]] + [ix.indptr[1:] + off for ix, off in zip(indexes, offsets)]).astype(np.int64),
+        np.concatenate([ix.term_ids for ix in indexes]),
+        np.concatenate([ix.term_counts for ix in indexes]),
+        np.concatenate([ix.rows + off for ix, off in zip(indexes, row_offsets)]),
+    )
+
+
+def score_sentences(index: SentenceIndex, query: str, weighting: Optional[str] = None) -> np.ndarray:
+    """
+    Score every sentence against the query in one vectorised pass.
+    weighting=None counts shared distinct words (the original heuristic);
+    "tfidf" and "bm25" weight shared words by rarity across the given sentences.
+    """
+    n = len(index.sentences)
+    qids, _ = token_ids(query)
+    if not n or not len(qids) or not len(index.term_ids):
+        return np.zeros(n)
+    # qids is sorted and unique, so membership is a binary search per term.
+    pos = np.searchsorted(qids, index.term_ids)
+    hit = qids[np.minimum(pos, len(qids) - 1)] == index.term_ids
+    if weighting is None:
+        return np.bincount(index.rows[hit], minlength=n).astype(np.float64)
+
+    terms = index.term_ids[hit]
+    rows = index.rows[hit]
+    tf = index.term_counts[hit].astype(np.float64)
+    _, inverse, df = np.unique(terms, return_inverse=True, return_counts=True)
+    if weighting == "tfidf":
+        # scikit-learn's smoothed idf; log-scaled tf keeps long sentences in check.
+        idf = np.log((1 + n) / (1 + df)) + 1
+        weights = (1 + np.log(tf)) * idf[inverse]
+    elif weighting == "bm25":
+        idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+        lengths = index.lengths.astype(np.float64)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[rows] / max(lengths.mean(), 1e-9))
+        weights = idf[inverse] * tf * (BM25_K1 + 1) / (tf + norm)
+    else:
+        raise ValueError(f"Unknown weighting: {weighting}")
+    return np.bincount(rows, weights=weights, minlength=n)
+
+
+def ranked_sentences(
+    texts: Union[str, Dict, List[Union[str, Dict]]],
+    query: str,
+    k: int = 2,
+    weighting: Optional[str] = None,
+) -> List[Tuple[float, str]]:
+    """(score, sentence) pairs behind best_sentences_for_query, best first."""
+
+    # 🔹 Normalize texts → one sentence index per document
+    if not isinstance(texts, list):
+        texts = [texts if isinstance(texts, (str, dict)) else str(texts)]
+    docs = [t for t in texts if isinstance(t, (str, dict))]
 
     # 🔹 Ensure query is a string
     if not isinstance(query, str):
         query = str(query)
 
-    # 1) Split into sentences
-    sents = simple_tokenize_sentences(texts)
+    index = _concat([sentence_index_for(d) for d in docs]) if docs else None
+    if index is None or not index.sentences:
+        return []
 
-    # 2) Tokenize query
-    qtok = set(re.findall(r"\w+", query.lower()))
+    scores = score_sentences(index, query, weighting)
+    order = np.argsort(-scores, kind="stable")
+    if len(docs) == 1:
+        return [(float(scores[i]), index.sentences[i]) for i in order[:k]]
+    # Overlapping passages of one document repeat sentences; return each once.
+    best, seen = [], set()
+    for i in order:
+        if index.sentences[i] not in seen:
+            seen.add(index.sentences[i])
+            best.append((float(scores[i]), index.sentences[i]))
+            if len(best) == k:
+                break
+    return best
 
-    scored: List[tuple[int, str]] = []
-    for s in sents:
-        stok = set(re.findall(r"\w+", s.lower()))
-        score = len(qtok & stok)
-        scored.append((score, s))
 
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return [s for score, s in scored[:k]] if scored else sents[:k]
+@traced("extract")
+def best_sentences_for_query(
+    texts: Union[str, Dict, List[Union[str, Dict]]],
+    query: str,
+    k: int = 2,
+    weighting: Optional[str] = None,
+) -> List[str]:
+    """
+    Robust version:
+    - `texts` can be a single string OR list of strings (multiple docs); retrieved
+      doc dicts are accepted too and use the sentence index stored at ingest time
+    - `query` must be a string
+    - returns top-k sentences that overlap most with query words
+      (optionally weighted with weighting="tfidf" or "bm25")
+    """
+    return [sentence for _, sentence in ranked_sentences(texts, query, k, weighting)]